@@ -0,0 +1,78 @@
+"""
+Latência da inicialização a frio até a primeira assinatura no pool de processos.
+
+Para cada modo (processos só com as bibliotecas importadas e processos aquecidos com
+uma assinatura de um documento em branco, config.CPU_POOL_WARM_UP) cria um pool novo
+e mede a inicialização do pool, a primeira e a segunda assinatura e o total desde a
+inicialização até a primeira assinatura. Mede também, em um processo novo, o custo das
+importações que o primeiro pedido pagava quando os controladores e as bibliotecas de
+assinatura eram importados dentro dos endpoints.
+
+Os tempos da inicialização do servidor (importações, conexão com o MongoDB, pool de processos
+e serviços) e da primeira assinatura de cada processo do servidor são publicados em
+/metrics, em "startup".
+
+Executar a partir da pasta app:
+    python -m benchmarks.bench_cold_start [repetições]
+"""
+import asyncio
+import subprocess
+import sys
+import time
+from statistics import median
+
+from models.signer import Signer
+from services.key_and_certificate_services import generate_key_and_certificate
+from services.signer_services import sign_pdf
+from utils.process_pool import CpuExecutor
+
+
+async def cold_start(signer: Signer, document: bytes, warm_up: bool) -> dict:
+    executor = CpuExecutor(max_workers=1, queue_depth=0, warm_up=warm_up)
+    started = time.perf_counter()
+    await executor.start()
+    ready = time.perf_counter()
+    await executor.run(sign_pdf, document, signer, None, "Bragança")
+    first = time.perf_counter()
+    await executor.run(sign_pdf, document, signer, None, "Bragança")
+    second = time.perf_counter()
+    executor.shutdown()
+    return {
+        "inicialização do pool": (ready - started) * 1000,
+        "primeira assinatura": (first - ready) * 1000,
+        "segunda assinatura": (second - first) * 1000,
+        "inicialização até a 1.ª assinatura": (first - started) * 1000,
+    }
+
+
+IMPORTS = """
+import time
+started = time.perf_counter()
+import controllers.document_controller, controllers.key_and_certificate_controller
+import services.signer_services
+print((time.perf_counter() - started) * 1000)
+"""
+
+
+def import_cost() -> float:
+    result = subprocess.run([sys.executable, "-c", IMPORTS], capture_output=True, text=True, check=True)
+    return float(result.stdout.split()[-1])
+
+
+async def main(repetitions: int = 3):
+    private_key, public_key, certificate = generate_key_and_certificate("Benchmark")
+    signer = Signer("Benchmark", "benchmark@ipb.pt", private_key, public_key, certificate)
+    with open("static/pdf.pdf", "rb") as f:
+        document = f.read()
+
+    imports = median(import_cost() for _ in range(repetitions))
+    print(f"importações no primeiro pedido (antes)  mediana {imports:9.1f} ms")
+    for warm_up in (False, True):
+        runs = [await cold_start(signer, document, warm_up) for _ in range(repetitions)]
+        print("processos aquecidos" if warm_up else "processos só com importações")
+        for label in runs[0]:
+            print(f"  {label:<32} mediana {median(run[label] for run in runs):9.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 3))
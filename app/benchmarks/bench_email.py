@@ -0,0 +1,76 @@
+"""
+Vazão do envio de e-mails: o caminho antigo (uma conexão SMTP nova por envio, com
+login e QUIT, executada de forma síncrona dentro do handler e por isso um envio de
+cada vez por processo) contra o pool de sessões SMTP (services.smtp_pool), com os
+envios feitos simultaneamente.
+
+Usa o servidor SMTP de teste (benchmarks.smtp_server) em uma thread, com latency
+segundos de atraso em cada resposta para simular a latência da rede. O servidor de
+teste não suporta STARTTLS, por isso os dois caminhos são medidos sem TLS (com TLS a
+diferença seria maior, já que o caminho antigo negoceia o TLS em cada envio).
+
+Executar a partir da pasta app:
+    python -m benchmarks.bench_email [envios] [latência em segundos]
+"""
+import asyncio
+import smtplib
+import sys
+import time
+
+from benchmarks.smtp_server import StandInSmtpServer
+from services.email_services import build_message
+from services.smtp_pool import SmtpPool
+
+SENDER = "benchmark@ipb.pt"
+RECIPIENTS = ["destinatario@ipb.pt"]
+
+
+def message():
+    return build_message(SENDER, "Benchmark", RECIPIENTS, "Documento assinado", "Segue em anexo.", "doc.pdf", b"%PDF-1.7" * 2048)
+
+
+def legacy_send(host: str, port: int):
+    server = smtplib.SMTP(host, port)
+    server.login("benchmark", "password")
+    server.sendmail(SENDER, RECIPIENTS, message().as_string())
+    server.quit()
+
+
+async def pooled_sends(host: str, port: int, sends: int) -> tuple[SmtpPool, float]:
+    pool = SmtpPool(host, port, "benchmark", "password", starttls=False)
+    pool.start()
+    started = time.perf_counter()
+    await asyncio.gather(*[pool.send(message(), SENDER, RECIPIENTS) for _ in range(sends)])
+    elapsed = time.perf_counter() - started
+    await pool.stop()
+    return pool, elapsed
+
+
+def report(label: str, sends: int, elapsed: float, connections: int):
+    print(
+        f"{label:<24} {elapsed:8.2f} s   {sends / elapsed:8.1f} envios/s   {connections:5d} conexões"
+    )
+
+
+def main(sends: int = 1000, latency: float = 0.002):
+    server = StandInSmtpServer(latency=latency)
+    server.start_in_thread()
+    try:
+        started = time.perf_counter()
+        for _ in range(sends):
+            legacy_send(server.host, server.port)
+        report("conexão por envio", sends, time.perf_counter() - started, server.connections)
+
+        connections = server.connections
+        pool, elapsed = asyncio.run(pooled_sends(server.host, server.port, sends))
+        report(f"pool ({pool.max_sessions} sessões)", sends, elapsed, server.connections - connections)
+    finally:
+        server.stop_thread()
+    print(f"mensagens recebidas: {len(server.messages)}")
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 1000,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 0.002,
+    )
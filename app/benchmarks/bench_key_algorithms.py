@@ -0,0 +1,68 @@
+"""
+Benchmark dos algoritmos de chave suportados (ver KEY_ALGORITHMS).
+
+Para cada algoritmo mede o tempo de geração da chave e do certificado, o número de
+assinaturas e de validações de PDF por segundo (em um único processo) e o tamanho do
+certificado e do CMS embutido no documento.
+
+Executar a partir da pasta app:
+    python -m benchmarks.bench_key_algorithms [iterações]
+"""
+import sys
+import time
+from statistics import mean
+
+from models.signer import Signer
+from services.key_and_certificate_services import (
+    KEY_ALGORITHMS,
+    generate_key_and_certificate,
+)
+from services.signer_services import sign_pdf, verify_document
+from utils.crypto_utils import certificate_to_der
+from utils.pdf_utils import find_signatures
+
+
+def measure(fn, iterations: int) -> list[float]:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main(iterations: int = 20):
+    with open("static/pdf.pdf", "rb") as f:
+        document = f.read()
+
+    print(
+        f"{'algoritmo':<12} {'chave+cert':>12} {'assinaturas/s':>14} "
+        f"{'validações/s':>13} {'certificado':>12} {'CMS':>8}"
+    )
+    for algorithm in KEY_ALGORITHMS:
+        keygen = measure(
+            lambda: generate_key_and_certificate("Benchmark", key_algorithm=algorithm),
+            max(1, iterations // 4),
+        )
+        private_key, public_key, certificate = generate_key_and_certificate(
+            "Benchmark", key_algorithm=algorithm
+        )
+        signer = Signer("Benchmark", "benchmark@ipb.pt", private_key, public_key, certificate)
+        trusted = [
+            {"user_id": "", "name": "Benchmark", "email": signer.email, "certificate": certificate}
+        ]
+
+        signed = sign_pdf(document, signer, None, "Bragança")
+        sign_samples = measure(lambda: sign_pdf(document, signer, None, "Bragança"), iterations)
+        verify_samples = measure(lambda: verify_document(signed, trusted), iterations)
+        cms_size = len(find_signatures(signed)[-1].contents.rstrip(b"\x00"))
+
+        print(
+            f"{algorithm:<12} {mean(keygen) * 1000:9.1f} ms {1 / mean(sign_samples):14.1f} "
+            f"{1 / mean(verify_samples):13.1f} {len(certificate_to_der(certificate)):10d} B "
+            f"{cms_size:6d} B"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
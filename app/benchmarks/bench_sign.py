@@ -0,0 +1,113 @@
+"""
+Microbenchmark do custo por assinatura de sign_pdf.
+
+Compara o caminho antigo (PEM -> PKCS12 -> objetos, certificado interpretado em cada
+assinatura) com o caminho atual (chave e certificado passados diretamente ao endesive,
+certificado obtido do cache), tanto no carregamento da chave e do certificado como na
+assinatura completa.
+
+Executar a partir da pasta app:
+    python -m benchmarks.bench_sign [iterações]
+"""
+import sys
+import time
+from datetime import datetime
+from statistics import mean, median
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.serialization import pkcs12
+from cryptography.x509 import load_pem_x509_certificate
+from endesive import pdf
+
+from models.signer import Signer
+from services.key_and_certificate_services import generate_key_and_certificate
+from services.signer_services import sign_pdf
+from utils.crypto_utils import load_certificate
+
+
+def legacy_load(signer: Signer):
+    private_key = serialization.load_pem_private_key(
+        signer.private_key, password=None, backend=default_backend()
+    )
+    certificate = load_pem_x509_certificate(signer.certificate, backend=default_backend())
+    pfx_data = pkcs12.serialize_key_and_certificates(
+        name=signer.name.encode(),
+        key=private_key,
+        cert=certificate,
+        cas=None,
+        encryption_algorithm=serialization.NoEncryption(),
+    )
+    return pkcs12.load_key_and_certificates(pfx_data, None, default_backend())
+
+
+def legacy_sign_pdf(document: bytes, signer: Signer, reason: str | None, location: str | None) -> bytes:
+    """
+    sign_pdf antes da otimização: o mesmo dicionário de assinatura, com a chave e o
+    certificado carregados por legacy_load em cada assinatura.
+    """
+    dct = {
+        "aligned": 0,
+        "sigflags": 3,
+        "sigflagsft": 132,
+        "sigpage": 0,
+        "sigbutton": True,
+        "sigfield": "Signature1",
+        "auto_sigfield": True,
+        "sigandcertify": True,
+        "location": location,
+        "reason": reason or f"Documento assinado por {signer.name}",
+        "contact": signer.email,
+        "signingdate": datetime.now().strftime("D:%Y%m%d%H%M%S+00'00'"),
+        "type": "CERTIFICATION",
+    }
+    key, cert, others = legacy_load(signer)
+    datas = pdf.cms.sign(
+        datau=document,
+        udct=dct,
+        key=key,
+        cert=cert,
+        othercerts=others,
+        algomd="sha256",
+        timestampurl=None,
+    )
+    return document + datas
+
+
+def current_load(signer: Signer):
+    private_key = serialization.load_pem_private_key(
+        signer.private_key, password=None, backend=default_backend()
+    )
+    return private_key, load_certificate(signer.certificate), []
+
+
+def measure(fn, iterations: int) -> list[float]:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(label: str, samples: list[float]):
+    print(f"{label:<32} média {mean(samples):8.3f} ms   mediana {median(samples):8.3f} ms")
+
+
+def main(iterations: int = 50):
+    private_key, public_key, certificate = generate_key_and_certificate("Benchmark")
+    signer = Signer("Benchmark", "benchmark@ipb.pt", private_key, public_key, certificate)
+    with open("static/pdf.pdf", "rb") as f:
+        document = f.read()
+
+    report("carregamento (antes)", measure(lambda: legacy_load(signer), iterations))
+    report("carregamento (depois)", measure(lambda: current_load(signer), iterations))
+    before = measure(lambda: legacy_sign_pdf(document, signer, None, "Bragança"), iterations)
+    after = measure(lambda: sign_pdf(document, signer, None, "Bragança"), iterations)
+    report("sign_pdf completo (antes)", before)
+    report("sign_pdf completo (depois)", after)
+    print(f"{'ganho por assinatura':<32} {median(before) - median(after):8.3f} ms ({median(before) / median(after):.2f}x)")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
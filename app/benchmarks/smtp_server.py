@@ -0,0 +1,129 @@
+"""
+Servidor SMTP mínimo, para testar o envio de e-mails (services.smtp_pool) sem um
+servidor real. Aceita qualquer autenticação (AUTH PLAIN) e guarda as mensagens em
+memória. latency atrasa cada resposta (simula a latência da rede) e idle_timeout
+fecha, com 421, as conexões inativas, como fazem os servidores reais. Com
+drop_after_data, as drop_after_data mensagens seguintes são guardadas mas a conexão
+é fechada sem a resposta ao DATA (a resposta perdida na rede). Não suporta STARTTLS:
+a aplicação deve usar SMTP_STARTTLS=false.
+
+Executar a partir da pasta app (e usar SMTP_SERVER=127.0.0.1 e SMTP_PORT=8025):
+    python -m benchmarks.smtp_server [porta]
+"""
+import asyncio
+import sys
+import threading
+
+
+class StandInSmtpServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0, idle_timeout: float | None = None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.idle_timeout = idle_timeout
+        self.messages: list[tuple[str, list[str], bytes]] = []
+        self.connections = 0
+        self.drop_after_data = 0
+        self._server: asyncio.AbstractServer | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    def start_in_thread(self):
+        """
+        Executa o servidor em uma thread com o seu próprio event loop, para poder ser
+        usado por clientes síncronos (smtplib) sem os bloquear.
+        """
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.start())
+            ready.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self.stop())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        ready.wait()
+
+    def stop_thread(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+    async def _reply(self, writer: asyncio.StreamWriter, reply: str):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        writer.write(reply.encode() + b"\r\n")
+        await writer.drain()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        sender, recipients = None, []
+        try:
+            await self._reply(writer, "220 stand-in ESMTP")
+            while True:
+                try:
+                    line = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    await self._reply(writer, "421 4.4.2 Idle timeout")
+                    break
+                if not line:
+                    break
+                command = line.decode(errors="replace").strip()
+                verb = command[:4].upper()
+                if verb == "EHLO":
+                    await self._reply(writer, "250-stand-in\r\n250-AUTH PLAIN\r\n250 8BITMIME")
+                elif verb == "HELO":
+                    await self._reply(writer, "250 stand-in")
+                elif verb == "AUTH":
+                    await self._reply(writer, "235 2.7.0 Authentication successful")
+                elif verb == "MAIL":
+                    sender, recipients = command[10:].strip("<> "), []
+                    await self._reply(writer, "250 2.1.0 OK")
+                elif verb == "RCPT":
+                    recipients.append(command[8:].strip("<> "))
+                    await self._reply(writer, "250 2.1.5 OK")
+                elif verb == "DATA":
+                    await self._reply(writer, "354 End data with <CR><LF>.<CR><LF>")
+                    data = bytearray()
+                    while True:
+                        chunk = await reader.readline()
+                        if chunk in (b".\r\n", b""):
+                            break
+                        data += chunk
+                    self.messages.append((sender, recipients, bytes(data)))
+                    if self.drop_after_data:
+                        self.drop_after_data -= 1
+                        break
+                    await self._reply(writer, "250 2.0.0 Queued")
+                elif verb in ("RSET", "NOOP"):
+                    await self._reply(writer, "250 2.0.0 OK")
+                elif verb == "QUIT":
+                    await self._reply(writer, "221 2.0.0 Bye")
+                    break
+                else:
+                    await self._reply(writer, "502 5.5.2 Command not recognized")
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+async def main(port: int = 8025):
+    server = StandInSmtpServer(port=port)
+    await server.start()
+    print(f"Servidor SMTP de teste em {server.host}:{server.port}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 8025))
@@ -12,4 +12,166 @@ DATABASE_NAME = "digital_signature_db"
 
 # Verificar se a URI foi carregada corretamente
 if MONGODB_URI is None:
-    raise ValueError("A URI do MongoDB não foi definida no arquivo .env.")
\ No newline at end of file
+    raise ValueError("A URI do MongoDB não foi definida no arquivo .env.")
+
+# Pool de conexões do cliente MongoDB (Motor), criado na inicialização da aplicação: número
+# mínimo de conexões mantidas abertas e máximo de conexões, tempo (em milissegundos)
+# após o qual uma conexão inativa é fechada e tempos máximos de espera por uma conexão
+# livre do pool, pelo estabelecimento de uma conexão e pela seleção do servidor
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 10))
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 100))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 300000))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 10000))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 5000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 10000))
+
+# Tempo máximo (em segundos) que o encerramento da aplicação espera pelas assinaturas
+# e validações ainda em curso no pool de processos
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", 30))
+
+# Pool de processos para operações pesadas de CPU (assinatura e validação de PDFs)
+# Número de processos no pool (por padrão, um por núcleo)
+CPU_POOL_SIZE = int(os.getenv("CPU_POOL_SIZE", os.cpu_count() or 1))
+
+# Número máximo de tarefas em espera além das que já estão sendo executadas.
+# Quando o limite é atingido os novos pedidos são recusados com 503.
+CPU_POOL_QUEUE_DEPTH = int(os.getenv("CPU_POOL_QUEUE_DEPTH", 32))
+
+# Tempo máximo (em segundos) que um pedido espera pelo resultado de uma tarefa
+CPU_TASK_TIMEOUT = float(os.getenv("CPU_TASK_TIMEOUT", 60))
+
+# Método de criação dos processos ("spawn", "fork" ou "forkserver")
+CPU_POOL_START_METHOD = os.getenv("CPU_POOL_START_METHOD", "spawn")
+
+# Aquecimento de cada processo do pool na inicialização: assina e valida um documento em
+# branco, para que o primeiro pedido não pague a inicialização do código de assinatura
+CPU_POOL_WARM_UP = os.getenv("CPU_POOL_WARM_UP", "true").lower() in ("1", "true", "yes")
+
+# Hash das passwords (scrypt) em um pool de threads separado do event loop: número de
+# threads, número máximo de hashes em espera (acima do qual o login responde 503) e
+# parâmetros do scrypt (custo N, tamanho do bloco r e paralelização p)
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", min(4, os.cpu_count() or 1)))
+PASSWORD_HASH_QUEUE_DEPTH = int(os.getenv("PASSWORD_HASH_QUEUE_DEPTH", 64))
+PASSWORD_SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", 2**14))
+PASSWORD_SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", 8))
+PASSWORD_SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", 1))
+
+# Cache de certificados já carregados (por processo)
+CERT_CACHE_SIZE = int(os.getenv("CERT_CACHE_SIZE", 1024))
+CERT_CACHE_TTL = float(os.getenv("CERT_CACHE_TTL", 3600))
+
+# Carregamento dos usuários por id (services.user_loader): cache em memória (por
+# processo) com TTL curto, janela (em segundos) em que os pedidos de vários
+# usuários são juntos em uma única consulta e número máximo de ids por consulta
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 5))
+USER_LOADER_BATCH_WINDOW = float(os.getenv("USER_LOADER_BATCH_WINDOW", 0.002))
+USER_LOADER_MAX_BATCH = int(os.getenv("USER_LOADER_MAX_BATCH", 100))
+
+# Número de documentos assinados por tarefa do pool no endpoint de assinatura em lote
+# (a chave privada é carregada uma vez por tarefa)
+BATCH_SIGN_CHUNK_SIZE = int(os.getenv("BATCH_SIGN_CHUNK_SIZE", 4))
+
+# Upload de documentos: tamanho máximo aceito (em bytes), tamanho dos blocos em que
+# os documentos assinados são enviados na resposta e diretório dos arquivos
+# temporários (por padrão o do sistema)
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", 200 * 1024 * 1024))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+UPLOAD_TMP_DIR = os.getenv("UPLOAD_TMP_DIR") or None
+
+# Trust store (certificados dos usuários mantidos em memória)
+# Intervalo (em segundos) entre consultas de novos certificados quando o MongoDB
+# não suporta change streams (servidor standalone) e intervalo entre recargas completas
+TRUST_STORE_POLL_INTERVAL = float(os.getenv("TRUST_STORE_POLL_INTERVAL", 30))
+TRUST_STORE_FULL_RELOAD_INTERVAL = float(os.getenv("TRUST_STORE_FULL_RELOAD_INTERVAL", 600))
+
+# Cache dos resultados de validação, indexado pelo SHA-256 do documento e pela geração
+# do trust store. VERIFY_CACHE_MONGO ativa um segundo nível compartilhado entre processos
+# na coleção verification_cache.
+VERIFY_CACHE_SIZE = int(os.getenv("VERIFY_CACHE_SIZE", 4096))
+VERIFY_CACHE_TTL = float(os.getenv("VERIFY_CACHE_TTL", 3600))
+VERIFY_CACHE_MONGO = os.getenv("VERIFY_CACHE_MONGO", "false").lower() in ("1", "true", "yes")
+
+# Registro dos documentos assinados (coleção signed_documents): número máximo de
+# registros por inserção e intervalo (em segundos) entre escritas
+REGISTRY_BATCH_SIZE = int(os.getenv("REGISTRY_BATCH_SIZE", 100))
+REGISTRY_FLUSH_INTERVAL = float(os.getenv("REGISTRY_FLUSH_INTERVAL", 1))
+
+# Pool de pares de chaves RSA gerados antecipadamente: número máximo de chaves
+# guardadas, nível abaixo do qual o pool volta a ser reabastecido, processos (de
+# baixa prioridade) que geram as chaves e chaves geradas por tarefa.
+# KEY_POOL_SIZE=0 desativa o pool.
+KEY_POOL_SIZE = int(os.getenv("KEY_POOL_SIZE", 32))
+KEY_POOL_LOW_WATER = int(os.getenv("KEY_POOL_LOW_WATER", 8))
+KEY_POOL_WORKERS = int(os.getenv("KEY_POOL_WORKERS", 1))
+KEY_POOL_BATCH = int(os.getenv("KEY_POOL_BATCH", 4))
+
+# Algoritmo das chaves geradas quando o pedido não indica nenhum
+# ("rsa-2048", "rsa-3072", "ecdsa-p256", "ecdsa-p384" ou "ed25519")
+KEY_ALGORITHM = os.getenv("KEY_ALGORITHM", "rsa-2048")
+
+# Validade (em dias) dos certificados dos usuários, contada a partir da emissão
+CERTIFICATE_VALIDITY_DAYS = int(os.getenv("CERTIFICATE_VALIDITY_DAYS", 365))
+
+# Provisionamento em lote de chaves e certificados (services.provisioning): número de
+# usuários por tarefa do pool de processos e por escrita no MongoDB, e número
+# máximo de usuários por job
+PROVISION_CHUNK_SIZE = int(os.getenv("PROVISION_CHUNK_SIZE", 16))
+PROVISION_MAX_USERS = int(os.getenv("PROVISION_MAX_USERS", 10000))
+
+# CA interna: com INTERNAL_CA os certificados dos usuários são emitidos por uma
+# CA intermediária (criada uma única vez e guardada na coleção certificate_authority) e a
+# validação confia apenas na raiz, em vez de em cada certificado autoassinado.
+# CA_KEY_PASSWORD, obrigatória com INTERNAL_CA, cifra a chave privada da CA
+# intermediária guardada. CA_KEY_ALGORITHM não pode ser "ed25519": a validação das
+# cadeias (cryptography, PolicyBuilder) não aceita certificados de CA Ed25519.
+INTERNAL_CA = os.getenv("INTERNAL_CA", "false").lower() in ("1", "true", "yes")
+CA_NAME = os.getenv("CA_NAME", "IPB Doc Sign")
+CA_KEY_ALGORITHM = os.getenv("CA_KEY_ALGORITHM", "ecdsa-p384")
+CA_ROOT_VALIDITY_DAYS = int(os.getenv("CA_ROOT_VALIDITY_DAYS", 3650))
+CA_INTERMEDIATE_VALIDITY_DAYS = int(os.getenv("CA_INTERMEDIATE_VALIDITY_DAYS", 1825))
+CA_KEY_PASSWORD = os.getenv("CA_KEY_PASSWORD") or None
+CA_KEY_ALGORITHMS = ("rsa-2048", "rsa-3072", "ecdsa-p256", "ecdsa-p384")
+
+if INTERNAL_CA and CA_KEY_ALGORITHM not in CA_KEY_ALGORITHMS:
+    raise ValueError(f"CA_KEY_ALGORITHM inválido: {CA_KEY_ALGORITHM} (use {', '.join(CA_KEY_ALGORITHMS)})")
+if INTERNAL_CA and CA_KEY_PASSWORD is None:
+    raise ValueError("A CA_KEY_PASSWORD não foi definida no arquivo .env (obrigatória com INTERNAL_CA).")
+
+# Revogação de certificados: intervalo (em segundos) entre CRLs da CA interna, que é
+# também o nextUpdate da CRL e das respostas OCSP e o intervalo com que cada processo
+# recarrega o conjunto de certificados revogados. CA_CRL_URL e CA_OCSP_URL, se
+# definidos, são incluídos nos certificados emitidos pela CA.
+CRL_UPDATE_INTERVAL = float(os.getenv("CRL_UPDATE_INTERVAL", 300))
+CA_CRL_URL = os.getenv("CA_CRL_URL") or None
+CA_OCSP_URL = os.getenv("CA_OCSP_URL") or None
+
+# Renovação automática dos certificados emitidos pela CA interna
+# (services.certificate_renewal): certificados que expiram nos próximos
+# RENEWAL_WINDOW_DAYS dias são renovados em blocos de RENEWAL_BATCH_SIZE, com
+# RENEWAL_BATCH_DELAY segundos entre blocos, a cada RENEWAL_INTERVAL segundos.
+# RENEWAL_ENABLED=false desativa a renovação.
+RENEWAL_ENABLED = os.getenv("RENEWAL_ENABLED", "true").lower() in ("1", "true", "yes")
+RENEWAL_INTERVAL = float(os.getenv("RENEWAL_INTERVAL", 3600))
+RENEWAL_WINDOW_DAYS = int(os.getenv("RENEWAL_WINDOW_DAYS", 30))
+RENEWAL_BATCH_SIZE = int(os.getenv("RENEWAL_BATCH_SIZE", 50))
+RENEWAL_BATCH_DELAY = float(os.getenv("RENEWAL_BATCH_DELAY", 1))
+# Um certificado renovado tem de ficar fora da janela de renovação
+if RENEWAL_ENABLED and CERTIFICATE_VALIDITY_DAYS <= RENEWAL_WINDOW_DAYS:
+    raise ValueError(
+        f"CERTIFICATE_VALIDITY_DAYS ({CERTIFICATE_VALIDITY_DAYS}) tem de ser maior que "
+        f"RENEWAL_WINDOW_DAYS ({RENEWAL_WINDOW_DAYS}) com RENEWAL_ENABLED."
+    )
+
+# Envio de e-mails (services.smtp_pool): servidor SMTP e credenciais, STARTTLS,
+# número máximo de sessões SMTP abertas simultaneamente por servidor, tempo (em segundos)
+# após o qual uma sessão inativa deixa de ser reutilizada (os servidores fecham as
+# conexões inativas ao fim de alguns minutos) e tempo limite das operações de rede
+SMTP_SERVER = os.getenv("SMTP_SERVER")
+SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
+SMTP_USER = os.getenv("SMTP_USER") or None
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD") or None
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() in ("1", "true", "yes")
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", 4))
+SMTP_IDLE_TIMEOUT = float(os.getenv("SMTP_IDLE_TIMEOUT", 60))
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", 30))
@@ -1,6 +1,7 @@
 from controllers.base_controller import BaseController
 from models.request_models import SignDocumentRequest
 from motor.motor_asyncio import AsyncIOMotorClient
+from utils.process_pool import cpu_executor, CpuPoolBusyError
 
 
 class DocumentController(BaseController):
@@ -8,79 +9,476 @@ class DocumentController(BaseController):
         self.db = db
 
     async def sign_document(self, request: SignDocumentRequest):
+        """
+        Assina o documento guardado em request.file_path. O documento assinado é escrito
+        em um novo arquivo temporário, cujo caminho é retornado em "signed_path";
+        quem chama é responsável por apagá-lo.
+        """
+        import os
+        import time
         from models.signer import Signer
-        from services.signer_services import sign_pdf
-        from bson.objectid import ObjectId
+        from services.certificate_authority import certificate_authority
+        from services.certificate_store import certificate_store
+        from services.document_registry import document_registry
+        from services.revocation import revocation
+        from services.signer_services import sign_pdf_file
+        from utils.crypto_utils import certificate_fingerprint
+        from utils.startup import startup_metrics
+        from utils.upload_utils import new_temp_path
+        from services.user_loader import user_loader
         from fastapi import HTTPException
 
-        user = await self.db.users.find_one(
-            {"_id": ObjectId(request.user_id)},
-            {"_id": 0, "name": 1, "email": 1, "certificate": 1},
-        )
+        started = time.perf_counter()
+        user = await user_loader.load(request.user_id)
         if not user:
             raise HTTPException(status_code=404, detail="Usuário não encontrado")
-        if not user.get("certificate"):
+        certificate = await certificate_store.current(user)
+        if not certificate:
             raise HTTPException(status_code=400, detail="Certificado não encontrado")
+        if await revocation.is_revoked(certificate):
+            raise HTTPException(status_code=400, detail="O certificado do usuário foi revogado")
         signer = Signer(
             name=user["name"],
             email=user["email"],
             private_key=request.private_key,
-            cert_pem=user["certificate"],
+            cert_pem=certificate,
+            chain=certificate_authority.chain_for(certificate),
         )
+        output_path = new_temp_path()
         try:
-            from utils.crypto_utils import create_hash
-
-            signed_document = sign_pdf(
-                request.file_content,
+            # A assinatura é executada no pool de processos para não bloquear o event loop
+            result = await cpu_executor.run(
+                sign_pdf_file,
+                request.file_path,
+                output_path,
                 signer,
                 request.reason,
                 request.location,
                 request.positions,
+                # Se o pedido desistir, o arquivo só é apagado depois de o processo
+                # terminar de o escrever
+                on_abandoned=lambda: _remove(output_path),
             )
-            signed_document_hash = create_hash(signed_document)
-            import base64
-
-            file_base_64 = base64.b64encode(signed_document).decode("utf-8")
+            filename = request.filename.replace(".pdf", "-signed.pdf")
+            # Registrado em segundo plano, sem atrasar a resposta
+            document_registry.record(
+                result["hash"],
+                request.user_id,
+                filename,
+                result["size"],
+                certificate_fingerprint(certificate),
+            )
+            startup_metrics.signed(started)
             return {
-                "signed_document": file_base_64,
-                "filename": request.filename.replace(".pdf", "-signed.pdf"),
-                "hash": signed_document_hash,
+                "signed_path": output_path,
+                "filename": filename,
+                "hash": result["hash"],
+                "size": result["size"],
             }
 
+        except CpuPoolBusyError as e:
+            os.unlink(output_path)
+            raise HTTPException(status_code=503, detail=str(e))
+        except TimeoutError:
+            raise HTTPException(
+                status_code=504, detail="Tempo limite excedido ao assinar o documento"
+            )
         except Exception as e:
+            os.unlink(output_path)
             raise HTTPException(status_code=500, detail=f"Erro ao assinar: {e}")
-    
-    async def verify_hash(self, file_content: bytes, hash: bytes):
+
+    async def sign_documents_batch(
+        self,
+        user_id: str,
+        private_key: bytes,
+        files: list,
+        reason: str,
+        location: str,
+        positions: list | None = None,
+    ):
+        """
+        Assina vários documentos com a mesma chave. O usuário é obtido uma única vez
+        e os documentos são divididos em grupos assinados em paralelo no pool de processos.
+        Retorna um gerador assíncrono que produz o resultado de cada documento à medida
+        que os grupos terminam; a falha de um documento é reportada sem interromper o lote.
+        """
+        import asyncio
+        from itertools import islice
+        from models.signer import Signer
+        from services.certificate_authority import certificate_authority
+        from services.certificate_store import certificate_store
+        from services.document_registry import document_registry
+        from services.revocation import revocation
+        from services.signer_services import sign_pdf_batch
+        from utils.crypto_utils import certificate_fingerprint
+        from services.user_loader import user_loader
+        from fastapi import HTTPException
+        from config import BATCH_SIGN_CHUNK_SIZE
+
+        user = await user_loader.load(user_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="Usuário não encontrado")
+        certificate = await certificate_store.current(user)
+        if not certificate:
+            raise HTTPException(status_code=400, detail="Certificado não encontrado")
+        if await revocation.is_revoked(certificate):
+            raise HTTPException(status_code=400, detail="O certificado do usuário foi revogado")
+        signer = Signer(
+            name=user["name"],
+            email=user["email"],
+            private_key=private_key,
+            cert_pem=certificate,
+            chain=certificate_authority.chain_for(certificate),
+        )
+
+        fingerprint = certificate_fingerprint(certificate)
+        size = max(1, BATCH_SIGN_CHUNK_SIZE)
+        chunks = iter([files[i : i + size] for i in range(0, len(files), size)])
+
+        async def sign_chunk(chunk):
+            # Os arquivos só são lidos quando o grupo é enviado para o pool
+            documents = [(file.filename, await file.read()) for file in chunk]
+            try:
+                return await cpu_executor.run(
+                    sign_pdf_batch, documents, signer, reason, location, positions
+                )
+            except CpuPoolBusyError as e:
+                error = str(e)
+            except TimeoutError:
+                error = "Tempo limite excedido ao assinar o documento"
+            except Exception as e:
+                error = f"Erro ao assinar: {e}"
+            return [
+                {"filename": filename, "status": "error", "error": error}
+                for filename, _ in documents
+            ]
+
+        async def results():
+            # Mantém no máximo um grupo por processo do pool em execução
+            pending = {
+                asyncio.create_task(sign_chunk(chunk))
+                for chunk in islice(chunks, cpu_executor.max_workers)
+            }
+            try:
+                while pending:
+                    done, pending = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for task in done:
+                        for result in task.result():
+                            if result["status"] == "ok":
+                                document_registry.record(
+                                    result["hash"],
+                                    user_id,
+                                    result["filename"],
+                                    result["size"],
+                                    fingerprint,
+                                )
+                            yield result
+                        chunk = next(chunks, None)
+                        if chunk:
+                            pending.add(asyncio.create_task(sign_chunk(chunk)))
+            finally:
+                # O cliente pode desconectar no meio do lote
+                for task in pending:
+                    task.cancel()
+
+        return results()
+
+    async def validate_documents_batch(
+        self,
+        files: list,
+        expected_hashes: dict | None = None,
+        hash_algorithm: str = "sha256",
+        report: bool = False,
+    ):
         """
-        Verifica se o hash do conteúdo do arquivo é igual ao hash fornecido.
+        Valida vários documentos. Cada documento é copiado para disco (calculando o hash
+        durante a cópia), comparado com o hash do manifesto (expected_hashes, por nome do
+        arquivo), se existir, e validado no pool de processos. Todos os documentos são
+        validados com a mesma cópia do trust store.
+        Retorna um gerador assíncrono que produz o resultado de cada documento à medida
+        que termina, os documentos do manifesto que não foram enviados e, no fim, um
+        resumo com as contagens e o tempo total.
         """
-        from utils.crypto_utils import create_hash
+        import asyncio
+        import os
+        import time
+        from itertools import islice
+        from services.trust_store import trust_store
+        from utils.crypto_utils import compare_hash
+        from utils.upload_utils import spool_upload
 
-        file_hash = create_hash(file_content)
+        started = time.perf_counter()
+        store = trust_store.snapshot()
+        expected_hashes = dict(expected_hashes or {})
+        pending_files = iter(files)
 
-        return file_hash.encode() == hash
+        async def validate(file):
+            result = {"filename": file.filename}
+            expected = expected_hashes.pop(file.filename, None)
+            if expected is None and file.filename:
+                # Pastas enviadas pelo browser incluem o caminho relativo no nome
+                expected = expected_hashes.pop(os.path.basename(file.filename), None)
+            try:
+                document = await spool_upload(file, hash_algorithm=hash_algorithm)
+            except Exception as e:
+                detail = getattr(e, "detail", None) or str(e)
+                return {**result, "status": "error", "validated": False, "error": detail}
+            try:
+                result["hash"] = document.hash
+                result["hash_ok"] = None if expected is None else compare_hash(document.hash, expected)
+                if result["hash_ok"] is False:
+                    return {**result, "status": "hash_mismatch", "validated": False}
+                res = await self.verify_document(document.path, document.sha256, report, store)
+                status = "validated" if res.get("validated") else "not_validated"
+                if res.get("error"):
+                    status = "error"
+                return {**result, "status": status, **res}
+            finally:
+                document.cleanup()
 
-    async def verify_document(self, file_content: bytes):
+        async def results():
+            counts = {"validated": 0, "not_validated": 0, "hash_mismatch": 0, "error": 0}
+            # Mantém o pool ocupado enquanto os documentos seguintes são copiados
+            window = max(1, cpu_executor.max_workers * 2)
+            pending = {
+                asyncio.create_task(validate(file))
+                for file in islice(pending_files, window)
+            }
+            try:
+                while pending:
+                    done, pending = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    for task in done:
+                        result = task.result()
+                        counts[result["status"]] += 1
+                        yield result
+                        file = next(pending_files, None)
+                        if file is not None:
+                            pending.add(asyncio.create_task(validate(file)))
+            finally:
+                for task in pending:
+                    task.cancel()
+
+            for filename in expected_hashes:
+                yield {"filename": filename, "status": "missing", "validated": False}
+            yield {
+                "summary": {
+                    "total": len(files),
+                    **counts,
+                    "missing": len(expected_hashes),
+                    "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+                }
+            }
+
+        return results()
+
+    async def verify_hash(self, file_hash: str, hash: bytes):
+        """
+        Verifica se o hash do conteúdo do arquivo, calculado durante o upload,
+        é igual ao hash fornecido. A comparação é feita em tempo constante.
         """
-        Essa função busca todos os usuários que possuem certificado e
-        verifica se o documento foi assinado por algum deles.
+        from utils.crypto_utils import compare_hash
+
+        return compare_hash(file_hash, hash)
+
+    async def verify_document(
+        self,
+        file_path: str,
+        sha256: str | None = None,
+        report: bool = False,
+        store=None,
+    ):
+        """
+        Verifica se o documento guardado em file_path foi assinado por um usuário
+        da aplicação. As assinaturas são lidas uma única vez e apenas os certificados do
+        trust store que correspondem ao signatário indicado no CMS de cada assinatura
+        (emissor e número de série ou Subject Key Identifier) são enviados para a
+        verificação, em vez de todos os certificados do banco de dados.
+        Com report=True é retornado também um relatório por assinatura (ver
+        _verify_report).
+        Se for dado o SHA-256 do documento, o resultado é guardado no cache de validação
+        e um documento já validado com os mesmos certificados (e as mesmas revogações)
+        não volta a ser lido.
+        store permite utilizar uma cópia do trust store (TrustStore.snapshot) em vez do
+        trust store global.
+        """
+        from services.trust_store import trust_store
+        from services.verification_cache import validation_generation, verification_cache
+
+        store = store or trust_store
+        verify = self._verify_report if report else self._verify_document
+        if sha256 is None:
+            res, _ = await verify(file_path, store)
+            return res
+
+        mode = "report" if report else "summary"
+        generation = validation_generation(store)
+        cached = await verification_cache.get(sha256, generation, mode)
+        if cached is not None:
+            return cached
+        res, cacheable = await verify(file_path, store)
+        if cacheable:
+            await verification_cache.set(sha256, generation, res, mode)
+        return res
+
+    async def _read_signatures(self, file_path: str, store):
+        """
+        Lê as assinaturas do documento e procura, nos índices do trust store, os
+        certificados dos signatários indicados no CMS de cada uma, por isso o custo não
+        depende do número de usuários. Os certificados emitidos pela CA interna não
+        são procurados: são validados pela cadeia até a raiz. Os signatários revogados
+        são obtidos do conjunto em memória de services.revocation.
+        Retorna (estado, assinaturas, certificados por assinatura, certificados
+        revogados) ou lança PdfSyntaxError / ValueError, ou os erros do pool de
+        processos (CpuPoolBusyError, TimeoutError). Arquivos que não são PDF
+        ou não têm assinaturas são detectados sem interpretar o documento (ver
+        services.signer_services.read_signatures) e não têm assinaturas.
         """
         import services.signer_services as s
+        from services.certificate_authority import certificate_authority
+        from services.revocation import revocation
+
+        # A interpretação do documento e dos CMS é feita no pool de processos
+        status, fields, field_identifiers = await cpu_executor.run(s.read_signatures, file_path)
+        candidates = []
+        revoked = {}
+        for identifiers in field_identifiers:
+            revoked.update(revocation.revoked_for(identifiers))
+            trusted_signers = {}
+            for identifier in identifiers:
+                if certificate_authority.issued_by(identifier["issuer"]):
+                    continue
+                for entry in store.find_signer(identifier):
+                    trusted_signers[entry.fingerprint] = entry.as_trusted_signer()
+            candidates.append(list(trusted_signers.values()))
+        return status, fields, candidates, revoked
+
+    async def _verify_document(self, file_path: str, store):
+        """
+        Retorna o resultado da validação e se este pode ser guardado no cache (os erros
+        do pool de processos, como estar ocupado ou o tempo limite, não dependem do
+        documento e não são guardados).
+        """
+        import services.signer_services as s
+        from services.certificate_authority import certificate_authority
+
         try:
-            cursor = self.db.users.find(
-                {"certificate": {"$exists": True}},
-                {"_id": 0, "certificate": 1, "email": 1},
+            status, fields, candidates, revoked = await self._read_signatures(file_path, store)
+        except ValueError as e:
+            return {"validated": False, "signatures": None, "error": str(e)}, True
+        except CpuPoolBusyError as e:
+            return {"validated": False, "error": str(e)}, False
+        except TimeoutError:
+            return {"validated": False, "error": "Tempo limite excedido ao validar o documento"}, False
+        if not fields:
+            return {"validated": False, "signatures": None, "signature_status": status.value}, True
+
+        trusted_signers = {}
+        for signers in candidates:
+            for signer in signers:
+                trusted_signers[signer["user_id"]] = signer
+
+        try:
+            res = await cpu_executor.run(
+                s.verify_document_file,
+                file_path,
+                list(trusted_signers.values()),
+                fields,
+                certificate_authority.anchors,
+                revoked,
             )
-            trusted_signers = await cursor.to_list(None)
+        except CpuPoolBusyError as e:
+            return {"validated": False, "error": str(e)}, False
+        except TimeoutError:
+            return {"validated": False, "error": "Tempo limite excedido ao validar o documento"}, False
         except Exception as e:
-            print("failed to get certificates")
             print(e)
-            return {"validated": False, "error": str(e)}
+            return {"validated": False, "error": str(e)}, False
+
+        return res, True
+
+    async def _verify_report(self, file_path: str, store):
+        """
+        Valida cada assinatura (revisão) do documento separadamente, em paralelo no pool
+        de processos, e retorna um relatório por revisão: intervalo de bytes, signatário,
+        data, estado do hash, da assinatura e do certificado e se o documento foi
+        alterado depois dela. O documento é validado se todas as assinaturas estiverem
+        intactas, a última for de um signatário confiável e não houver alterações por
+        assinar depois dela.
+        """
+        import asyncio
+        import os
+        import services.signer_services as s
+        from services.certificate_authority import certificate_authority
 
         try:
-            res = await s.verify_document(file_content, trusted_signers=trusted_signers)
-        except Exception as e:
-            print(e)
-            res = {"validated": False, "error": str(e)}
+            status, fields, candidates, revoked = await self._read_signatures(file_path, store)
+        except ValueError as e:
+            return {"validated": False, "signatures": None, "revisions": [], "error": str(e)}, True
+        except CpuPoolBusyError as e:
+            return {"validated": False, "revisions": [], "error": str(e)}, False
+        except TimeoutError:
+            return {
+                "validated": False,
+                "revisions": [],
+                "error": "Tempo limite excedido ao validar o documento",
+            }, False
+        if not fields:
+            return {
+                "validated": False,
+                "signatures": None,
+                "revisions": [],
+                "signature_status": status.value,
+            }, True
 
-        return res
+        results = await asyncio.gather(
+            *(
+                cpu_executor.run(
+                    s.verify_revision_file, file_path, field, signers, certificate_authority.anchors, revoked
+                )
+                for field, signers in zip(fields, candidates)
+            ),
+            return_exceptions=True,
+        )
+        changes = s.revision_changes(fields, os.path.getsize(file_path))
+
+        revisions = []
+        cacheable = True
+        for index, (result, change) in enumerate(zip(results, changes)):
+            if isinstance(result, BaseException):
+                cacheable = False
+                if isinstance(result, TimeoutError):
+                    error = "Tempo limite excedido ao validar o documento"
+                else:
+                    error = str(result)
+                result = {
+                    "byte_range": list(fields[index].byte_range),
+                    "signed_until": fields[index].signed_until,
+                    "validated": False,
+                    "error": error,
+                }
+            revisions.append({"revision": index + 1, **result, **change})
+
+        last = revisions[-1]
+        validated = (
+            all(revision.get("hash_ok") and revision.get("signature_ok") for revision in revisions)
+            and last["validated"]
+            and not last["unsigned_changes_after"]
+        )
+        return {
+            "validated": validated,
+            "signatures": last.get("signer") if validated else None,
+            "revisions": revisions,
+        }, cacheable
+
+
+def _remove(path: str):
+    import os
+
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
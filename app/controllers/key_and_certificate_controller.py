@@ -1,29 +1,73 @@
 from fastapi import HTTPException
 from motor.motor_asyncio import AsyncIOMotorClient
 from bson import ObjectId
+from datetime import datetime, timezone
 from controllers.base_controller import BaseController
-from models.request_models import  CertificateRequest, Request
+from services.trust_store import trust_store
+from services.certificate_store import certificate_store
+from services.user_loader import user_loader
+from services.certificate_authority import CA_ISSUER, certificate_authority
+from services.verification_cache import validation_generation, verification_cache
+from services.key_pool import key_pool
+from utils.crypto_utils import certificate_expiry, certificate_fingerprint
+from models.request_models import  CertificateRequest, KeyRequest, ProvisionRequest, Request, RevokeRequest
+
+
+async def _certificate_issued(user_id, name: str, email: str, certificate: bytes):
+    """
+    Guarda o certificado emitido na coleção certificates e atualiza o trust store e o
+    cache de validação. Os certificados da CA interna não entram no trust store: são
+    validados pela cadeia.
+    """
+    await certificate_store.record(user_id, certificate, _certificate_issuer())
+    # Depois de gravar o registro, que o user_loader carrega com o usuário
+    user_loader.invalidate(user_id)
+    if certificate_authority.active:
+        trust_store.remove_user(user_id)
+    else:
+        trust_store.add_certificate(user_id, name, email, certificate)
+    # Os resultados de validação calculados com o certificado anterior deixam de servir
+    await verification_cache.invalidate(validation_generation())
+
+
+def _certificate_issuer() -> str:
+    return CA_ISSUER if certificate_authority.active else "self_signed"
+
+
+def _key_algorithm(request: KeyRequest | ProvisionRequest) -> str:
+    from config import KEY_ALGORITHM
+    from services.key_and_certificate_services import KEY_ALGORITHMS
+
+    algorithm = request.key_algorithm or KEY_ALGORITHM
+    if algorithm not in KEY_ALGORITHMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Algoritmo de chave inválido. Utilize um de: {', '.join(KEY_ALGORITHMS)}",
+        )
+    return algorithm
 
 
 class KeyCertController(BaseController):
     def __init__(self, db: AsyncIOMotorClient):
         self.db = db
 
-    async def create_key_pair(self, request: Request):
+    async def create_key_pair(self, request: KeyRequest):
         from models.signer import Signer
-        from services.key_and_certificate_services import generate_key_pair
 
-        user = await self.db.users.find_one({"_id": ObjectId(request.user_id)})
+        algorithm = _key_algorithm(request)
+        user = await user_loader.load(request.user_id)
         if not user:
             raise HTTPException(status_code=404, detail="Usuário não encontrado")
-        signer = Signer(user["name"], user["email"])
-        private_key, public_key = generate_key_pair()
+        signer = Signer(user["name"], user["email"], key_algorithm=algorithm)
+        # O par de chaves vem do pool de chaves geradas antecipadamente
+        private_key, public_key = await key_pool.take_or_generate(algorithm)
         filename_private = f"{signer.email.replace('.','_').lower()}-private-key.pem"
         filename_public = f"{signer.email.replace('.','_').lower()}-public-key.pem"
         await self.db.users.update_one(
             {"_id": ObjectId(request.user_id)},
-            {"$set": {"public_key": public_key}},
+            {"$set": {"public_key": public_key, "key_algorithm": algorithm}},
         )
+        user_loader.invalidate(request.user_id)
         return {
             "private_key": private_key,
             "public_key": public_key,
@@ -42,11 +86,8 @@ class KeyCertController(BaseController):
         from fastapi import HTTPException
         from bson import ObjectId
 
-        # Busca o usuário no banco de dados e retorna apenas os campos name, email, private_key
-        user = await self.db.users.find_one(
-            {"_id": ObjectId(request.user_id)},
-            {"name": 1, "email": 1, "public_key": 1},
-        )
+        # Busca o usuário (ver services.user_loader)
+        user = await user_loader.load(request.user_id)
         if not user:
             # Se o usuário não for encontrado, retorna um erro 404
             raise HTTPException(status_code=404, detail="Usuário não encontrado")
@@ -58,11 +99,20 @@ class KeyCertController(BaseController):
 
         # Cria um objeto Signer com os dados do usuário
         signer = Signer(
-            user["name"], user["email"], request.private_key, user["public_key"]
+            user["name"], user["email"], request.private_key, user.get("public_key")
         )
         try:
-            # Gera o certificado no formato PEM
-            certificate = generate_certificate(signer)
+            # Gera o certificado no formato PEM (emitido pela CA interna, se estiver ativa)
+            if certificate_authority.active:
+                if not signer.public_key:
+                    raise HTTPException(status_code=400, detail="A Chave pública do usuário não foi encontrada")
+                certificate = certificate_authority.issue(
+                    signer.public_key, signer.name, signer.email, user["_id"]
+                )
+            else:
+                certificate = generate_certificate(signer)
+        except HTTPException:
+            raise
         except Exception as e:
             print(e.with_traceback)
             print(e.__cause__)
@@ -73,8 +123,17 @@ class KeyCertController(BaseController):
         # Se não houver erro, atualiza o usuário no banco de dados com o certificado gerado
         await self.db.users.update_one(
             {"_id": ObjectId(user["_id"])},
-            {"$set": {"certificate": certificate}},
+            {
+                "$set": {
+                    "certificate": certificate,
+                    "certificate_issuer": _certificate_issuer(),
+                    "certificate_updated_at": datetime.now(timezone.utc),
+                    "certificate_not_valid_after": certificate_expiry(certificate),
+                }
+            },
         )
+        # Os outros processos recebem o novo certificado pelo change stream (ou consulta periódica)
+        await _certificate_issued(user["_id"], user["name"], user["email"], certificate)
         filename = f"{signer.email.replace('.','_').lower()}-cert.pem"
 
         # Retorna o certificado gerado e o nome do arquivo
@@ -83,25 +142,31 @@ class KeyCertController(BaseController):
             "filename": filename,
         }
 
-    async def create_key_and_certificate(self, request: Request):
+    async def create_key_and_certificate(self, request: KeyRequest):
         """
-        Função que gera um par de chaves privada e pública RSA e um certificado autoassinado
-        para o usuário que fez a requisição. As chaves e o certificado são armazenados no banco
+        Função que gera um par de chaves privada e pública (RSA-2048 por padrão, ou o
+        algoritmo indicado em request.key_algorithm) e um certificado autoassinado (ou
+        emitido pela CA interna, se estiver ativa) para o usuário que fez a requisição. As chaves e o certificado são armazenados no banco
         de dados e o nome dos arquivos são retornados na resposta.
         """
         from services.key_and_certificate_services import generate_key_and_certificate
 
-        # Busca o usuário no banco de dados e retorna apenas os campos name, email
-        user = await self.db.users.find_one(
-            {"_id": ObjectId(request.user_id)}, {"_id": 0, "name": 1, "email": 1}
-        )
+        algorithm = _key_algorithm(request)
+
+        # Busca o usuário (ver services.user_loader)
+        user = await user_loader.load(request.user_id)
         if not user:
             # Se o usuário não for encontrado, retorna um erro 404
             raise HTTPException(status_code=404, detail="Usuário não encontrado")
 
         name = user["name"]
         email = user["email"]
-        private_key, public_key,certificate = generate_key_and_certificate(user_name=name)
+        key_pair = await key_pool.take_or_generate(algorithm)
+        if certificate_authority.active:
+            private_key, public_key = key_pair
+            certificate = certificate_authority.issue(public_key, name, email, request.user_id)
+        else:
+            private_key, public_key,certificate = generate_key_and_certificate(user_name=name, key_pair=key_pair)
         public_key_filename = f"{email.replace('.','_').lower()}-private-key.pem"
         private_key_filename = f"{email.replace('.','_').lower()}-public-key.pem"
         cert_filename = f"{email.replace('.','_').lower()}-key-cert.pem"
@@ -111,10 +176,15 @@ class KeyCertController(BaseController):
             {
                 "$set": {
                     "public_key": public_key,
+                    "key_algorithm": algorithm,
                     "certificate": certificate,
+                    "certificate_issuer": _certificate_issuer(),
+                    "certificate_updated_at": datetime.now(timezone.utc),
+                    "certificate_not_valid_after": certificate_expiry(certificate),
                 }
             },
         )
+        await _certificate_issued(request.user_id, name, email, certificate)
         return {
             "private_key": private_key,
             "public_key": public_key,
@@ -125,33 +195,142 @@ class KeyCertController(BaseController):
         }
 
     async def get_keys(self, user_id: str):
-        email = await self.db.users.find_one(
-            {"_id": ObjectId(user_id)}, {"email": 1, "_id": 0}
-        )
-        if not email:
+        user = await user_loader.load(user_id)
+        if not user:
             raise HTTPException(status_code=404, detail="Usuário não encontrado")
-        keys = await self.db.users.find_one(
-            {"_id": ObjectId(user_id)}, { "public_key":1,"_id": 0}
-        )
-        if not keys:
+        if not user.get("public_key"):
             return {"public_key":None, "public_key_filename": None,}
         return {
-            "public_key": keys["public_key"],
-            "public_key_filename": f"{email['email'].replace('.','_').lower()}-public-key.pem",
+            "public_key": user["public_key"],
+            "public_key_filename": f"{user['email'].replace('.','_').lower()}-public-key.pem",
         }
 
     async def get_certificate(self, request: Request):
-        email = await self.db.users.find_one(
-            {"_id": ObjectId(request.user_id)}, {"email": 1, "_id": 0}
-        )
-        if not email:
+        # Uma única consulta: o user_loader traz o certificado atual com o usuário
+        user = await user_loader.load(request.user_id)
+        if not user:
             raise HTTPException(status_code=404, detail="Usuário não encontrado")
-        certificate = await self.db.users.find_one(
-            {"_id": ObjectId(request.user_id)}, {"certificate": 1, "_id": 0}
-        )
+        certificate = await certificate_store.current(user)
         if not certificate:
             return {"certificate": None, "filename": None}
         return {
-            "certificate": certificate["certificate"],
-            "filename": f"{email['email'].replace('.','_').lower()}-cert.pem",
-        }
\ No newline at end of file
+            "certificate": certificate,
+            "filename": f"{user['email'].replace('.','_').lower()}-cert.pem",
+        }
+
+    async def find_certificate(self, fingerprint: str):
+        """
+        Procura um certificado emitido pela aplicação (atual, substituído ou revogado)
+        pela impressão digital SHA-256.
+        """
+        from services.certificate_store import public_record
+
+        record = await certificate_store.find(fingerprint)
+        if not record:
+            raise HTTPException(status_code=404, detail="Certificado não encontrado")
+        return public_record(record)
+
+    async def get_certificate_history(self, user_id: str):
+        """
+        Certificados emitidos para o usuário, do mais recente para o mais antigo.
+        """
+        from services.certificate_store import public_record
+
+        return [public_record(record) for record in await certificate_store.history(user_id)]
+
+    async def revoke_certificate(self, request: RevokeRequest):
+        """
+        Revoga o certificado atual do usuário (ex: chave privada comprometida). O
+        certificado é removido do usuário, que tem de emitir um novo para voltar a
+        assinar, e as assinaturas feitas com ele deixam de ser validadas.
+        """
+        from services.revocation import REVOCATION_REASONS, public_entry, revocation
+
+        reason = request.reason or "unspecified"
+        if reason not in REVOCATION_REASONS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Motivo de revogação inválido. Utilize um de: {', '.join(REVOCATION_REASONS)}",
+            )
+        # Lê o usuário e o certificado atual do banco de dados, não do cache
+        user_loader.invalidate(request.user_id)
+        user = await user_loader.load(request.user_id)
+        if not user:
+            raise HTTPException(status_code=404, detail="Usuário não encontrado")
+        certificate = await certificate_store.current(user)
+        if not certificate:
+            raise HTTPException(status_code=400, detail="O usuário não tem certificado")
+
+        entry = await revocation.revoke(certificate, user["_id"], reason)
+        if user.get("certificate") and certificate_fingerprint(user["certificate"]) == entry["fingerprint"]:
+            await self.db.users.update_one(
+                # Só remove o certificado revogado, não um emitido entretanto
+                {"_id": user["_id"], "certificate": user["certificate"]},
+                {
+                    "$unset": {"certificate": "", "certificate_issuer": "", "certificate_not_valid_after": ""},
+                    "$set": {"certificate_updated_at": datetime.now(timezone.utc)},
+                },
+            )
+        await certificate_store.mark_revoked(entry["fingerprint"], entry["reason"], entry["revoked_at"])
+        user_loader.invalidate(user["_id"])
+        trust_store.remove_user(user["_id"])
+        await verification_cache.invalidate(validation_generation())
+        return public_entry(entry)
+
+    async def provision_users(self, request: ProvisionRequest):
+        """
+        Cria (ou, com request.job_id, retoma) um job de provisionamento em lote e retorna
+        o job e um gerador assíncrono com o arquivo ZIP das chaves privadas emitidas,
+        produzido à medida que os blocos de usuários são gravados. O arquivo termina
+        com manifest.json, com o estado do job, os usuários provisionados neste
+        arquivo e, ao retomar um job, os provisionados por uma execução anterior, cujas
+        chaves não estão no arquivo (needs_rekey).
+        """
+        import json
+        from config import PROVISION_MAX_USERS
+        from services.provisioning import Provisioner, job_summary
+        from utils.zip_utils import ZipStream
+
+        provisioner = Provisioner(self.db)
+        if request.job_id:
+            job = await provisioner.get_job(request.job_id)
+            if not job:
+                raise HTTPException(status_code=404, detail="Job de provisionamento não encontrado")
+        else:
+            algorithm = _key_algorithm(request)
+            if not request.user_ids:
+                raise HTTPException(status_code=400, detail="A lista de usuários está vazia")
+            if len(request.user_ids) > PROVISION_MAX_USERS:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Número máximo de usuários por job: {PROVISION_MAX_USERS}",
+                )
+            invalid = [user_id for user_id in request.user_ids if not ObjectId.is_valid(user_id)]
+            if invalid:
+                raise HTTPException(status_code=400, detail=f"Ids de usuário inválidos: {', '.join(invalid[:10])}")
+            job = await provisioner.create_job(request.user_ids, algorithm)
+
+        async def archive():
+            archive = ZipStream()
+            issued = []
+            async for credentials in provisioner.run(job):
+                for credential in credentials:
+                    filename = f"{credential['email'].replace('.','_').lower()}-private-key.pem"
+                    issued.append(
+                        {"user_id": credential["user_id"], "email": credential["email"], "filename": filename}
+                    )
+                    yield archive.add(filename, credential["private_key"])
+            finished = await provisioner.get_job(str(job["_id"]))
+            manifest = {**job_summary(finished), "archive": issued, "needs_rekey": finished.get("needs_rekey", [])}
+            yield archive.add("manifest.json", json.dumps(manifest, indent=2).encode())
+            yield archive.close()
+
+        return job, archive()
+
+    async def get_provisioning_job(self, job_id: str):
+        from services.provisioning import Provisioner, job_summary
+
+        job = await Provisioner(self.db).get_job(job_id)
+        if not job:
+            raise HTTPException(status_code=404, detail="Job de provisionamento não encontrado")
+        return job_summary(job)
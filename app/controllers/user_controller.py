@@ -2,6 +2,33 @@ from controllers.base_controller import BaseController
 from motor.motor_asyncio import AsyncIOMotorClient
 from fastapi import HTTPException
 from models.request_models import UserRequest
+from utils.password_utils import password_hasher
+
+
+# Se o índice único de users.email existe; sem ele, o registro verifica antes se o
+# e-mail já está cadastrado
+_email_index_unique = False
+
+
+async def create_user_indexes(db):
+    """
+    Índice único em users.email, criado na inicialização: o login é uma consulta indexada e
+    o registro de dois usuários com o mesmo e-mail falha com DuplicateKeyError. Se o
+    banco de dados já tiver e-mails repetidos, é criado um índice não único e o registro
+    continua verificando o e-mail antes de inserir, até os repetidos serem corrigidos
+    e o servidor reiniciado.
+    """
+    from pymongo.errors import OperationFailure
+
+    global _email_index_unique
+    try:
+        await db.users.create_index("email", unique=True, name="email_unique")
+        _email_index_unique = True
+    except OperationFailure as e:
+        print(f"Não foi possível criar o índice único de users.email (e-mails repetidos?): {e}")
+        await db.users.create_index("email", name="email")
+        _email_index_unique = False
+
 
 class UserController(BaseController):
     db: AsyncIOMotorClient = None
@@ -9,15 +36,35 @@ class UserController(BaseController):
         self.db = db
     
     async def register(self, userReq: UserRequest):
-        user = await self.db.users.find_one({"email": userReq.email})
-        if user:
+        from pymongo.errors import DuplicateKeyError
+
+        if not _email_index_unique and await self.db.users.find_one({"email": userReq.email}, {"_id": 1}):
+            raise HTTPException(status_code=400, detail="Usuário já cadastrado")
+        user = userReq.model_dump()
+        # A password é guardada com hash (scrypt), calculado fora do event loop
+        user["password"] = await password_hasher.hash(userReq.password)
+        try:
+            # O índice único de email rejeita registros repetidos, mesmo concorrentes
+            result = await self.db.users.insert_one(user)
+        except DuplicateKeyError:
             raise HTTPException(status_code=400, detail="Usuário já cadastrado")
-        user = await self.db.users.insert_one(userReq.model_dump())
-        return {"uid": str(user.inserted_id)}
+        return {"uid": str(result.inserted_id)}
     
     async def login(self, userReq: UserRequest):
-        user = await self.db.users.find_one({"email": userReq.email, "password": userReq.password},
-                                            {"_id": 1, "name": 1})
-        if not user:
+        from services.user_loader import user_loader
+
+        user = await self.db.users.find_one({"email": userReq.email},
+                                            {"_id": 1, "name": 1, "password": 1})
+        if not user or not user.get("password"):
+            raise HTTPException(status_code=404, detail="Usuário não encontrado")
+        valid, needs_rehash = await password_hasher.verify(userReq.password, user["password"])
+        if not valid:
             raise HTTPException(status_code=404, detail="Usuário não encontrado")
-        return {"uid": str(user["_id"]),"name": user["name"]}
\ No newline at end of file
+        if needs_rehash:
+            # Passwords antigas, guardadas em claro, passam a ter hash no primeiro login
+            await self.db.users.update_one(
+                {"_id": user["_id"], "password": user["password"]},
+                {"$set": {"password": await password_hasher.hash(userReq.password)}},
+            )
+            user_loader.invalidate(user["_id"])
+        return {"uid": str(user["_id"]),"name": user["name"]}
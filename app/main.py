@@ -1,33 +1,151 @@
+# Importado primeiro: os tempos da inicialização (utils.startup) são contados a partir daqui
+from utils.startup import startup_metrics
 # from typing import Annotated
-from fastapi import FastAPI, HTTPException, File, UploadFile, Form
+from fastapi import Depends, FastAPI, HTTPException, File, UploadFile, Form, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+from starlette.requests import Request as HttpRequest
 from typing import Optional
-from motor.motor_asyncio import AsyncIOMotorClient
-from config import MONGODB_URI, DATABASE_NAME
+from config import DATABASE_NAME, SHUTDOWN_DRAIN_TIMEOUT
 import json
 from controllers.document_controller import DocumentController
 from controllers.email_controller import EmailController
+from controllers.key_and_certificate_controller import KeyCertController
+from controllers.user_controller import UserController, create_user_indexes
+from contextlib import asynccontextmanager
+from utils.database import create_client, pool_options
+from utils.process_pool import cpu_executor
+from utils.password_utils import PasswordHasherBusyError, password_hasher
+from services.trust_store import trust_store
+from services.certificate_authority import certificate_authority
+from services.certificate_store import certificate_store
+from services.revocation import revocation
+from services.certificate_renewal import certificate_renewal
+from services.verification_cache import verification_cache
+from services.document_registry import document_registry
+from services.key_pool import key_pool
+from services.user_loader import user_loader
+from services.smtp_pool import smtp_pool
+# Bibliotecas de criptografia e de PDF (endesive, PyPDF2, asn1crypto) importadas no
+# inicialização, e não no primeiro pedido de assinatura ou de validação
+import services.signer_services  # noqa: F401
+from utils.upload_utils import SpooledDocument, UploadRoute, attachment_headers, spool_upload, iter_file
+from starlette.background import BackgroundTask
 import asyncio
 import sys
 
 from models.request_models import (
     CertificateRequest,
+    KeyRequest,
+    ProvisionRequest,
+    RevokeRequest,
     SignDocumentRequest,
     UserRequest,
     RegisterUserRequest,
     Request,
 )
 
-# Conexão com o MongoDB
-client = AsyncIOMotorClient(MONGODB_URI)
-
-db = client[DATABASE_NAME]
+# Conexão com o MongoDB, criada na inicialização da aplicação (lifespan), com o pool de
+# conexões definido em config. Se db já estiver definida antes da inicialização, é
+# utilizada esse banco de dados.
+client = None
+db = None
 
 if sys.platform == "win32":
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
-app = FastAPI()
+
+async def connect_database():
+    """
+    Cria o cliente MongoDB e abre a primeira conexão, para que o primeiro pedido não
+    espere pela seleção do servidor nem pelo estabelecimento da conexão.
+    """
+    global client, db
+
+    client = create_client()
+    db = client[DATABASE_NAME]
+    await client.admin.command("ping")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global client, db
+
+    startup_metrics.imported()
+    own_client = db is None
+    # A conexão com o MongoDB e a inicialização do pool de processos de assinatura/validação
+    # (com os workers já aquecidos) decorrem em paralelo
+    await asyncio.gather(
+        startup_metrics.measure("mongo", connect_database()) if own_client else asyncio.sleep(0),
+        startup_metrics.measure("cpu_pool", cpu_executor.start()),
+    )
+    await startup_metrics.measure("services", start_services(db))
+    # Controladores criados uma única vez e compartilhados por todos os pedidos
+    # (ver get_*_controller)
+    app.state.document_controller = DocumentController(db)
+    app.state.email_controller = EmailController(db)
+    app.state.key_cert_controller = KeyCertController(db)
+    app.state.user_controller = UserController(db)
+    startup_metrics.ready()
+    print(f"Aplicação pronta em {startup_metrics.ready_ms} ms")
+    yield
+    # Espera pelas assinaturas e validações em curso antes de parar os serviços que
+    # elas utilizam (ex: o registro dos documentos assinados)
+    pending = await cpu_executor.drain(SHUTDOWN_DRAIN_TIMEOUT)
+    if pending:
+        print(f"{pending} tarefas do pool de processos não terminaram a tempo")
+    await key_pool.stop()
+    await document_registry.stop()
+    await trust_store.stop()
+    await certificate_renewal.stop()
+    await revocation.stop()
+    await smtp_pool.stop()
+    password_hasher.shutdown()
+    cpu_executor.shutdown()
+    if own_client:
+        client.close()
+        client = db = None
+
+
+async def start_services(db):
+    await user_loader.start(db)
+    await create_user_indexes(db)
+    # Carrega (ou cria, na primeira execução) a CA interna, se estiver ativa
+    await certificate_authority.start(db)
+    await certificate_store.start(db)
+    # Carrega os certificados revogados e publica a CRL da CA interna
+    await revocation.start(db)
+    # Renova em segundo plano os certificados da CA interna antes de expirarem
+    await certificate_renewal.start(db)
+    # Carrega os certificados dos usuários para memória
+    await trust_store.start(db)
+    await verification_cache.start(db)
+    await document_registry.start(db)
+    # Começa a gerar pares de chaves em segundo plano
+    await key_pool.start()
+    # As sessões SMTP são abertas no primeiro envio e reutilizadas
+    smtp_pool.start()
+
+
+def get_document_controller(request: HttpRequest) -> DocumentController:
+    return request.app.state.document_controller
+
+
+def get_email_controller(request: HttpRequest) -> EmailController:
+    return request.app.state.email_controller
+
+
+def get_key_cert_controller(request: HttpRequest) -> KeyCertController:
+    return request.app.state.key_cert_controller
+
+
+def get_user_controller(request: HttpRequest) -> UserController:
+    return request.app.state.user_controller
+
+
+app = FastAPI(lifespan=lifespan)
+# Uploads guardados e com o SHA-256 calculado enquanto o corpo do pedido é recebido
+app.router.route_class = UploadRoute
 ALLOWED_ORIGINS = ["https://localhost:3000","https://127.0.0.1:3000"]
 app.add_middleware(
     CORSMiddleware,
@@ -35,6 +153,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST"],  # utilizar apenas os 2
     allow_headers=["*"],
+    # Cabeçalhos das respostas binárias que o frontend precisa ler
+    expose_headers=["Content-Disposition", "X-Document-Hash", "X-Document-Filename", "X-Provisioning-Job"],
 )
 
 @app.middleware("http")
@@ -48,6 +168,21 @@ async def catch_disconnects(request: Request, call_next):
         return JSONResponse(content={"detail":"Conexão interrompida"}, status_code=499)  # Código 499: Client Closed Request
 
 
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    from config import MAX_UPLOAD_SIZE
+
+    # Rejeita logo pedidos demasiado grandes, antes de o corpo ser lido.
+    # Pedidos sem Content-Length são limitados em spool_upload.
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_SIZE:
+        return JSONResponse(
+            content={"detail": "O documento excede o tamanho máximo permitido"},
+            status_code=413,
+        )
+    return await call_next(request)
+
+
 @app.exception_handler(Exception)
 async def general_exception_handler(request, exc):
     return JSONResponse(
@@ -60,22 +195,132 @@ async def general_exception_handler(request, exc):
 async def root():
     return {"message": "Ferramenta de Assinatura Digital de Documentos"}
 
-@app.post("/create_key_and_certificate")
-async def create_key_and_certificate(request: Request):
-    from controllers.key_and_certificate_controller import KeyCertController
 
-    controller = KeyCertController(db)
+@app.get("/metrics")
+async def metrics():
+    return {
+        "startup": startup_metrics.stats(),
+        "mongo": pool_options(),
+        "cpu_pool": cpu_executor.stats(),
+        "trust_store": trust_store.stats(),
+        "user_loader": user_loader.stats(),
+        "password_hasher": password_hasher.stats(),
+        "certificate_authority": certificate_authority.stats(),
+        "certificate_store": certificate_store.stats(),
+        "revocation": revocation.stats(),
+        "certificate_renewal": certificate_renewal.stats(),
+        "verification_cache": verification_cache.stats(),
+        "document_registry": document_registry.stats(),
+        "key_pool": key_pool.stats(),
+        "smtp_pool": smtp_pool.stats(),
+    }
+
+@app.post("/create_key_and_certificate")
+async def create_key_and_certificate(
+    request: KeyRequest,
+    controller: KeyCertController = Depends(get_key_cert_controller),
+):
     try:
         result = await controller.create_key_and_certificate(request)
         return {
             "message": "Chave e certificado criados com sucesso",
             "data": result,
         }
+    except HTTPException:
+        raise
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail="Erro ao criar chave e certificado")
 
 
+@app.post("/provision_users")
+async def provision_users(
+    request: ProvisionRequest,
+    controller: KeyCertController = Depends(get_key_cert_controller),
+):
+    """
+    Provisiona as chaves e os certificados de vários usuários e retorna um arquivo
+    ZIP com as chaves privadas, enviado à medida que são geradas. O id do job segue no
+    cabeçalho X-Provisioning-Job; se a conexão cair no meio, o mesmo pedido com job_id
+    retoma o job sem voltar a gerar as chaves já emitidas.
+    """
+    try:
+        job, archive = await controller.provision_users(request)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(e)
+        raise HTTPException(status_code=500, detail="Erro ao provisionar usuários")
+    job_id = str(job["_id"])
+    return StreamingResponse(
+        archive,
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f'attachment; filename="provisioning-{job_id}.zip"',
+            "X-Provisioning-Job": job_id,
+        },
+    )
+
+
+@app.get("/provisioning_jobs/{job_id}")
+async def get_provisioning_job(
+    job_id: str,
+    controller: KeyCertController = Depends(get_key_cert_controller),
+):
+    """
+    Progresso de um job de provisionamento: usuários emitidos e falhas.
+    """
+    return {
+        "message": "Job encontrado",
+        "data": await controller.get_provisioning_job(job_id),
+    }
+
+
+def signed_pdf_response(signed: SpooledDocument, hash: str):
+    """
+    Resposta binária (application/pdf) com o documento assinado, lido do disco em blocos.
+    O hash SHA-256 e o nome do arquivo seguem nos cabeçalhos (ver attachment_headers).
+    O arquivo temporário é apagado depois de enviado.
+    """
+    return StreamingResponse(
+        iter_file(signed.path),
+        media_type="application/pdf",
+        headers={
+            **attachment_headers(signed.filename),
+            "Content-Length": str(signed.size),
+            "X-Document-Hash": hash,
+        },
+        background=BackgroundTask(signed.cleanup),
+    )
+
+
+def signed_json_response(signed: SpooledDocument, hash: str):
+    """
+    Resposta JSON com o documento assinado em base64. O JSON é gerado em blocos a
+    partir do arquivo em disco, para que o documento e a sua versão em base64 nunca
+    estejam inteiros em memória.
+    """
+    import base64
+
+    def body():
+        yield (
+            '{"message": "Documento assinado com sucesso", "data": {'
+            f'"filename": {json.dumps(signed.filename)}, '
+            f'"hash": {json.dumps(hash)}, '
+            '"signed_document": "'
+        ).encode()
+        # Blocos múltiplos de 3 bytes para que o base64 de cada bloco não tenha padding
+        for chunk in iter_file(signed.path, 3 * 256 * 1024):
+            yield base64.b64encode(chunk)
+        yield b'"}}'
+
+    return StreamingResponse(
+        body(),
+        media_type="application/json",
+        background=BackgroundTask(signed.cleanup),
+    )
+
+
 @app.post("/sign_document")
 async def sign_document(
     file: UploadFile = File(...),
@@ -84,13 +329,17 @@ async def sign_document(
     reason: str = Form(...),
     location: str = Form(...),
     positions: list | None = Form(None),
+    accept: str | None = Header(None),
+    controller: DocumentController = Depends(get_document_controller),
 ):
-    from controllers.document_controller import DocumentController
-
-    controller = DocumentController(db)
+    """
+    Assina o documento. Por padrão responde em JSON com o documento em base64;
+    com o cabeçalho "Accept: application/pdf" retorna o PDF assinado em binário.
+    """
+    document = await spool_upload(file)
     try:
         request = SignDocumentRequest(
-            file_content=await file.read(),
+            file_path=document.path,
             private_key = await private_key.read(),
             filename=file.filename,
             user_id=user_id,
@@ -99,46 +348,142 @@ async def sign_document(
             positions=positions if positions else None,
         )
         result = await controller.sign_document(request)
-        return {
-            "message": "Documento assinado com sucesso",
-            "data": {
-                "filename": result["filename"],
-                "signed_document": result["signed_document"],
-                "hash": result["hash"],
-            },
-        }
+        signed = SpooledDocument(result["signed_path"], result["filename"], result["size"])
+        try:
+            if accept and "application/pdf" in accept:
+                return signed_pdf_response(signed, result["hash"])
+            return signed_json_response(signed, result["hash"])
+        except BaseException:
+            # Sem resposta, a tarefa que apaga o documento assinado nunca é executada
+            signed.cleanup()
+            raise
+    except HTTPException:
+        raise
     except Exception as e:
         print(e)
         print(e.with_traceback)
         raise HTTPException(
             status_code=500, detail=f"Erro 500. Erro ao assinar documento: {str(e)}"
         )
+    finally:
+        document.cleanup()
+
+
+@app.post("/sign_documents_batch")
+async def sign_documents_batch(
+    files: list[UploadFile] = File(...),
+    private_key: UploadFile = File(...),
+    user_id: str = Form(...),
+    reason: str = Form(...),
+    location: str = Form(...),
+    positions: Optional[str] = Form(None),
+    controller: DocumentController = Depends(get_document_controller),
+):
+    """
+    Assina vários documentos com a mesma chave e retorna os resultados em NDJSON,
+    uma linha por documento, à medida que ficam prontos.
+    """
+    try:
+        results = await controller.sign_documents_batch(
+            user_id=user_id,
+            private_key=await private_key.read(),
+            files=files,
+            reason=reason,
+            location=location,
+            positions=json.loads(positions) if positions else None,
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(e)
+        raise HTTPException(
+            status_code=500, detail=f"Erro 500. Erro ao assinar documentos: {str(e)}"
+        )
+
+    async def ndjson():
+        async for result in results:
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+
+@app.post("/validate_batch")
+async def validate_documents_batch(
+    files: list[UploadFile] = File(...),
+    manifest: Optional[UploadFile] = File(None),
+    hash_algorithm: str = Form("sha256"),
+    report: bool = Form(False),
+    controller: DocumentController = Depends(get_document_controller),
+):
+    """
+    Valida vários documentos e retorna os resultados em NDJSON, uma linha por documento,
+    à medida que ficam prontos, seguida de uma linha com o resumo do lote.
+    O manifesto opcional indica o hash esperado de cada documento (JSON
+    {"nome": "hash"} ou o formato do sha256sum).
+    """
+    from utils.crypto_utils import HASH_ALGORITHMS, parse_hash_manifest
+
+    if hash_algorithm not in HASH_ALGORITHMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Algoritmo de hash inválido. Utilize um de: {', '.join(HASH_ALGORITHMS)}",
+        )
+    expected_hashes = None
+    if manifest is not None:
+        try:
+            expected_hashes = parse_hash_manifest(await manifest.read())
+        except (ValueError, UnicodeDecodeError) as e:
+            raise HTTPException(status_code=400, detail=f"Manifesto inválido: {e}")
+
+    results = await controller.validate_documents_batch(
+        files, expected_hashes, hash_algorithm, report
+    )
+
+    async def ndjson():
+        async for result in results:
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
 
 
 @app.post("/validate")
 async def verify_document(
     file_content: UploadFile = File(...),
-    file_hash: UploadFile = File(...),
+    file_hash: Optional[UploadFile] = File(None),
+    hash_algorithm: str = Form("sha256"),
+    report: bool = Form(False),
+    controller: DocumentController = Depends(get_document_controller),
 ):
-    from controllers.document_controller import DocumentController
-
-    controller = DocumentController(db)
+    """
+    Valida um documento assinado. Com report=true a resposta inclui um relatório por
+    assinatura (revisions), com as assinaturas verificadas em paralelo.
+    O arquivo com o hash é opcional: a resposta inclui sempre, em "registry", o
+    registro do documento se este tiver sido assinado pela aplicação.
+    O hash é calculado enquanto o documento é recebido se hash_algorithm vier no
+    formulário antes de file_content (o SHA-256 é sempre calculado na recepção).
+    """
+    from utils.crypto_utils import HASH_ALGORITHMS
+
+    if hash_algorithm not in HASH_ALGORITHMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Algoritmo de hash inválido. Utilize um de: {', '.join(HASH_ALGORITHMS)}",
+        )
+    document = await spool_upload(file_content, hash_algorithm=hash_algorithm)
     try:
-        file_content_data = await file_content.read()
-        file_hash_data = await file_hash.read()
-        print(file_hash)
-        print(file_hash_data)
-        equal = await controller.verify_hash(file_content_data, file_hash_data)
-        if not equal:
-            return {
-                "message": "Hashes não são iguais",
-                "data": {
-                    "validated": False,
+        if file_hash is not None:
+            file_hash_data = await file_hash.read()
+            equal = await controller.verify_hash(document.hash, file_hash_data)
+            if not equal:
+                return {
+                    "message": "Hashes não são iguais",
+                    "data": {
+                        "validated": False,
+                    }
                 }
-            }
-        
-        # file_hash_data = await file_hash.read()
-        result = await controller.verify_document(file_content_data)
+
+        result = await controller.verify_document(document.path, document.sha256, report)
+        result = {**(result or {}), "registry": await document_registry.find(document.sha256)}
         if not result or not result.get("validated"):
             return {
                 "message": "Não foi possível validar a integridade do documento.",
@@ -153,44 +498,165 @@ async def verify_document(
         raise HTTPException(
             status_code=500, detail="Erro ao validar documento: " + str(e)
         )
+    finally:
+        document.cleanup()
+
+
+@app.get("/ca_certificates")
+async def get_ca_certificates():
+    """
+    Certificados da CA interna (raiz e intermediário), para que clientes externos possam
+    validar as assinaturas confiando apenas na raiz.
+    """
+    if not certificate_authority.active:
+        raise HTTPException(status_code=404, detail="A CA interna não está ativa")
+    return {
+        "message": "Certificados da CA interna",
+        "data": {
+            "root_certificate": certificate_authority.root,
+            "intermediate_certificate": certificate_authority.intermediate,
+        },
+    }
+
+
+@app.post("/revoke_certificate")
+async def revoke_certificate(
+    request: RevokeRequest,
+    controller: KeyCertController = Depends(get_key_cert_controller),
+):
+    """
+    Revoga o certificado atual do usuário. As assinaturas feitas com ele deixam de
+    ser validadas e o certificado passa a constar da CRL e das respostas OCSP.
+    """
+    try:
+        result = await controller.revoke_certificate(request)
+        return {
+            "message": "Certificado revogado com sucesso",
+            "data": result,
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(e)
+        raise HTTPException(status_code=500, detail="Erro ao revogar certificado")
 
 
-@app.post("/login")
-async def login(user: UserRequest):
-    from controllers.user_controller import UserController
+@app.get("/certificates/{fingerprint}")
+async def find_certificate(
+    fingerprint: str,
+    controller: KeyCertController = Depends(get_key_cert_controller),
+):
+    """
+    Procura um certificado emitido pela aplicação pela impressão digital SHA-256 (ex: a
+    indicada no registro de um documento assinado, em /documents/{sha256}).
+    """
+    return {
+        "message": "Certificado encontrado",
+        "data": await controller.find_certificate(fingerprint),
+    }
+
+
+@app.get("/certificate_history/{user_id}")
+async def get_certificate_history(
+    user_id: str,
+    controller: KeyCertController = Depends(get_key_cert_controller),
+):
+    """
+    Certificados emitidos para um usuário, incluindo os substituídos e revogados.
+    """
+    return {
+        "message": "Histórico de certificados",
+        "data": await controller.get_certificate_history(user_id),
+    }
+
+
+@app.get("/certificate_renewals/{user_id}")
+async def get_certificate_renewals(user_id: str):
+    """
+    Histórico das renovações automáticas do certificado de um usuário.
+    """
+    return {
+        "message": "Histórico de renovações",
+        "data": await certificate_renewal.history(user_id),
+    }
+
+
+@app.get("/crl")
+async def get_crl():
+    """
+    CRL (DER) da CA interna, gerada de novo a cada config.CRL_UPDATE_INTERVAL segundos
+    e sempre que um certificado é revogado.
+    """
+    if revocation.crl is None:
+        raise HTTPException(status_code=404, detail="A CA interna não está ativa")
+    return Response(
+        revocation.crl,
+        media_type="application/pkix-crl",
+        headers={"Cache-Control": f"max-age={int(revocation.update_interval)}"},
+    )
+
+
+@app.post("/ocsp")
+async def ocsp(request: HttpRequest):
+    """
+    Responde a pedidos OCSP (RFC 6960) sobre os certificados emitidos pela CA interna.
+    """
+    if not certificate_authority.active:
+        raise HTTPException(status_code=404, detail="A CA interna não está ativa")
+    return Response(revocation.ocsp_response(await request.body()), media_type="application/ocsp-response")
+
+
+@app.get("/documents/{sha256}")
+async def get_signed_document(sha256: str):
+    """
+    Retorna o registro de um documento assinado pela aplicação: quem o assinou, quando,
+    o nome e o tamanho do arquivo e a impressão digital do certificado utilizado.
+    """
+    record = await document_registry.find(sha256)
+    if record is None:
+        raise HTTPException(status_code=404, detail="Documento não encontrado")
+    return {
+        "message": "Documento encontrado",
+        "data": record,
+    }
+
 
-    controller = UserController(db)
+@app.post("/login")
+async def login(user: UserRequest, controller: UserController = Depends(get_user_controller)):
     try:
         return {
             "message": "Usuário logado com sucesso",
             "data": await controller.login(user),
         }
+    except PasswordHasherBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         print(e)
         raise HTTPException(status_code=404, detail=str(e))
 
 
 @app.post("/register")
-async def create_user(user: RegisterUserRequest):
-    from controllers.user_controller import UserController
-
-    controller = UserController(db)
+async def create_user(
+    user: RegisterUserRequest,
+    controller: UserController = Depends(get_user_controller),
+):
     try:
         result = await controller.register(user)
         return {
             "message": "Usuário criado com sucesso",
             "data": result,
         }
+    except HTTPException:
+        raise
+    except PasswordHasherBusyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail="Erro ao criar usuário")
 
 
 @app.get("/get_keys")
-async def get_keys(user_id: str):
-    from controllers.key_and_certificate_controller import KeyCertController
-
-    controller = KeyCertController(db)
+async def get_keys(user_id: str, controller: KeyCertController = Depends(get_key_cert_controller)):
     try:
         result = await controller.get_keys(user_id)
         if result.get("public_key") is None:
@@ -211,10 +677,8 @@ async def get_keys(user_id: str):
 async def create_certificate(
     user_id: str = Form(...),
     private_key: UploadFile = File(...),
+    controller: KeyCertController = Depends(get_key_cert_controller),
 ):
-    from controllers.key_and_certificate_controller import KeyCertController
-
-    controller = KeyCertController(db)
     try:
         private_key_data = await private_key.read()
         if not private_key_data:
@@ -234,10 +698,10 @@ async def create_certificate(
 
 
 @app.post("/get_certificate")
-async def get_certificate(request: Request):
-    from controllers.key_and_certificate_controller import KeyCertController
-
-    controller = KeyCertController(db)
+async def get_certificate(
+    request: Request,
+    controller: KeyCertController = Depends(get_key_cert_controller),
+):
     try:
         result = await controller.get_certificate(request)
         if result.get("certificate") is None:
@@ -255,16 +719,18 @@ async def get_certificate(request: Request):
 
 
 @app.post("/create_key")
-async def create_key(request: Request):
-    from controllers.key_and_certificate_controller import KeyCertController
-
-    controller = KeyCertController(db)
+async def create_key(
+    request: KeyRequest,
+    controller: KeyCertController = Depends(get_key_cert_controller),
+):
     try:
         result = await controller.create_key_pair(request)
         return {
             "message": "Chave criada com sucesso",
             "data": result,
         }
+    except HTTPException:
+        raise
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail="Erro ao criar chave")
@@ -277,10 +743,8 @@ async def send_email(
     message: str = Form(...),
     emails: str = Form(...),  # Lista de emails como string separada por vírgulas
     attachment: UploadFile | None = File(None),  # O anexo é opcional
+    controller: EmailController = Depends(get_email_controller),
 ):
-    from controllers.email_controller import EmailController
-
-    controller = EmailController(db)
     try:
         # Converte a string de emails para lista
         email_list = emails.split(",")
@@ -302,11 +766,6 @@ async def send_email(
         raise HTTPException(status_code=500, detail="Erro ao enviar email")
 
 
-document_controller = DocumentController(db)
-email_controller = EmailController(db)
-
-from tempfile import SpooledTemporaryFile
-
 @app.post("/sign_document_and_send")
 async def sign_document_and_send(
     file: UploadFile = File(...),
@@ -318,47 +777,45 @@ async def sign_document_and_send(
     message: str = Form(...),
     emails: str = Form(...),  # Lista de emails como string separada por vírgulas
     positions: Optional[str] = Form(None),
+    document_controller: DocumentController = Depends(get_document_controller),
+    email_controller: EmailController = Depends(get_email_controller),
 ):
     try:
         # Converter `positions` para lista (se aplicável)
         positions_list = json.loads(positions) if positions else None
 
         # Assinar o documento chamando a função existente
-        sign_request = SignDocumentRequest(
-            file_content=await file.read(),
-            private_key=await private_key.read(),
-            filename=file.filename,
-            user_id=user_id,
-            reason=reason,
-            location=location,
-            positions=positions_list,
-        )
-        signed_document = await document_controller.sign_document(sign_request)
-
-        import base64
-        # Decodificar o documento assinado em base64
-        signed_pdf_data = base64.b64decode(signed_document["signed_document"])
-
-        # Criar um arquivo temporário para o anexo
-        temp_file = SpooledTemporaryFile()
-        temp_file.write(signed_pdf_data)
-        temp_file.seek(0)
-
-        # Recriar o arquivo para o envio de e-mail
-        attachment = UploadFile(
-            filename=signed_document["filename"],
-            file=temp_file,
-        )
-
-        # Enviar o e-mail com o documento assinado
-        email_list = emails.split(",")
-        await email_controller.send_email(
-            user_id=user_id,
-            subject=subject,
-            message=message,
-            emails=email_list,
-            attachment=attachment,
+        document = await spool_upload(file)
+        try:
+            sign_request = SignDocumentRequest(
+                file_path=document.path,
+                private_key=await private_key.read(),
+                filename=file.filename,
+                user_id=user_id,
+                reason=reason,
+                location=location,
+                positions=positions_list,
+            )
+            signed_document = await document_controller.sign_document(sign_request)
+        finally:
+            document.cleanup()
+
+        # Enviar o e-mail com o documento assinado (em bytes, sem passar por base64)
+        signed = SpooledDocument(
+            signed_document["signed_path"], signed_document["filename"], signed_document["size"]
         )
+        try:
+            email_list = emails.split(",")
+            await email_controller.send_email(
+                user_id=user_id,
+                subject=subject,
+                message=message,
+                emails=email_list,
+                attachment_content=signed.read(),
+                attachment_filename=signed.filename,
+            )
+        finally:
+            signed.cleanup()
 
         return {
             "message": "Documento assinado e enviado com sucesso!",
@@ -368,5 +825,7 @@ async def sign_document_and_send(
             },
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao processar: {str(e)}")
@@ -3,6 +3,10 @@ from services.signer_services import sign_pdf
 from models.signer import Signer
 
 FileType = Enum("FileType", [("PDF", "pdf"), ("OFFICE", "office"), ("UNSUPPORTED", "unsupported")])
+SignatureStatus = Enum(
+    "SignatureStatus",
+    [("NOT_PDF", "not a PDF"), ("NOT_SIGNED", "not signed"), ("SIGNED", "signed")],
+)
 
 class File():
     _name:str
@@ -46,10 +50,27 @@ class File():
     
     @staticmethod
     def get_file_type(file:bytes):
-        if file[:4] == b'%PDF':
+        from utils.pdf_utils import has_pdf_header
+
+        # file pode ser bytes ou um mmap
+        if has_pdf_header(file):
             return FileType.PDF
         else:
             return FileType.UNSUPPORTED
+
+    @staticmethod
+    def get_signature_status(file:bytes):
+        """
+        Verificação rápida, feita antes da validação completa, que indica se o arquivo
+        não é um PDF, é um PDF sem assinaturas ou tem assinaturas a validar.
+        """
+        from utils.pdf_utils import has_signature_markers
+
+        if File.get_file_type(file) != FileType.PDF:
+            return SignatureStatus.NOT_PDF
+        if not has_signature_markers(file):
+            return SignatureStatus.NOT_SIGNED
+        return SignatureStatus.SIGNED
         
     def sign(self, signer: Signer, signature_position = (470, 840, 570, 640), reason = '', location = ''):   
         if self.type == FileType.PDF:
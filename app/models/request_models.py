@@ -7,6 +7,29 @@ class Request(BaseModel):
     """
     user_id: str
 
+class KeyRequest(Request):
+    """
+    Request to create a key pair; key_algorithm is one of KEY_ALGORITHMS
+    (services.key_and_certificate_services), by default config.KEY_ALGORITHM.
+    """
+    key_algorithm: str | None = None
+
+class RevokeRequest(Request):
+    """
+    Request to revoke the user's current certificate; reason is one of
+    REVOCATION_REASONS (services.revocation).
+    """
+    reason: str | None = "unspecified"
+
+class ProvisionRequest(BaseModel):
+    """
+    Request to provision keys and certificates for many users at once.
+    With job_id, an interrupted job is resumed and user_ids is ignored.
+    """
+    user_ids: list[str] = []
+    key_algorithm: str | None = None
+    job_id: str | None = None
+
 class UserRequest(BaseModel):
     email: EmailStr
     password: str
@@ -21,7 +44,8 @@ class CertificateRequest(BaseModel):
     private_key: bytes
 
 class SignDocumentRequest(BaseModel):
-    file_content: bytes
+    # Caminho do documento guardado em disco (ver utils.upload_utils.spool_upload)
+    file_path: str
     private_key: bytes
     filename: str
     user_id: str 
@@ -4,13 +4,21 @@ class Signer:
     private_key: bytes | None
     public_key: bytes | None
     certificate: bytes | None
+    # Algoritmo da chave (ver services.key_and_certificate_services.KEY_ALGORITHMS);
+    # se não for indicado, é obtido da própria chave
+    key_algorithm: str | None
+    # Certificados intermediários (PEM) entre o certificado e a raiz da CA interna,
+    # incluídos nas assinaturas (ver services.certificate_authority)
+    chain: list[bytes]
     
-    def __init__( self, name:str,email:str, private_key:bytes | None = None, public_key: bytes | None = None, cert_pem: bytes | None = None ):
+    def __init__( self, name:str,email:str, private_key:bytes | None = None, public_key: bytes | None = None, cert_pem: bytes | None = None, key_algorithm: str | None = None, chain: list[bytes] | None = None ):
         self.name = name
         self.email = email
         self.private_key = private_key
         self.public_key = public_key
         self.certificate = cert_pem
+        self.key_algorithm = key_algorithm
+        self.chain = list(chain or [])
     
     def get_certificate(self):
         return self.certificate
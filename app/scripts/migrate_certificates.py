@@ -0,0 +1,25 @@
+"""
+Migração única dos certificados guardados em users.certificate para a coleção
+certificates (ver services.certificate_store). Pode ser repetida sem duplicar
+certificados.
+
+Executar a partir da pasta app:
+    python -m scripts.migrate_certificates
+"""
+import asyncio
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from config import DATABASE_NAME, MONGODB_URI
+from services.certificate_store import certificate_store
+
+
+async def main():
+    db = AsyncIOMotorClient(MONGODB_URI)[DATABASE_NAME]
+    await certificate_store.start(db)
+    migrated = await certificate_store.migrate(db)
+    print(f"{migrated} certificados migrados, {certificate_store.recorded} novos")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
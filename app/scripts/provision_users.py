@@ -0,0 +1,80 @@
+"""
+Provisionamento em lote das chaves e certificados de usuários na linha de comandos
+(ver services.provisioning), sem passar pela API.
+
+Executar a partir da pasta app:
+    python -m scripts.provision_users ids.txt -o chaves.zip [--algorithm ecdsa-p256]
+    python -m scripts.provision_users --job <job_id> -o chaves-2.zip
+
+ids.txt tem um id de usuário por linha. Se a execução for interrompida, --job com o
+id indicado no início retoma o job sem voltar a gerar as chaves já emitidas.
+"""
+import argparse
+import asyncio
+import json
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from config import DATABASE_NAME, KEY_ALGORITHM, MONGODB_URI
+from services.certificate_authority import certificate_authority
+from services.certificate_store import certificate_store
+from services.key_and_certificate_services import KEY_ALGORITHMS
+from services.provisioning import Provisioner, job_summary
+from utils.process_pool import CpuExecutor
+from utils.zip_utils import ZipStream
+
+
+async def main(args):
+    db = AsyncIOMotorClient(MONGODB_URI)[DATABASE_NAME]
+    # Com INTERNAL_CA, os certificados são emitidos pela CA guardada no banco de dados
+    await certificate_authority.start(db)
+    await certificate_store.start(db)
+    executor = CpuExecutor()
+    await executor.start()
+    provisioner = Provisioner(db, executor)
+    try:
+        if args.job:
+            job = await provisioner.get_job(args.job)
+            if job is None:
+                raise SystemExit(f"Job não encontrado: {args.job}")
+        else:
+            with open(args.user_ids) as f:
+                user_ids = [line.strip() for line in f if line.strip()]
+            job = await provisioner.create_job(user_ids, args.algorithm)
+        print(f"Job {job['_id']}: {len(job['user_ids'])} usuários")
+
+        archive = ZipStream()
+        with open(args.output, "wb") as output:
+            async for credentials in provisioner.run(job):
+                for credential in credentials:
+                    filename = f"{credential['email'].replace('.','_').lower()}-private-key.pem"
+                    output.write(archive.add(filename, credential["private_key"]))
+                # As chaves emitidas ficam em disco antes de o bloco seguinte ser gerado
+                output.flush()
+                print(f"{len(credentials)} chaves emitidas")
+            finished = await provisioner.get_job(str(job["_id"]))
+            summary = job_summary(finished)
+            needs_rekey = finished.get("needs_rekey", [])
+            manifest = {**summary, "needs_rekey": needs_rekey}
+            output.write(archive.add("manifest.json", json.dumps(manifest, indent=2).encode()))
+            output.write(archive.close())
+        print(f"{summary['issued']}/{summary['total']} usuários provisionados, {len(summary['failed'])} falhas")
+        if needs_rekey:
+            print(
+                f"{len(needs_rekey)} usuários provisionados em uma execução anterior: as chaves não "
+                "estão neste arquivo (ver needs_rekey no manifest.json)"
+            )
+    finally:
+        executor.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Provisionamento em lote de chaves e certificados")
+    parser.add_argument("user_ids", nargs="?", help="arquivo com um id de usuário por linha")
+    parser.add_argument("-o", "--output", required=True, help="arquivo ZIP com as chaves privadas")
+    parser.add_argument("--algorithm", default=KEY_ALGORITHM, choices=KEY_ALGORITHMS)
+    parser.add_argument("--job", help="id de um job interrompido a retomar")
+    args = parser.parse_args()
+    if not args.user_ids and not args.job:
+        parser.error("indique o arquivo de ids ou --job")
+    asyncio.run(main(args))
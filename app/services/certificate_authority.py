@@ -0,0 +1,197 @@
+from datetime import datetime, timedelta, timezone
+
+from config import (
+    INTERNAL_CA,
+    CA_NAME,
+    CA_KEY_ALGORITHM,
+    CA_ROOT_VALIDITY_DAYS,
+    CA_INTERMEDIATE_VALIDITY_DAYS,
+    CA_KEY_PASSWORD,
+    CA_KEY_ALGORITHMS,
+    CA_CRL_URL,
+    CA_OCSP_URL,
+)
+from utils.crypto_utils import load_certificate
+
+# Valor de users.certificate_issuer nos usuários com certificado emitido pela CA
+CA_ISSUER = "internal_ca"
+
+
+class CertificateAuthority:
+    """
+    CA interna da aplicação (ativada com config.INTERNAL_CA). Uma raiz e uma CA
+    intermediária são criadas uma única vez e guardadas na coleção certificate_authority;
+    a intermediária emite os certificados dos usuários.
+
+    A validação confia apenas na raiz (anchors): o certificado intermediário segue no CMS
+    de cada assinatura (chain_for) e a identidade do signatário é lida do próprio
+    certificado. Os certificados emitidos pela CA não precisam estar no trust store,
+    por isso os dados de confiança não crescem com o número de usuários.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = INTERNAL_CA,
+        name: str = CA_NAME,
+        key_algorithm: str = CA_KEY_ALGORITHM,
+        password: str | None = CA_KEY_PASSWORD,
+    ):
+        self.enabled = enabled
+        self.name = name
+        self.key_algorithm = key_algorithm
+        self.password = password.encode() if password else None
+        self.root: bytes | None = None
+        self.intermediate: bytes | None = None
+        self._intermediate_certificate = None
+        self._intermediate_key = None
+        self._issuer: bytes | None = None
+        self.issued = 0
+
+    @property
+    def active(self) -> bool:
+        return self._intermediate_key is not None
+
+    @property
+    def anchors(self) -> list[bytes]:
+        """
+        Certificados raiz em que a validação confia (vazio se a CA não estiver ativa).
+        """
+        return [self.root] if self.active else []
+
+    @property
+    def issuer_name(self) -> bytes | None:
+        """
+        Nome (DER) do emissor dos certificados dos usuários, a CA intermediária.
+        """
+        return self._issuer
+
+    @property
+    def not_valid_after(self) -> datetime | None:
+        """
+        Data em que o certificado da CA intermediária expira.
+        """
+        return self._intermediate_certificate.not_valid_after_utc if self.active else None
+
+    async def start(self, db):
+        """
+        Carrega a CA do banco de dados ou, na primeira execução, a cria, com a chave
+        privada da CA intermediária cifrada com password. Se vários processos iniciarem
+        ao mesmo tempo, todos ficam com a CA do primeiro a gravá-la.
+        """
+        from pymongo.errors import DuplicateKeyError
+        from starlette.concurrency import run_in_threadpool
+        from services.key_and_certificate_services import generate_certificate_authority
+
+        if not self.enabled:
+            return
+        # config valida os mesmos valores; aqui cobre as instâncias criadas com outros
+        if self.key_algorithm not in CA_KEY_ALGORITHMS:
+            raise ValueError(f"Algoritmo inválido para a CA interna: {self.key_algorithm}")
+        if self.password is None:
+            raise ValueError("A chave da CA interna não é guardada sem cifra: defina CA_KEY_PASSWORD")
+        collection = db.certificate_authority
+        stored = await collection.find_one({"_id": "internal"})
+        if stored is None:
+            root, intermediate, intermediate_key = await run_in_threadpool(
+                generate_certificate_authority,
+                self.name,
+                self.key_algorithm,
+                timedelta(days=CA_ROOT_VALIDITY_DAYS),
+                timedelta(days=CA_INTERMEDIATE_VALIDITY_DAYS),
+                self.password,
+            )
+            stored = {
+                "_id": "internal",
+                "root_certificate": root,
+                "intermediate_certificate": intermediate,
+                "intermediate_private_key": intermediate_key,
+                "created_at": datetime.now(timezone.utc),
+            }
+            try:
+                await collection.insert_one(stored)
+                print("CA interna criada")
+            except DuplicateKeyError:
+                stored = await collection.find_one({"_id": "internal"})
+        self._load(stored)
+
+    def _load(self, stored: dict):
+        from cryptography.hazmat.primitives import serialization
+
+        self.root = stored["root_certificate"]
+        self.intermediate = stored["intermediate_certificate"]
+        self._intermediate_certificate = load_certificate(self.intermediate)
+        self._intermediate_key = serialization.load_pem_private_key(
+            stored["intermediate_private_key"], password=self.password
+        )
+        self._issuer = self._intermediate_certificate.subject.public_bytes()
+
+    def issued_by(self, issuer: bytes | None) -> bool:
+        """
+        Indica se um certificado com este emissor (nome DER) foi emitido pela CA.
+        """
+        return self.active and issuer == self._issuer
+
+    def chain_for(self, certificate: bytes) -> list[bytes]:
+        """
+        Certificados intermediários a incluir nas assinaturas feitas com o certificado.
+        """
+        if not self.active or load_certificate(certificate).issuer.public_bytes() != self._issuer:
+            return []
+        return [self.intermediate]
+
+    def issue(self, public_key: bytes, user_name: str, email: str, user_id=None) -> bytes:
+        """
+        Emite o certificado de um usuário (ver
+        services.key_and_certificate_services.issue_certificate).
+        """
+        from services.key_and_certificate_services import issue_certificate
+
+        if not self.active:
+            raise RuntimeError("A CA interna não está ativa")
+        certificate = issue_certificate(
+            self._intermediate_certificate,
+            self._intermediate_key,
+            public_key,
+            user_name,
+            email,
+            str(user_id) if user_id is not None else None,
+            crl_url=CA_CRL_URL,
+            ocsp_url=CA_OCSP_URL,
+        )
+        self.issued += 1
+        return certificate
+
+    def sign_crl(self, revoked: list[dict], last_update: datetime, next_update: datetime, crl_number: int) -> bytes:
+        """
+        Gera a CRL (DER) da CA intermediária (ver services.key_and_certificate_services.build_crl).
+        """
+        from services.key_and_certificate_services import build_crl
+
+        return build_crl(
+            self._intermediate_certificate, self._intermediate_key, revoked, last_update, next_update, crl_number
+        )
+
+    def respond_ocsp(self, request: bytes, status, this_update: datetime, next_update: datetime) -> bytes:
+        """
+        Resposta OCSP (DER) assinada pela CA intermediária (ver
+        services.key_and_certificate_services.build_ocsp_response).
+        """
+        from services.key_and_certificate_services import build_ocsp_response
+
+        return build_ocsp_response(
+            self._intermediate_certificate, self._intermediate_key, request, status, this_update, next_update
+        )
+
+    def stats(self) -> dict:
+        if not self.active:
+            return {"enabled": self.enabled, "active": False}
+        return {
+            "enabled": self.enabled,
+            "active": True,
+            "key_algorithm": self.key_algorithm,
+            "intermediate_not_valid_after": self.not_valid_after.isoformat(),
+            "issued": self.issued,
+        }
+
+
+certificate_authority = CertificateAuthority()
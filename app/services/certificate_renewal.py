@@ -0,0 +1,299 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from config import (
+    CERTIFICATE_VALIDITY_DAYS,
+    RENEWAL_ENABLED,
+    RENEWAL_INTERVAL,
+    RENEWAL_WINDOW_DAYS,
+    RENEWAL_BATCH_SIZE,
+    RENEWAL_BATCH_DELAY,
+)
+from utils.crypto_utils import certificate_expiry, certificate_fingerprint
+from utils.date_utils import as_utc
+
+# Identificador do lease na coleção scheduler_leases
+LEASE_ID = "certificate_renewal"
+
+
+class CertificateRenewal:
+    """
+    Renovação antecipada, em segundo plano, dos certificados emitidos pela CA interna,
+    em vez de os usuários só descobrirem que o certificado expirou ao assinar.
+
+    A data de expiração de cada certificado é guardada em
+    users.certificate_not_valid_after, com um índice. A cada interval segundos, os
+    certificados que expiram nos próximos window_days dias são obtidos por ordem de
+    expiração e renovados (um novo certificado para a mesma chave pública) em blocos de
+    batch_size, com batch_delay segundos entre blocos, para que a renovação de muitos
+    certificados emitidos ao mesmo tempo (ex: provisionamento em lote) não sobrecarregue
+    a aplicação. Cada renovação fica registrada na coleção certificate_renewals.
+
+    Com vários processos, apenas o que obtém o lease (coleção scheduler_leases) executa
+    cada rodada; a escrita de cada certificado é condicional ao certificado anterior,
+    por isso uma renovação concorrente não é aplicada duas vezes.
+    Os certificados autoassinados não são renovados: sem a chave privada do usuário,
+    o servidor não os pode assinar.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = RENEWAL_ENABLED,
+        interval: float = RENEWAL_INTERVAL,
+        window_days: int = RENEWAL_WINDOW_DAYS,
+        batch_size: int = RENEWAL_BATCH_SIZE,
+        batch_delay: float = RENEWAL_BATCH_DELAY,
+        validity_days: int = CERTIFICATE_VALIDITY_DAYS,
+    ):
+        self.enabled = enabled
+        self.validity_days = validity_days
+        self.interval = interval
+        self.window = timedelta(days=window_days)
+        self.batch_size = max(1, batch_size)
+        self.batch_delay = batch_delay
+        self.db = None
+        self._task: asyncio.Task | None = None
+        self.renewed = 0
+        self.skipped = 0
+        self.failed = 0
+        self.backfilled = 0
+        self.last_run: datetime | None = None
+
+    async def start(self, db):
+        # config valida os mesmos valores; aqui cobre as instâncias criadas com outros
+        if self.enabled and timedelta(days=self.validity_days) <= self.window:
+            raise ValueError(
+                "A validade dos certificados tem de ser maior que a janela de renovação: "
+                "os certificados renovados seriam renovados de novo em cada rodada"
+            )
+        self.db = db
+        await db.users.create_index("certificate_not_valid_after", sparse=True)
+        await db.certificate_renewals.create_index([("user_id", 1), ("renewed_at", -1)])
+        if self.enabled:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                if await self._acquire_lease():
+                    await self.run_once()
+            except Exception as e:
+                print(f"Erro na renovação de certificados: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def _acquire_lease(self) -> bool:
+        """
+        Reserva a próxima rodada para este processo durante interval segundos.
+        """
+        from pymongo.errors import DuplicateKeyError
+
+        now = datetime.now(timezone.utc)
+        expires_at = now + timedelta(seconds=self.interval)
+        result = await self.db.scheduler_leases.update_one(
+            {"_id": LEASE_ID, "expires_at": {"$lte": now}},
+            {"$set": {"expires_at": expires_at}},
+        )
+        if result.matched_count:
+            return True
+        try:
+            await self.db.scheduler_leases.insert_one({"_id": LEASE_ID, "expires_at": expires_at})
+            return True
+        except DuplicateKeyError:
+            return False
+
+    async def run_once(self) -> int:
+        """
+        Executa uma rodada de renovação e retorna o número de certificados renovados.
+        """
+        from services.certificate_authority import certificate_authority
+
+        await self._backfill()
+        self.last_run = datetime.now(timezone.utc)
+        if not certificate_authority.active:
+            return 0
+        due = self.last_run + self.window
+        if certificate_authority.not_valid_after <= due:
+            # Um certificado renovado não pode durar mais do que a CA que o emite
+            print("A CA intermediária expira antes dos certificados a renovar: renovação suspensa")
+            return 0
+
+        renewed = 0
+        excluded = []
+        while True:
+            users = await self._due(due, excluded)
+            renewed += await self._renew(users)
+            # Cada usuário é processado no máximo uma vez por rodada, mesmo que o
+            # certificado renovado (ou um emitido entretanto) ainda expire dentro da janela
+            excluded.extend(user["_id"] for user in users)
+            if len(users) < self.batch_size:
+                return renewed
+            await asyncio.sleep(self.batch_delay)
+
+    async def _due(self, due: datetime, excluded: list) -> list[dict]:
+        from services.certificate_authority import CA_ISSUER
+
+        query = {"certificate_issuer": CA_ISSUER, "certificate_not_valid_after": {"$lte": due}}
+        if excluded:
+            query["_id"] = {"$nin": excluded}
+        return await (
+            self.db.users.find(
+                query,
+                {"name": 1, "email": 1, "public_key": 1, "certificate": 1, "certificate_not_valid_after": 1},
+            )
+            .sort("certificate_not_valid_after", 1)
+            .limit(self.batch_size)
+            .to_list(None)
+        )
+
+    async def _renew(self, users: list[dict]) -> int:
+        """
+        Renova os certificados de um bloco de usuários com um único bulk_write.
+        Retorna o número de certificados renovados.
+        """
+        from pymongo import UpdateOne
+        from services.certificate_authority import CA_ISSUER, certificate_authority
+        from services.certificate_store import certificate_record, certificate_store
+        from services.user_loader import user_loader
+
+        renewals = []
+        for user in users:
+            try:
+                certificate = certificate_authority.issue(
+                    user["public_key"], user["name"], user["email"], user["_id"]
+                )
+            except Exception as e:
+                print(f"Erro ao renovar o certificado do usuário {user['_id']}: {e}")
+                self.failed += 1
+                continue
+            renewals.append((user, certificate))
+        if not renewals:
+            return 0
+
+        now = datetime.now(timezone.utc)
+        result = await self.db.users.bulk_write(
+            [
+                UpdateOne(
+                    # Não substitui um certificado emitido ou revogado entretanto
+                    {"_id": user["_id"], "certificate": user["certificate"]},
+                    {
+                        "$set": {
+                            "certificate": certificate,
+                            "certificate_issuer": CA_ISSUER,
+                            "certificate_updated_at": now,
+                            "certificate_not_valid_after": certificate_expiry(certificate),
+                        }
+                    },
+                )
+                for user, certificate in renewals
+            ],
+            ordered=False,
+        )
+        renewed = renewals
+        if result.matched_count < len(renewals):
+            stored = {
+                user["_id"]: user.get("certificate")
+                async for user in self.db.users.find(
+                    {"_id": {"$in": [user["_id"] for user, _ in renewals]}},
+                    {"certificate": 1},
+                )
+            }
+            renewed = [(user, certificate) for user, certificate in renewals if stored.get(user["_id"]) == certificate]
+            self.skipped += len(renewals) - len(renewed)
+        if renewed:
+            await certificate_store.record_many(
+                [certificate_record(user["_id"], certificate, CA_ISSUER, now) for user, certificate in renewed]
+            )
+        # Depois de gravar os registros, que o user_loader carrega com os usuários
+        user_loader.invalidate_many(user["_id"] for user, _ in renewals)
+        if renewed:
+            await self.db.certificate_renewals.insert_many(
+                [
+                    {
+                        "user_id": str(user["_id"]),
+                        "previous_fingerprint": certificate_fingerprint(user["certificate"]),
+                        "previous_not_valid_after": user["certificate_not_valid_after"],
+                        "fingerprint": certificate_fingerprint(certificate),
+                        "not_valid_after": certificate_expiry(certificate),
+                        "renewed_at": now,
+                    }
+                    for user, certificate in renewed
+                ],
+                ordered=False,
+            )
+        self.renewed += len(renewed)
+        return len(renewed)
+
+    async def _backfill(self):
+        """
+        Preenche certificate_not_valid_after nos certificados emitidos antes de a data
+        de expiração ser guardada. Os certificados que não podem ser lidos ficam com
+        None, para não serem processados de novo.
+        """
+        from pymongo import UpdateOne
+
+        while True:
+            users = await (
+                self.db.users.find(
+                    {"certificate": {"$exists": True}, "certificate_not_valid_after": {"$exists": False}},
+                    {"certificate": 1},
+                )
+                .limit(self.batch_size)
+                .to_list(None)
+            )
+            if not users:
+                return
+            operations = []
+            for user in users:
+                try:
+                    not_valid_after = certificate_expiry(user["certificate"])
+                except Exception:
+                    not_valid_after = None
+                operations.append(
+                    UpdateOne(
+                        {"_id": user["_id"], "certificate": user["certificate"]},
+                        {"$set": {"certificate_not_valid_after": not_valid_after}},
+                    )
+                )
+            await self.db.users.bulk_write(operations, ordered=False)
+            self.backfilled += len(users)
+            if len(users) < self.batch_size:
+                return
+            await asyncio.sleep(self.batch_delay)
+
+    async def history(self, user_id: str, limit: int = 50) -> list[dict]:
+        """
+        Renovações do certificado de um usuário, da mais recente para a mais antiga.
+        """
+        renewals = await (
+            self.db.certificate_renewals.find({"user_id": str(user_id)}, {"_id": 0})
+            .sort("renewed_at", -1)
+            .limit(limit)
+            .to_list(None)
+        )
+        for renewal in renewals:
+            for field in ("previous_not_valid_after", "not_valid_after", "renewed_at"):
+                if renewal.get(field) is not None:
+                    renewal[field] = as_utc(renewal[field]).isoformat()
+        return renewals
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "renewed": self.renewed,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "backfilled": self.backfilled,
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+        }
+
+
+certificate_renewal = CertificateRenewal()
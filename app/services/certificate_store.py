@@ -0,0 +1,209 @@
+from datetime import datetime, timezone
+
+from cryptography import x509
+from cryptography.hazmat.primitives import serialization
+
+from utils.crypto_utils import certificate_fingerprint, certificate_to_der, load_certificate, revocation_key
+from utils.date_utils import as_utc
+
+
+# Campo em que services.user_loader guarda o registro do certificado atual do usuário
+CURRENT_CERTIFICATE_FIELD = "current_certificate"
+
+# Etapa $lookup da consulta de usuários que traz o último certificado emitido, pelo
+# índice (user_id, issued_at), em uma lista com no máximo um registro
+CURRENT_CERTIFICATE_LOOKUP = {
+    "$lookup": {
+        "from": "certificates",
+        "let": {"user_id": {"$toString": "$_id"}},
+        "pipeline": [
+            {"$match": {"$expr": {"$eq": ["$user_id", "$$user_id"]}}},
+            {"$sort": {"issued_at": -1}},
+            {"$limit": 1},
+            {"$project": {"_id": 0, "certificate": 1, "revoked_at": 1}},
+        ],
+        "as": CURRENT_CERTIFICATE_FIELD,
+    }
+}
+
+
+class CertificateStore:
+    """
+    Todos os certificados emitidos pela aplicação, na coleção certificates: o
+    certificado em DER e os identificadores já calculados (impressão digital SHA-256,
+    Subject Key Identifier, emissor + número de série, subject e data de expiração),
+    cada um com um índice, e o id do usuário. Os certificados substituídos (renovados
+    ou reemitidos) e revogados continuam na coleção, que guarda assim o histórico de
+    emissão de cada usuário.
+
+    O certificado atual de cada usuário continua também em users.certificate, que
+    o trust store e a renovação utilizam. A assinatura, a revogação e /get_certificate
+    leem-no desta coleção (current), a partir do registro que services.user_loader
+    obtém na mesma consulta que o usuário (CURRENT_CERTIFICATE_LOOKUP).
+    """
+
+    def __init__(self):
+        self.collection = None
+        self.recorded = 0
+
+    async def start(self, db):
+        self.collection = db.certificates
+        await self.collection.create_index("fingerprint", unique=True)
+        await self.collection.create_index([("user_id", 1), ("issued_at", -1)])
+        await self.collection.create_index("key_identifier")
+        await self.collection.create_index("issuer_serial")
+        await self.collection.create_index("subject")
+        await self.collection.create_index("not_valid_after")
+
+    async def record(self, user_id, certificate: bytes, certificate_issuer: str):
+        """
+        Guarda um certificado acabado de emitir. Guardar o mesmo certificado duas vezes
+        não tem efeito.
+        """
+        await self.record_many([certificate_record(user_id, certificate, certificate_issuer)])
+
+    async def record_many(self, records: list[dict]):
+        """
+        Guarda vários certificados (ver certificate_record) com uma única escrita.
+        """
+        from pymongo.errors import BulkWriteError
+
+        if not records:
+            return
+        try:
+            await self.collection.insert_many(records, ordered=False)
+            self.recorded += len(records)
+        except BulkWriteError as e:
+            # Os certificados já guardados (chave duplicada) são ignorados
+            errors = [error for error in e.details.get("writeErrors", []) if error.get("code") != 11000]
+            if errors:
+                raise
+            self.recorded += e.details.get("nInserted", 0)
+
+    async def mark_revoked(self, fingerprint: str, reason: str, revoked_at: datetime):
+        await self.collection.update_one(
+            {"fingerprint": fingerprint},
+            {"$set": {"revoked_at": revoked_at, "revocation_reason": reason}},
+        )
+
+    async def find(self, fingerprint: str) -> dict | None:
+        return await self.collection.find_one(
+            {"fingerprint": fingerprint.strip().lower()}, {"_id": 0}
+        )
+
+    async def current(self, user: dict) -> bytes | None:
+        """
+        Certificado atual (PEM) do usuário: o emitido mais recentemente, ou None se
+        este tiver sido revogado. Os usuários carregados por services.user_loader já
+        trazem esse registro (CURRENT_CERTIFICATE_LOOKUP); para os outros, é lido pelo
+        índice (user_id, issued_at). Os usuários sem nenhum registro (certificados
+        anteriores a esta coleção e ainda não migrados, ver migrate) usam
+        users.certificate.
+        """
+        if CURRENT_CERTIFICATE_FIELD in user:
+            records = user[CURRENT_CERTIFICATE_FIELD]
+            record = records[0] if records else None
+        else:
+            record = await self.collection.find_one(
+                {"user_id": str(user["_id"])},
+                {"certificate": 1, "revoked_at": 1},
+                sort=[("issued_at", -1)],
+            )
+        if record is None:
+            return user.get("certificate")
+        if record.get("revoked_at") is not None:
+            return None
+        return load_certificate(record["certificate"]).public_bytes(serialization.Encoding.PEM)
+
+    async def history(self, user_id: str, limit: int = 50) -> list[dict]:
+        """
+        Certificados emitidos para um usuário, do mais recente para o mais antigo.
+        """
+        return await (
+            self.collection.find({"user_id": str(user_id)}, {"_id": 0})
+            .sort("issued_at", -1)
+            .limit(limit)
+            .to_list(None)
+        )
+
+    async def migrate(self, db, batch_size: int = 500) -> int:
+        """
+        Migração dos certificados guardados apenas em users.certificate (anteriores a
+        esta coleção) e das revogações de revoked_certificates. Pode ser executada
+        várias vezes: os certificados já guardados não são duplicados. Retorna o número
+        de certificados lidos dos usuários.
+        """
+        migrated = 0
+        records = []
+        async for user in db.users.find(
+            {"certificate": {"$exists": True}},
+            {"certificate": 1, "certificate_issuer": 1, "certificate_updated_at": 1},
+        ):
+            try:
+                records.append(
+                    certificate_record(
+                        user["_id"],
+                        user["certificate"],
+                        user.get("certificate_issuer", "self_signed"),
+                        user.get("certificate_updated_at"),
+                    )
+                )
+            except ValueError as e:
+                print(f"Certificado inválido do usuário {user['_id']}: {e}")
+                continue
+            migrated += 1
+            if len(records) >= batch_size:
+                await self.record_many(records)
+                records = []
+        await self.record_many(records)
+        async for entry in db.revoked_certificates.find(
+            {}, {"fingerprint": 1, "reason": 1, "revoked_at": 1}
+        ):
+            await self.mark_revoked(entry["fingerprint"], entry["reason"], entry["revoked_at"])
+        return migrated
+
+    def stats(self) -> dict:
+        return {"recorded": self.recorded}
+
+
+def certificate_record(user_id, certificate: bytes, certificate_issuer: str, issued_at: datetime | None = None) -> dict:
+    """
+    Documento da coleção certificates para um certificado (PEM ou DER).
+    """
+    loaded = load_certificate(certificate)
+    try:
+        key_identifier = loaded.extensions.get_extension_for_class(x509.SubjectKeyIdentifier).value.digest
+    except x509.ExtensionNotFound:
+        key_identifier = x509.SubjectKeyIdentifier.from_public_key(loaded.public_key()).digest
+    return {
+        "fingerprint": certificate_fingerprint(certificate),
+        "user_id": str(user_id),
+        "certificate": certificate_to_der(certificate),
+        "key_identifier": key_identifier.hex(),
+        "serial_number": f"{loaded.serial_number:x}",
+        # O mesmo identificador do conjunto de certificados revogados (services.revocation)
+        "issuer_serial": revocation_key(loaded.issuer.public_bytes(), loaded.serial_number),
+        "subject": loaded.subject.rfc4514_string(),
+        "certificate_issuer": certificate_issuer,
+        "not_valid_before": loaded.not_valid_before_utc,
+        "not_valid_after": loaded.not_valid_after_utc,
+        "issued_at": issued_at or datetime.now(timezone.utc),
+        "revoked_at": None,
+        "revocation_reason": None,
+    }
+
+
+def public_record(record: dict) -> dict:
+    """
+    Registro de um certificado com tipos simples (o certificado em PEM), para as
+    respostas da API.
+    """
+    record = dict(record)
+    record["certificate"] = load_certificate(record["certificate"]).public_bytes(serialization.Encoding.PEM).decode()
+    for field in ("not_valid_before", "not_valid_after", "issued_at", "revoked_at"):
+        if record.get(field) is not None:
+            record[field] = as_utc(record[field]).isoformat()
+    return record
+
+
+certificate_store = CertificateStore()
@@ -0,0 +1,122 @@
+import asyncio
+from datetime import datetime, timezone
+
+from config import REGISTRY_BATCH_SIZE, REGISTRY_FLUSH_INTERVAL
+
+
+class DocumentRegistry:
+    """
+    Registro dos documentos assinados pela aplicação na coleção signed_documents,
+    indexado pelo SHA-256 do documento assinado (índice único). Permite saber quem
+    assinou um documento com uma única consulta, sem que o cliente envie o hash.
+
+    Os registros não são escritos durante o pedido de assinatura: ficam em uma fila em
+    memória e são inseridos em lote por uma tarefa em segundo plano, a cada
+    flush_interval segundos ou quando a fila atinge batch_size registros.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = REGISTRY_BATCH_SIZE,
+        flush_interval: float = REGISTRY_FLUSH_INTERVAL,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.collection = None
+        self._pending: dict[str, dict] = {}
+        self._full = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self.inserted = 0
+
+    async def start(self, db):
+        self.collection = db.signed_documents
+        await self.collection.create_index("sha256", unique=True)
+        await self.collection.create_index("user_id")
+        # Acorda a tarefa de escrita quando a fila chega a batch_size registros
+        self._full = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Para a tarefa em segundo plano e escreve os registros que ainda estão na fila.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def record(
+        self,
+        sha256: str,
+        user_id: str,
+        filename: str | None,
+        size: int,
+        certificate_fingerprint: str,
+        signed_at: datetime | None = None,
+    ):
+        """
+        Acrescenta um documento assinado à fila. Não bloqueia nem acessa o banco de dados.
+        """
+        self._pending[sha256] = {
+            "sha256": sha256,
+            "user_id": str(user_id),
+            "filename": filename,
+            "size": size,
+            "signed_at": signed_at or datetime.now(timezone.utc),
+            "certificate_fingerprint": certificate_fingerprint,
+        }
+        if len(self._pending) >= self.batch_size:
+            self._full.set()
+
+    async def find(self, sha256: str) -> dict | None:
+        """
+        Procura o registro de um documento pelo SHA-256, incluindo os que ainda estão na
+        fila para serem escritos.
+        """
+        sha256 = sha256.strip().lower()
+        if sha256 in self._pending:
+            return dict(self._pending[sha256])
+        if self.collection is None:
+            return None
+        return await self.collection.find_one({"sha256": sha256}, {"_id": 0})
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            await self.flush()
+
+    async def flush(self):
+        from pymongo.errors import BulkWriteError
+
+        if not self._pending or self.collection is None:
+            return
+        batch, self._pending = self._pending, {}
+        try:
+            await self.collection.insert_many(list(batch.values()), ordered=False)
+            self.inserted += len(batch)
+        except BulkWriteError as e:
+            # O mesmo documento assinado duas vezes tem o mesmo hash (chave duplicada)
+            errors = e.details.get("writeErrors", [])
+            self.inserted += e.details.get("nInserted", 0)
+            others = [error for error in errors if error.get("code") != 11000]
+            if others:
+                print(f"Erro ao registrar documentos assinados: {others[0].get('errmsg')}")
+        except Exception as e:
+            print(f"Erro ao registrar documentos assinados: {e}")
+            # Volta a tentar no próximo ciclo, sem substituir registros mais recentes
+            for sha256, entry in batch.items():
+                self._pending.setdefault(sha256, entry)
+
+    def stats(self) -> dict:
+        return {"pending": len(self._pending), "inserted": self.inserted}
+
+
+document_registry = DocumentRegistry()
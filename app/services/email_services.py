@@ -1,37 +1,32 @@
-import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
 from email import encoders
 from pathlib import Path
 
+from services.smtp_pool import smtp_pool
 
-async def send_email(
+
+def build_message(
     sender_email: str,
     sender_name: str,
-    recipient_email: str,
+    recipients: list[str],
     subject: str,
     message: str,
-    attachment_filename: str | None,
-    attachment_content: bytes | None,
-):
+    attachment_filename: str | None = None,
+    attachment_content: bytes | None = None,
+) -> MIMEMultipart:
     """
-    Serviço para enviar e-mails usando Gmail SMTP.
+    Cria a mensagem MIME de um e-mail, com o anexo opcional.
     """
-    smtp_server = "smtp.gmail.com"
-    smtp_port = 587
-    smtp_user = "seu_email@gmail.com"
-    smtp_password = "sua_senha_de_aplicativo"
-
-    # Configuração do e-mail
     msg = MIMEMultipart()
     msg["From"] = f"{sender_name} <{sender_email}>"
-    msg["To"] = recipient_email
+    msg["To"] = ", ".join(recipients)
     msg["Subject"] = subject
     msg.attach(MIMEText(message, "plain"))
 
     # Anexar arquivo, se fornecido
-    if attachment_content and attachment_filename:
+    if attachment_content is not None and attachment_filename:
         part = MIMEBase("application", "octet-stream")
         part.set_payload(attachment_content)
         encoders.encode_base64(part)
@@ -40,14 +35,27 @@ async def send_email(
             f"attachment; filename={Path(attachment_filename).name}",
         )
         msg.attach(part)
+    return msg
+
 
-    # Enviar e-mail via Gmail SMTP
+async def send_email(
+    sender_email: str,
+    sender_name: str,
+    recipient_email: str,
+    subject: str,
+    message: str,
+    attachment_filename: str | None,
+    attachment_content: bytes | None,
+):
+    """
+    Serviço para enviar e-mails através do servidor SMTP configurado (ver
+    services.smtp_pool), reutilizando as sessões SMTP já autenticadas.
+    """
+    msg = build_message(
+        sender_email, sender_name, [recipient_email], subject, message, attachment_filename, attachment_content
+    )
     try:
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(smtp_user, smtp_password)
-        server.send_message(msg)
-        server.quit()
+        await smtp_pool.send(msg, sender_email, [recipient_email])
         return {"message": "E-mail enviado com sucesso!"}
     except Exception as e:
         raise Exception(f"Erro ao enviar e-mail: {str(e)}")
@@ -1,21 +1,76 @@
 from cryptography.hazmat.primitives import serialization
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from cryptography import x509
-from cryptography.x509.oid import NameOID
+from cryptography.x509.oid import AuthorityInformationAccessOID, NameOID
 from cryptography.x509.base import Certificate
-from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric import rsa, ec, ed25519
 from cryptography.hazmat.primitives import serialization, hashes
 from models.signer import Signer
+from config import CERTIFICATE_VALIDITY_DAYS, KEY_ALGORITHM
 
 from cryptography.hazmat.backends import default_backend
 
-def generate_key_pair():
+# Algoritmos de chave suportados
+KEY_ALGORITHMS = ("rsa-2048", "rsa-3072", "ecdsa-p256", "ecdsa-p384", "ed25519")
+
+
+def generate_private_key(algorithm: str = KEY_ALGORITHM):
     """
-    Função que gera um par de chaves privada e pública RSA e retorna ambas as chaves em formato PEM.
+    Gera uma chave privada do algoritmo indicado (ver KEY_ALGORITHMS).
     """
-    key = rsa.generate_private_key(
-        public_exponent=65537, key_size=2048, backend=default_backend()
-    )
+    if algorithm == "rsa-2048":
+        return rsa.generate_private_key(public_exponent=65537, key_size=2048, backend=default_backend())
+    if algorithm == "rsa-3072":
+        return rsa.generate_private_key(public_exponent=65537, key_size=3072, backend=default_backend())
+    if algorithm == "ecdsa-p256":
+        return ec.generate_private_key(ec.SECP256R1())
+    if algorithm == "ecdsa-p384":
+        return ec.generate_private_key(ec.SECP384R1())
+    if algorithm == "ed25519":
+        return ed25519.Ed25519PrivateKey.generate()
+    raise ValueError(f"Algoritmo de chave não suportado: {algorithm}")
+
+
+def key_algorithm_of(key) -> str:
+    """
+    Retorna o nome do algoritmo (ver KEY_ALGORITHMS) de uma chave privada ou pública.
+    """
+    if isinstance(key, (rsa.RSAPrivateKey, rsa.RSAPublicKey)):
+        return f"rsa-{key.key_size}"
+    if isinstance(key, (ec.EllipticCurvePrivateKey, ec.EllipticCurvePublicKey)):
+        return {"secp256r1": "ecdsa-p256", "secp384r1": "ecdsa-p384"}.get(
+            key.curve.name, f"ecdsa-{key.curve.name}"
+        )
+    if isinstance(key, (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey)):
+        return "ed25519"
+    raise ValueError("Tipo de chave não suportado")
+
+
+def digest_algorithm_for(key) -> str:
+    """
+    Algoritmo de hash utilizado com a chave, nos certificados e nas assinaturas:
+    SHA-384 para P-384, SHA-512 para Ed25519 (RFC 8419) e SHA-256 nos demais casos.
+    """
+    if isinstance(key, (ec.EllipticCurvePrivateKey, ec.EllipticCurvePublicKey)) and key.curve.key_size >= 384:
+        return "sha384"
+    if isinstance(key, (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey)):
+        return "sha512"
+    return "sha256"
+
+
+def _certificate_hash(private_key):
+    # Ed25519 não utiliza um algoritmo de hash separado
+    if isinstance(private_key, ed25519.Ed25519PrivateKey):
+        return None
+    return getattr(hashes, digest_algorithm_for(private_key).upper())()
+
+
+def generate_key_pair(algorithm: str = KEY_ALGORITHM):
+    """
+    Função que gera um par de chaves privada e pública (RSA-2048 por padrão, ver
+    KEY_ALGORITHMS) e retorna ambas as chaves em formato PEM.
+    """
+    key = generate_private_key(algorithm)
     # Serializa a chave privada no formato PEM
     private_pem = key.private_bytes(
         encoding=serialization.Encoding.PEM,
@@ -30,18 +85,53 @@ def generate_key_pair():
     return private_pem, public_pem
 
 
-def generate_certificate(signer: Signer, not_valid_after: datetime = (datetime.now() + timedelta(days=365))) -> bytes:
+def generate_key_pairs(count: int, algorithm: str = KEY_ALGORITHM) -> list[tuple[bytes, bytes]]:
+    """
+    Gera vários pares de chaves (ver generate_key_pair). Utilizada pelos processos que
+    reabastecem o pool de chaves (services.key_pool).
+    """
+    return [generate_key_pair(algorithm) for _ in range(count)]
+
+
+def load_private_key(private_pem: bytes):
+    """
+    Carrega uma chave privada gerada pela própria aplicação (ex: do pool de chaves).
+    A validação da chave RSA, que é lenta, é omitida por a chave ser de confiança.
+    """
+    return serialization.load_pem_private_key(
+        private_pem, password=None, unsafe_skip_rsa_key_validation=True
+    )
+
+
+def certificate_validity(not_valid_after: datetime | None = None) -> tuple[datetime, datetime]:
+    """
+    Período de validade (not_valid_before, not_valid_after) de um certificado emitido
+    agora: por padrão config.CERTIFICATE_VALIDITY_DAYS dias. É calculado em cada
+    emissão, e não quando o módulo é importado, para que os processos de longa duração
+    não emitam certificados com uma validade já parcialmente decorrida.
+    """
+    now = datetime.now(timezone.utc)
+    return now, not_valid_after or now + timedelta(days=CERTIFICATE_VALIDITY_DAYS)
+
+
+def generate_certificate(signer: Signer, not_valid_after: datetime | None = None) -> bytes:
     """
     Essa função recebe um objeto Signer e uma data opcional de validade do certificado.
     As chave privada e pública do utilizador são utilizadas para gerar um 
     certificado autoassinado, se o utilizador não tiver as chaves a função lança um ValueError.
-    Se nenhuma data de validade for fornecida, o certificado será válido por 365 dias. 
+    São aceitas chaves de todos os algoritmos de KEY_ALGORITHMS.
+    Se nenhuma data de validade for fornecida, o certificado será válido por
+    CERTIFICATE_VALIDITY_DAYS dias a partir da emissão (ver certificate_validity).
     Essa função retorna o certificado já assinado em formato PEM, para
     manter a padronização com as funções anteriores. 
     """
     
     if not signer.private_key or not signer.public_key:
         raise ValueError("Chave privada ou pública não encontrada")
+    private_key = serialization.load_pem_private_key(
+        signer.private_key, password=None, backend=default_backend()
+    )
+    not_valid_before, not_valid_after = certificate_validity(not_valid_after)
     subject = issuer = x509.Name(
         [
             x509.NameAttribute(NameOID.COMMON_NAME, signer.name),
@@ -58,7 +148,7 @@ def generate_certificate(signer: Signer, not_valid_after: datetime = (datetime.n
             serialization.load_pem_public_key(signer.public_key, default_backend())
         )
         .serial_number(x509.random_serial_number())
-        .not_valid_before(datetime.now())
+        .not_valid_before(not_valid_before)
         .not_valid_after(not_valid_after)
         .add_extension(
             x509.BasicConstraints(ca=True, path_length=None), critical=True
@@ -76,31 +166,31 @@ def generate_certificate(signer: Signer, not_valid_after: datetime = (datetime.n
                 decipher_only=False),                
             critical=True,
         )
-        .sign(
-            serialization.load_pem_private_key(
-                signer.private_key, password=None, backend=default_backend()
-            ),
-            hashes.SHA256(),
-            default_backend(),
-        )
+        .sign(private_key, _certificate_hash(private_key), default_backend())
     )
     cert_pem = cert.public_bytes(encoding=serialization.Encoding.PEM)
     return cert_pem
 
 
-def generate_key_and_certificate(user_name: str, certificate_validity: datetime = (datetime.now() + timedelta(days=365))) -> tuple[bytes, bytes, bytes]:
+def generate_key_and_certificate(user_name: str, not_valid_after: datetime | None = None, key_pair: tuple[bytes, bytes] | None = None, key_algorithm: str = KEY_ALGORITHM) -> tuple[bytes, bytes, bytes]:
     """
     Função que gera as chaves privada e pública e, posteriormente o certificado autoassinado,
     retornando as chaves e o certificado em formato PEM.
     Essa função é adequada para novos utilizadores que não possuem chaves ou certificados,
     pois recebe o nome do utilizador e a validade do certificado como argumentos, 
     em vez de um objeto Signer. 
-    Se nenhuma data de validade for fornecida, o certificado será válido por 365 dias.
+    Se nenhuma data de validade for fornecida, o certificado será válido por
+    CERTIFICATE_VALIDITY_DAYS dias a partir da emissão (ver certificate_validity).
+    Se for dado um par de chaves já gerado (ex: do pool de chaves), é utilizado em vez
+    de gerar uma nova chave do algoritmo key_algorithm.
     """
-    # Gera uma chave privada RSA
-    private_key = rsa.generate_private_key(
-        public_exponent=65537, key_size=2048, backend=default_backend()
-    )
+    if key_pair is not None:
+        private_key = load_private_key(key_pair[0])
+    else:
+        # Gera uma chave privada (RSA-2048 por padrão)
+        private_key = generate_private_key(key_algorithm)
+
+    not_valid_before, not_valid_after = certificate_validity(not_valid_after)
 
     # Cria os atributos do subject e issuer com os mesmos valores
     subject = issuer = x509.Name(
@@ -120,8 +210,8 @@ def generate_key_and_certificate(user_name: str, certificate_validity: datetime
         .issuer_name(issuer)
         .public_key(private_key.public_key())
         .serial_number(x509.random_serial_number())
-        .not_valid_before(datetime.now())
-        .not_valid_after(certificate_validity)
+        .not_valid_before(not_valid_before)
+        .not_valid_after(not_valid_after)
         .add_extension(
             x509.BasicConstraints(ca=True, path_length=None), 
             critical=True
@@ -140,7 +230,7 @@ def generate_key_and_certificate(user_name: str, certificate_validity: datetime
                 ),              
             critical=True,
         )
-        .sign(private_key, hashes.SHA256(), default_backend())
+        .sign(private_key, _certificate_hash(private_key), default_backend())
     )
 
     # Codifica as chave privadam pública e o Certificado no formato PEM
@@ -155,4 +245,281 @@ def generate_key_and_certificate(user_name: str, certificate_validity: datetime
     )
     cert_pem = cert.public_bytes(encoding=serialization.Encoding.PEM)
 
-    return private_key_pem, public_key_pem, cert_pem
\ No newline at end of file
+    return private_key_pem, public_key_pem, cert_pem
+
+
+def _ca_name(common_name: str) -> x509.Name:
+    return x509.Name(
+        [
+            x509.NameAttribute(NameOID.COMMON_NAME, common_name),
+            x509.NameAttribute(NameOID.ORGANIZATION_NAME, "IPB"),
+            x509.NameAttribute(NameOID.COUNTRY_NAME, "PT"),
+        ]
+    )
+
+
+def _ca_certificate(subject_name, public_key, issuer_name, issuer_key, not_valid_after: datetime, path_length: int, authority_key=None):
+    builder = (
+        x509.CertificateBuilder()
+        .subject_name(subject_name)
+        .issuer_name(issuer_name)
+        .public_key(public_key)
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(datetime.now(timezone.utc))
+        .not_valid_after(not_valid_after)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=path_length), critical=True)
+        .add_extension(
+            x509.KeyUsage(
+                digital_signature=False,
+                content_commitment=False,
+                key_encipherment=False,
+                data_encipherment=False,
+                key_agreement=False,
+                key_cert_sign=True,
+                crl_sign=True,
+                encipher_only=False,
+                decipher_only=False,
+            ),
+            critical=True,
+        )
+        .add_extension(x509.SubjectKeyIdentifier.from_public_key(public_key), critical=False)
+        .add_extension(
+            x509.AuthorityKeyIdentifier.from_issuer_public_key((authority_key or issuer_key).public_key()),
+            critical=False,
+        )
+    )
+    return builder.sign(issuer_key, _certificate_hash(issuer_key), default_backend())
+
+
+def generate_certificate_authority(
+    name: str,
+    key_algorithm: str,
+    root_validity: timedelta,
+    intermediate_validity: timedelta,
+    password: bytes | None = None,
+) -> tuple[bytes, bytes, bytes]:
+    """
+    Gera a CA interna: um certificado raiz autoassinado e um certificado intermediário
+    emitido pela raiz, que é o que emite os certificados dos usuários.
+    Retorna a raiz, o intermediário e a chave privada do intermediário (cifrada com password,
+    se for dada) em formato PEM. A chave privada da raiz não é retornada: só é
+    necessária para assinar o intermediário.
+    """
+    root_key = generate_private_key(key_algorithm)
+    root_name = _ca_name(f"{name} Root CA")
+    root = _ca_certificate(
+        root_name, root_key.public_key(), root_name, root_key,
+        datetime.now(timezone.utc) + root_validity, path_length=1,
+    )
+    intermediate_key = generate_private_key(key_algorithm)
+    intermediate = _ca_certificate(
+        _ca_name(f"{name} Issuing CA"), intermediate_key.public_key(), root_name, root_key,
+        min(datetime.now(timezone.utc) + intermediate_validity, root.not_valid_after_utc),
+        path_length=0,
+    )
+    intermediate_key_pem = intermediate_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=(
+            serialization.BestAvailableEncryption(password) if password else serialization.NoEncryption()
+        ),
+    )
+    return (
+        root.public_bytes(serialization.Encoding.PEM),
+        intermediate.public_bytes(serialization.Encoding.PEM),
+        intermediate_key_pem,
+    )
+
+
+def issue_certificate(
+    ca_certificate: Certificate,
+    ca_private_key,
+    public_key: bytes,
+    user_name: str,
+    email: str,
+    user_id: str | None = None,
+    not_valid_after: datetime | None = None,
+    crl_url: str | None = None,
+    ocsp_url: str | None = None,
+) -> bytes:
+    """
+    Emite, com a CA interna, o certificado de um usuário para a chave pública dada
+    (PEM). Ao contrário dos certificados autoassinados, é um certificado final
+    (BasicConstraints ca=False) e identifica o usuário pelo e-mail
+    (SubjectAlternativeName) e pelo id (atributo UID do subject), para que a
+    validação não precise consultar o banco de dados.
+    A validade (CERTIFICATE_VALIDITY_DAYS dias por padrão, ver certificate_validity)
+    não ultrapassa a do certificado da CA.
+    crl_url e ocsp_url indicam onde consultar o estado de revogação do certificado.
+    Retorna o certificado em formato PEM.
+    """
+    attributes = [
+        x509.NameAttribute(NameOID.COMMON_NAME, user_name),
+        x509.NameAttribute(NameOID.ORGANIZATION_NAME, "IPB"),
+        x509.NameAttribute(NameOID.COUNTRY_NAME, "PT"),
+    ]
+    if user_id:
+        attributes.append(x509.NameAttribute(NameOID.USER_ID, str(user_id)))
+    leaf_public_key = serialization.load_pem_public_key(public_key, default_backend())
+    not_valid_before, not_valid_after = certificate_validity(not_valid_after)
+    not_valid_after = min(not_valid_after, ca_certificate.not_valid_after_utc)
+    builder = (
+        x509.CertificateBuilder()
+        .subject_name(x509.Name(attributes))
+        .issuer_name(ca_certificate.subject)
+        .public_key(leaf_public_key)
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(not_valid_before)
+        .not_valid_after(not_valid_after)
+        .add_extension(x509.BasicConstraints(ca=False, path_length=None), critical=True)
+        .add_extension(
+            x509.KeyUsage(
+                digital_signature=True,
+                content_commitment=True,
+                key_encipherment=False,
+                data_encipherment=False,
+                key_agreement=False,
+                key_cert_sign=False,
+                crl_sign=False,
+                encipher_only=False,
+                decipher_only=False,
+            ),
+            critical=True,
+        )
+        .add_extension(x509.SubjectAlternativeName([x509.RFC822Name(email)]), critical=False)
+        .add_extension(x509.SubjectKeyIdentifier.from_public_key(leaf_public_key), critical=False)
+        .add_extension(
+            x509.AuthorityKeyIdentifier.from_issuer_public_key(ca_private_key.public_key()),
+            critical=False,
+        )
+    )
+    if crl_url:
+        builder = builder.add_extension(
+            x509.CRLDistributionPoints(
+                [x509.DistributionPoint([x509.UniformResourceIdentifier(crl_url)], None, None, None)]
+            ),
+            critical=False,
+        )
+    if ocsp_url:
+        builder = builder.add_extension(
+            x509.AuthorityInformationAccess(
+                [x509.AccessDescription(AuthorityInformationAccessOID.OCSP, x509.UniformResourceIdentifier(ocsp_url))]
+            ),
+            critical=False,
+        )
+    cert = builder.sign(ca_private_key, _certificate_hash(ca_private_key), default_backend())
+    return cert.public_bytes(encoding=serialization.Encoding.PEM)
+
+
+def build_crl(
+    ca_certificate: Certificate,
+    ca_private_key,
+    revoked: list[dict],
+    last_update: datetime,
+    next_update: datetime,
+    crl_number: int,
+) -> bytes:
+    """
+    Gera a CRL da CA com os certificados revogados (dicionários com serial_number,
+    revoked_at e reason, ver services.revocation). Retorna a CRL em formato DER.
+    """
+    builder = (
+        x509.CertificateRevocationListBuilder()
+        .issuer_name(ca_certificate.subject)
+        .last_update(last_update)
+        .next_update(next_update)
+        .add_extension(x509.CRLNumber(crl_number), critical=False)
+        .add_extension(
+            x509.AuthorityKeyIdentifier.from_issuer_public_key(ca_private_key.public_key()),
+            critical=False,
+        )
+    )
+    for entry in revoked:
+        revoked_certificate = (
+            x509.RevokedCertificateBuilder()
+            .serial_number(entry["serial_number"])
+            .revocation_date(entry["revoked_at"])
+        )
+        # O motivo "unspecified" não deve ser incluído (RFC 5280)
+        if entry["reason"] != "unspecified":
+            revoked_certificate = revoked_certificate.add_extension(
+                x509.CRLReason(x509.ReasonFlags[entry["reason"]]), critical=False
+            )
+        builder = builder.add_revoked_certificate(revoked_certificate.build())
+    crl = builder.sign(ca_private_key, _certificate_hash(ca_private_key))
+    return crl.public_bytes(serialization.Encoding.DER)
+
+
+def build_ocsp_response(
+    ca_certificate: Certificate,
+    ca_private_key,
+    request_der: bytes,
+    status,
+    this_update: datetime,
+    next_update: datetime,
+) -> bytes:
+    """
+    Responde a um pedido OCSP (DER) em nome da CA. status(serial_number) retorna o
+    registro de revogação do certificado (ver services.revocation) ou None se não estiver
+    revogado. Certificados de outros emissores têm o estado "unknown".
+    Retorna a resposta OCSP em formato DER.
+    """
+    import hashlib
+    from asn1crypto import keys
+    from cryptography.x509 import ocsp
+
+    try:
+        request = ocsp.load_der_ocsp_request(request_der)
+    except ValueError:
+        return ocsp.OCSPResponseBuilder.build_unsuccessful(
+            ocsp.OCSPResponseStatus.MALFORMED_REQUEST
+        ).public_bytes(serialization.Encoding.DER)
+
+    algorithm = request.hash_algorithm
+    public_key_info = keys.PublicKeyInfo.load(
+        ca_certificate.public_key().public_bytes(
+            serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+    )
+    # Hash do nome e da chave pública (sem o byte de bits não usados) do emissor
+    name_hash = hashlib.new(algorithm.name, ca_certificate.subject.public_bytes()).digest()
+    key_hash = hashlib.new(algorithm.name, public_key_info["public_key"].contents[1:]).digest()
+
+    revocation_time = revocation_reason = None
+    if (request.issuer_name_hash, request.issuer_key_hash) != (name_hash, key_hash):
+        cert_status = ocsp.OCSPCertStatus.UNKNOWN
+    else:
+        entry = status(request.serial_number)
+        if entry is None:
+            cert_status = ocsp.OCSPCertStatus.GOOD
+        else:
+            cert_status = ocsp.OCSPCertStatus.REVOKED
+            revocation_time = entry["revoked_at"]
+            revocation_reason = x509.ReasonFlags[entry["reason"]]
+    response = (
+        ocsp.OCSPResponseBuilder()
+        .add_response_by_hash(
+            request.issuer_name_hash,
+            request.issuer_key_hash,
+            request.serial_number,
+            algorithm,
+            cert_status,
+            this_update,
+            next_update,
+            revocation_time,
+            revocation_reason,
+        )
+        .responder_id(ocsp.OCSPResponderEncoding.HASH, ca_certificate)
+        .certificates([ca_certificate])
+        .sign(ca_private_key, _certificate_hash(ca_private_key))
+    )
+    return response.public_bytes(serialization.Encoding.DER)
+
+
+def generate_keys_and_certificates(user_names: list[str], key_algorithm: str = KEY_ALGORITHM) -> list[tuple[bytes, bytes, bytes]]:
+    """
+    Gera as chaves e o certificado de vários usuários (ver generate_key_and_certificate),
+    pela ordem de user_names. Utilizada pelo provisionamento em lote
+    (services.provisioning), uma tarefa do pool de processos por bloco de usuários.
+    """
+    return [generate_key_and_certificate(name, key_algorithm=key_algorithm) for name in user_names]
\ No newline at end of file
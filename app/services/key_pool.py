@@ -0,0 +1,186 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from config import (
+    KEY_POOL_SIZE,
+    KEY_POOL_LOW_WATER,
+    KEY_POOL_WORKERS,
+    KEY_POOL_BATCH,
+    KEY_ALGORITHM,
+    CPU_POOL_START_METHOD,
+)
+
+# Janela (em segundos) utilizada para calcular o ritmo de geração de chaves
+REFILL_RATE_WINDOW = 60
+
+
+def _low_priority_worker():
+    """
+    Inicializador dos processos que geram chaves: baixa a prioridade do processo para
+    que a geração de chaves não atrase a assinatura e a validação de documentos.
+    """
+    if hasattr(os, "nice"):
+        try:
+            os.nice(19)
+        except OSError:
+            pass
+    import services.key_and_certificate_services  # noqa: F401
+
+
+class KeyPool:
+    """
+    Pares de chaves (PEM) do algoritmo por padrão (config.KEY_ALGORITHM) gerados
+    antecipadamente, para que a criação de chaves e certificados não tenha de esperar
+    pela geração de uma chave, que é lenta e de duração muito variável.
+
+    As chaves são geradas por um pool de processos próprio, de baixa prioridade, até o
+    pool ter size chaves, sempre que o número de chaves desce abaixo de low_water.
+    take() é O(1) e retorna None se o pool estiver vazio; take_or_generate() gera
+    então a chave no pedido.
+    """
+
+    def __init__(
+        self,
+        size: int = KEY_POOL_SIZE,
+        low_water: int = KEY_POOL_LOW_WATER,
+        workers: int = KEY_POOL_WORKERS,
+        batch: int = KEY_POOL_BATCH,
+        algorithm: str = KEY_ALGORITHM,
+        start_method: str = CPU_POOL_START_METHOD,
+    ):
+        self.size = max(0, size)
+        self.low_water = min(max(0, low_water), self.size)
+        self.workers = max(1, workers)
+        self.batch = max(1, batch)
+        self.algorithm = algorithm
+        self.start_method = start_method
+        self._keys: deque[tuple[bytes, bytes]] = deque()
+        self._low = asyncio.Event()
+        self._executor: ProcessPoolExecutor | None = None
+        self._task: asyncio.Task | None = None
+        self._generated_at: deque[float] = deque()
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+
+    def __len__(self):
+        return len(self._keys)
+
+    async def start(self):
+        if self.size == 0:
+            return
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context(self.start_method),
+            initializer=_low_priority_worker,
+        )
+        # Ativado para que o primeiro reabastecimento comece logo na inicialização
+        self._low = asyncio.Event()
+        self._low.set()
+        self._task = asyncio.create_task(self._refill())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def take(self) -> tuple[bytes, bytes] | None:
+        """
+        Retira um par de chaves (privada, pública) do pool, ou None se estiver vazio.
+        """
+        try:
+            key_pair = self._keys.popleft()
+            self.hits += 1
+        except IndexError:
+            key_pair = None
+            self.misses += 1
+        if len(self._keys) < self.low_water:
+            self._low.set()
+        return key_pair
+
+    async def take_or_generate(self, algorithm: str | None = None) -> tuple[bytes, bytes]:
+        """
+        Retira um par de chaves do pool ou, se estiver vazio, o gera no pedido (em uma
+        thread, para não bloquear o event loop). Chaves de outros algoritmos que não o
+        do pool são sempre geradas no pedido.
+        """
+        from starlette.concurrency import run_in_threadpool
+        from services.key_and_certificate_services import generate_key_pair
+
+        algorithm = algorithm or self.algorithm
+        key_pair = self.take() if algorithm == self.algorithm else None
+        if key_pair is None:
+            key_pair = await run_in_threadpool(generate_key_pair, algorithm)
+        return key_pair
+
+    async def _refill(self):
+        from services.key_and_certificate_services import generate_key_pairs
+
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._low.wait()
+            self._low.clear()
+            while len(self._keys) < self.size:
+                missing = self.size - len(self._keys)
+                # Uma tarefa por processo, cada uma com no máximo batch chaves
+                counts = [
+                    min(self.batch, missing - i * self.batch)
+                    for i in range(min(self.workers, -(-missing // self.batch)))
+                ]
+                try:
+                    results = await asyncio.gather(
+                        *[
+                            loop.run_in_executor(
+                                self._executor, generate_key_pairs, count, self.algorithm
+                            )
+                            for count in counts
+                        ]
+                    )
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"Erro ao gerar chaves para o pool: {e}")
+                    await asyncio.sleep(1)
+                    continue
+                now = time.monotonic()
+                for key_pairs in results:
+                    for key_pair in key_pairs:
+                        if len(self._keys) < self.size:
+                            self._keys.append(key_pair)
+                        self._generated_at.append(now)
+                        self.generated += 1
+
+    def refill_rate(self) -> float:
+        """
+        Chaves geradas por segundo no último minuto.
+        """
+        cutoff = time.monotonic() - REFILL_RATE_WINDOW
+        while self._generated_at and self._generated_at[0] < cutoff:
+            self._generated_at.popleft()
+        return len(self._generated_at) / REFILL_RATE_WINDOW
+
+    def stats(self) -> dict:
+        return {
+            "algorithm": self.algorithm,
+            "depth": len(self._keys),
+            "size": self.size,
+            "low_water": self.low_water,
+            "hits": self.hits,
+            "misses": self.misses,
+            "generated": self.generated,
+            "refill_rate": round(self.refill_rate(), 3),
+        }
+
+
+key_pool = KeyPool()
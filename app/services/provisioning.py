@@ -0,0 +1,250 @@
+import asyncio
+from datetime import datetime, timezone
+from itertools import islice
+
+from bson import ObjectId
+
+from config import KEY_ALGORITHM, PROVISION_CHUNK_SIZE
+from utils.crypto_utils import certificate_expiry
+from utils.process_pool import CpuExecutor, CpuPoolBusyError, cpu_executor
+
+# Tentativas (com um segundo de intervalo) de enviar um bloco para o pool de processos
+# enquanto este está cheio com pedidos interativos
+BUSY_RETRIES = 30
+
+
+class Provisioner:
+    """
+    Provisionamento em lote das chaves e certificados de muitos usuários (ex: um
+    departamento inteiro), em vez de um pedido /create_key_and_certificate por usuário.
+
+    Cada lote é um job na coleção provisioning_jobs. Os usuários são obtidos com uma
+    única consulta $in, as chaves e certificados são gerados em blocos de chunk_size
+    usuários em paralelo no pool de processos e cada bloco é gravado com um único
+    bulk_write. Com a CA interna ativa, os processos geram apenas os pares de chaves e
+    os certificados são emitidos pela CA neste processo. O id do job é gravado em cada
+    usuário (provisioning_job) na mesma escrita que as chaves, por isso um job
+    interrompido pode ser retomado sem voltar a gerar as chaves dos usuários já
+    provisionados. As chaves privadas desses usuários foram entregues pela
+    execução anterior, ou se perderam com ela: cada execução os registra no job
+    (needs_rekey), para que o manifesto os indique e, se as chaves não chegaram, sejam
+    emitidas de novo (/create_key_and_certificate).
+    """
+
+    def __init__(self, db, executor: CpuExecutor = cpu_executor, chunk_size: int = PROVISION_CHUNK_SIZE):
+        self.db = db
+        self.executor = executor
+        self.chunk_size = max(1, chunk_size)
+
+    async def create_job(self, user_ids: list[str], key_algorithm: str = KEY_ALGORITHM) -> dict:
+        now = datetime.now(timezone.utc)
+        job = {
+            "_id": ObjectId(),
+            # Sem repetições, mantendo a ordem do pedido
+            "user_ids": list(dict.fromkeys(str(user_id) for user_id in user_ids)),
+            "key_algorithm": key_algorithm,
+            "status": "pending",
+            "issued": 0,
+            "failed": [],
+            "created_at": now,
+            "updated_at": now,
+        }
+        await self.db.provisioning_jobs.insert_one(job)
+        return job
+
+    async def get_job(self, job_id: str) -> dict | None:
+        if not ObjectId.is_valid(job_id):
+            return None
+        return await self.db.provisioning_jobs.find_one({"_id": ObjectId(job_id)})
+
+    async def run(self, job: dict):
+        """
+        Executa (ou retoma) um job. Retorna um gerador assíncrono que produz, por cada
+        bloco gravado, a lista das credenciais emitidas (user_id, email, private_key,
+        public_key, certificate). As chaves privadas não são guardadas: quem consome o
+        gerador é responsável por entregá-las.
+        """
+        from services.certificate_authority import CA_ISSUER, certificate_authority
+        from services.certificate_store import certificate_record, certificate_store
+        from services.key_and_certificate_services import (
+            generate_key_pairs,
+            generate_keys_and_certificates,
+        )
+        from services.trust_store import trust_store
+        from services.user_loader import user_loader
+        from services.verification_cache import validation_generation, verification_cache
+
+        job_id = job["_id"]
+        key_algorithm = job["key_algorithm"]
+        ids = [ObjectId(user_id) for user_id in job["user_ids"]]
+        users = {
+            user["_id"]: user
+            async for user in self.db.users.find(
+                {"_id": {"$in": ids}},
+                {"name": 1, "email": 1, "provisioning_job": 1},
+            )
+        }
+        failed = [
+            {"user_id": str(user_id), "error": "Usuário não encontrado"}
+            for user_id in ids
+            if user_id not in users
+        ]
+        found = [users[user_id] for user_id in ids if user_id in users]
+        pending = [user for user in found if user.get("provisioning_job") != job_id]
+        needs_rekey = [
+            {"user_id": str(user["_id"]), "email": user["email"]}
+            for user in found
+            if user.get("provisioning_job") == job_id
+        ]
+        await self._update(
+            job_id,
+            status="running",
+            issued=len(needs_rekey),
+            failed=failed,
+            needs_rekey=needs_rekey,
+        )
+
+        chunks = iter([pending[i : i + self.chunk_size] for i in range(0, len(pending), self.chunk_size)])
+
+        async def run_in_pool(fn, *args):
+            for attempt in range(BUSY_RETRIES):
+                try:
+                    return await self.executor.run(fn, *args)
+                except CpuPoolBusyError:
+                    if attempt == BUSY_RETRIES - 1:
+                        raise
+                    await asyncio.sleep(1)
+
+        async def generate(chunk):
+            if not certificate_authority.active:
+                return await run_in_pool(
+                    generate_keys_and_certificates, [user["name"] for user in chunk], key_algorithm
+                )
+            key_pairs = await run_in_pool(generate_key_pairs, len(chunk), key_algorithm)
+            return [
+                (private_key, public_key, certificate_authority.issue(public_key, user["name"], user["email"], user["_id"]))
+                for user, (private_key, public_key) in zip(chunk, key_pairs)
+            ]
+
+        async def store(chunk, credentials) -> list[dict]:
+            from pymongo import UpdateOne
+
+            now = datetime.now(timezone.utc)
+            result = await self.db.users.bulk_write(
+                [
+                    UpdateOne(
+                        # Não substitui chaves emitidas por outra execução do mesmo job
+                        {"_id": user["_id"], "provisioning_job": {"$ne": job_id}},
+                        {
+                            "$set": {
+                                "public_key": public_key,
+                                "key_algorithm": key_algorithm,
+                                "certificate": certificate,
+                                "certificate_issuer": CA_ISSUER if certificate_authority.active else "self_signed",
+                                "certificate_updated_at": now,
+                                "certificate_not_valid_after": certificate_expiry(certificate),
+                                "provisioning_job": job_id,
+                            }
+                        },
+                    )
+                    for user, (_, public_key, certificate) in zip(chunk, credentials)
+                ],
+                ordered=False,
+            )
+            issued = list(zip(chunk, credentials))
+            if result.matched_count < len(chunk):
+                # Só são entregues as chaves que ficaram de fato gravadas
+                stored = {
+                    user["_id"]: user.get("certificate")
+                    async for user in self.db.users.find(
+                        {"_id": {"$in": [user["_id"] for user in chunk]}, "provisioning_job": job_id},
+                        {"certificate": 1},
+                    )
+                }
+                issued = [
+                    (user, credential) for user, credential in issued
+                    if stored.get(user["_id"]) == credential[2]
+                ]
+            await certificate_store.record_many(
+                [
+                    certificate_record(user["_id"], certificate, CA_ISSUER if certificate_authority.active else "self_signed", now)
+                    for user, (_, _, certificate) in issued
+                ]
+            )
+            # Depois de gravar os registros, que o user_loader carrega com os usuários
+            user_loader.invalidate_many(user["_id"] for user in chunk)
+            return [
+                {
+                    "user_id": str(user["_id"]),
+                    "name": user["name"],
+                    "email": user["email"],
+                    "private_key": private_key,
+                    "public_key": public_key,
+                    "certificate": certificate,
+                }
+                for user, (private_key, public_key, certificate) in issued
+            ]
+
+        async def process(chunk):
+            try:
+                return chunk, await store(chunk, await generate(chunk)), None
+            except TimeoutError:
+                return chunk, [], "Tempo limite excedido ao gerar as chaves"
+            except Exception as e:
+                return chunk, [], f"Erro ao gerar as chaves: {e}"
+
+        # Mantém no máximo um bloco por processo do pool em execução
+        tasks = {asyncio.create_task(process(chunk)) for chunk in islice(chunks, self.executor.max_workers)}
+        try:
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    chunk, issued, error = task.result()
+                    if error:
+                        failed.extend({"user_id": str(user["_id"]), "error": error} for user in chunk)
+                    for credential in issued:
+                        if certificate_authority.active:
+                            # Validados pela cadeia até a raiz da CA, sem entrar no trust store
+                            trust_store.remove_user(credential["user_id"])
+                        else:
+                            trust_store.add_certificate(
+                                credential["user_id"], credential["name"], credential["email"], credential["certificate"]
+                            )
+                    await self.db.provisioning_jobs.update_one(
+                        {"_id": job_id},
+                        {
+                            "$inc": {"issued": len(issued)},
+                            "$set": {"failed": failed, "updated_at": datetime.now(timezone.utc)},
+                        },
+                    )
+                    if issued:
+                        yield issued
+                    chunk = next(chunks, None)
+                    if chunk:
+                        tasks.add(asyncio.create_task(process(chunk)))
+            await self._update(job_id, status="completed")
+        finally:
+            # Interrompido (ex: o cliente se desconectou): o job fica "running" e pode ser retomado
+            for task in tasks:
+                task.cancel()
+            await verification_cache.invalidate(validation_generation())
+
+    async def _update(self, job_id, **fields):
+        fields["updated_at"] = datetime.now(timezone.utc)
+        await self.db.provisioning_jobs.update_one({"_id": job_id}, {"$set": fields})
+
+
+def job_summary(job: dict) -> dict:
+    """
+    Estado de um job sem a lista de usuários, para as respostas da API.
+    """
+    return {
+        "job_id": str(job["_id"]),
+        "status": job["status"],
+        "key_algorithm": job["key_algorithm"],
+        "total": len(job["user_ids"]),
+        "issued": job["issued"],
+        "failed": job["failed"],
+        "created_at": job["created_at"].isoformat(),
+        "updated_at": job["updated_at"].isoformat(),
+    }
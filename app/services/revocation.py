@@ -0,0 +1,305 @@
+import asyncio
+import hashlib
+from datetime import datetime, timedelta, timezone
+
+from cryptography import x509
+
+from config import CRL_UPDATE_INTERVAL
+from utils.cache import TTLCache
+from utils.crypto_utils import certificate_fingerprint, load_certificate, revocation_key
+from utils.date_utils import as_utc
+
+# Motivos de revogação aceitos (a suspensão, certificate_hold, não é suportada)
+REVOCATION_REASONS = tuple(
+    flag.name
+    for flag in x509.ReasonFlags
+    if flag not in (x509.ReasonFlags.remove_from_crl, x509.ReasonFlags.certificate_hold)
+)
+
+
+class RevocationService:
+    """
+    Certificados revogados, guardados na coleção revoked_certificates e mantidos em
+    memória em um dicionário indexado por emissor e número de série
+    (utils.crypto_utils.revocation_key), para que a validação não consulte a base de
+    dados em cada pedido.
+
+    A cada update_interval segundos (o nextUpdate da CRL) o conjunto é recarregado do
+    banco de dados e a CRL da CA interna é gerada de novo, com o número seguinte de um
+    contador guardado na coleção certificate_authority (compartilhado pelos processos,
+    por isso sempre crescente). As revogações feitas neste processo têm efeito
+    imediato; as feitas em outros processos chegam por um change stream da coleção
+    (sem change streams, no recarregamento seguinte). is_revoked responde a partir do
+    conjunto em memória e só consulta o banco de dados se este tiver passado do
+    nextUpdate sem ser recarregado. As respostas OCSP são geradas a partir do mesmo
+    conjunto e guardadas em cache até o nextUpdate.
+    """
+
+    def __init__(self, update_interval: float = CRL_UPDATE_INTERVAL):
+        self.update_interval = update_interval
+        self.collection = None
+        self.counters = None
+        self._revoked: dict[str, dict] = {}
+        self._generation = 0
+        self._tasks: list[asyncio.Task] = []
+        self._reload_lock = asyncio.Lock()
+        self._mode = "stopped"
+        self._ocsp_cache = TTLCache(4096, update_interval)
+        self.crl: bytes | None = None
+        self.this_update: datetime | None = None
+        self.next_update: datetime | None = None
+
+    def __len__(self):
+        return len(self._revoked)
+
+    @property
+    def generation(self) -> str:
+        """
+        Identificador do conjunto de certificados revogados, calculado a partir do
+        conteúdo, como services.trust_store.TrustStore.generation.
+        """
+        return f"{self._generation:064x}"
+
+    async def start(self, db):
+        self.collection = db.revoked_certificates
+        self.counters = db.certificate_authority
+        await self.collection.create_index("key", unique=True)
+        await self.collection.create_index("user_id")
+        self._reload_lock = asyncio.Lock()
+        await self.load()
+        await self._publish()
+        self._mode = "polling"
+        self._tasks = [asyncio.create_task(self._run()), asyncio.create_task(self._keep_current())]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        self._mode = "stopped"
+
+    async def load(self):
+        """
+        Carrega todos os certificados revogados do banco de dados. As revogações não
+        são removidas, por isso as já em memória (ex: recebidas pelo change stream
+        durante a leitura) são mantidas.
+        """
+        async for entry in self.collection.find({}, {"_id": 0}):
+            self._add(entry)
+
+    def _stale(self) -> bool:
+        return self.next_update is None or datetime.now(timezone.utc) >= self.next_update
+
+    async def _reload(self):
+        """
+        Recarrega o conjunto e gera a CRL de novo, se tiver passado do nextUpdate. Os
+        pedidos concorrentes esperam pelo mesmo recarregamento.
+        """
+        async with self._reload_lock:
+            if self._stale():
+                await self.load()
+                await self._publish()
+
+    async def _run(self):
+        while True:
+            delay = (self.next_update - datetime.now(timezone.utc)).total_seconds()
+            await asyncio.sleep(max(1, delay))
+            try:
+                await self._reload()
+            except Exception as e:
+                print(f"Erro ao atualizar os certificados revogados: {e}")
+                await asyncio.sleep(min(60, self.update_interval))
+
+    async def _keep_current(self):
+        try:
+            await self._watch()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Change streams só existem em replica sets / clusters
+            print(f"Change stream indisponível, recarregando a cada nextUpdate: {e}")
+        self._mode = "polling"
+
+    async def _watch(self):
+        async with self.collection.watch([{"$match": {"operationType": "insert"}}]) as stream:
+            self._mode = "change_stream"
+            async for change in stream:
+                # Revogação feita em outro processo (as deste já estão no conjunto)
+                entry = dict(change["fullDocument"])
+                entry.pop("_id", None)
+                if self._add(entry):
+                    await self._republish()
+
+    def _add(self, entry: dict) -> bool:
+        """
+        Acrescenta uma revogação ao conjunto. Retorna False se já estava nele.
+        """
+        if entry["key"] in self._revoked:
+            return False
+        self._revoked[entry["key"]] = entry
+        self._generation ^= _digest(entry["key"])
+        return True
+
+    async def _next_crl_number(self) -> int:
+        """
+        Número da próxima CRL, de um contador no banco de dados comum a todos os
+        processos (o instante da CRL não serve: se repete entre processos e no mesmo
+        segundo).
+        """
+        from pymongo import ReturnDocument
+
+        counter = await self.counters.find_one_and_update(
+            {"_id": "crl_number"}, {"$inc": {"value": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+        )
+        return counter["value"]
+
+    async def _publish(self):
+        """
+        Gera a CRL da CA interna (se estiver ativa) e marca o próximo nextUpdate.
+        """
+        from services.certificate_authority import certificate_authority
+
+        this_update = datetime.now(timezone.utc).replace(microsecond=0)
+        next_update = this_update + timedelta(seconds=self.update_interval)
+        crl = None
+        if certificate_authority.active:
+            crl = certificate_authority.sign_crl(
+                [
+                    {
+                        "serial_number": int(entry["serial_number"], 16),
+                        "revoked_at": as_utc(entry["revoked_at"]),
+                        "reason": entry["reason"],
+                    }
+                    for entry in self._revoked.values()
+                    if entry["issuer"] == _issuer_hash(certificate_authority)
+                ],
+                this_update,
+                next_update,
+                await self._next_crl_number(),
+            )
+        self.crl, self.this_update, self.next_update = crl, this_update, next_update
+        self._ocsp_cache.clear()
+
+    async def revoke(self, certificate: bytes, user_id, reason: str = "unspecified") -> dict:
+        """
+        Revoga um certificado (PEM ou DER). Revogar um certificado já revogado retorna
+        o registro existente.
+        """
+        from pymongo.errors import DuplicateKeyError
+
+        if reason not in REVOCATION_REASONS:
+            raise ValueError(f"Motivo de revogação inválido: {reason}")
+        loaded = load_certificate(certificate)
+        issuer = loaded.issuer.public_bytes()
+        key = revocation_key(issuer, loaded.serial_number)
+        if key in self._revoked:
+            return self._revoked[key]
+        entry = {
+            "key": key,
+            "serial_number": f"{loaded.serial_number:x}",
+            "issuer": hashlib.sha256(issuer).hexdigest(),
+            "fingerprint": certificate_fingerprint(certificate),
+            "user_id": str(user_id),
+            "reason": reason,
+            "revoked_at": datetime.now(timezone.utc).replace(microsecond=0),
+        }
+        try:
+            await self.collection.insert_one(dict(entry))
+        except DuplicateKeyError:
+            # Revogado ao mesmo tempo em outro processo
+            entry = await self.collection.find_one({"key": key}, {"_id": 0})
+        self._add(entry)
+        await self._republish()
+        return entry
+
+    async def _republish(self):
+        try:
+            await self._publish()
+        except Exception as e:
+            # A revogação já está gravada; a CRL é gerada de novo no próximo intervalo
+            print(f"Erro ao gerar a CRL: {e}")
+
+    def status(self, issuer: bytes | None, serial_number: int | None) -> dict | None:
+        """
+        Registro de revogação do certificado, ou None se não estiver revogado.
+        """
+        if issuer is None or serial_number is None:
+            return None
+        return self._revoked.get(revocation_key(issuer, serial_number))
+
+    async def is_revoked(self, certificate: bytes) -> bool:
+        """
+        Indica se o certificado (PEM ou DER) está revogado, a partir do conjunto em
+        memória. Só consulta o banco de dados se o conjunto tiver passado do
+        nextUpdate sem ser recarregado (ex: o banco de dados esteve indisponível).
+        """
+        if self._stale():
+            await self._reload()
+        loaded = load_certificate(certificate)
+        return revocation_key(loaded.issuer.public_bytes(), loaded.serial_number) in self._revoked
+
+    def revoked_for(self, identifiers: list[dict]) -> dict[str, dict]:
+        """
+        Certificados revogados entre os signatários indicados (ver
+        services.signer_services.signer_identifiers), no formato enviado para a
+        validação no pool de processos.
+        """
+        revoked = {}
+        for identifier in identifiers:
+            entry = self.status(identifier["issuer"], identifier["serial_number"])
+            if entry is not None:
+                revoked[entry["key"]] = public_entry(entry)
+        return revoked
+
+    def ocsp_response(self, request: bytes) -> bytes:
+        """
+        Resposta OCSP (DER) a um pedido OCSP (DER), assinada pela CA interna.
+        """
+        from services.certificate_authority import certificate_authority
+
+        request_hash = hashlib.sha256(request).hexdigest()
+        response = self._ocsp_cache.get(request_hash)
+        if response is None:
+            def status(serial_number: int):
+                entry = self.status(certificate_authority.issuer_name, serial_number)
+                if entry is None:
+                    return None
+                return {"revoked_at": as_utc(entry["revoked_at"]), "reason": entry["reason"]}
+
+            response = certificate_authority.respond_ocsp(request, status, self.this_update, self.next_update)
+            self._ocsp_cache.set(request_hash, response)
+        return response
+
+    def stats(self) -> dict:
+        return {
+            "revoked": len(self),
+            "mode": self._mode,
+            "this_update": self.this_update.isoformat() if self.this_update else None,
+            "next_update": self.next_update.isoformat() if self.next_update else None,
+            "ocsp_cache": self._ocsp_cache.stats(),
+        }
+
+
+def public_entry(entry: dict) -> dict:
+    """
+    Registro de revogação com tipos simples, para as respostas da API.
+    """
+    return {
+        "serial_number": entry["serial_number"],
+        "reason": entry["reason"],
+        "revoked_at": as_utc(entry["revoked_at"]).isoformat(),
+    }
+
+
+def _digest(key: str) -> int:
+    return int.from_bytes(hashlib.sha256(f"revoked|{key}".encode()).digest(), "big")
+
+
+def _issuer_hash(certificate_authority) -> str:
+    return hashlib.sha256(certificate_authority.issuer_name).hexdigest()
+
+
+revocation = RevocationService()
@@ -1,23 +1,42 @@
 from typing import Dict, Optional
-from PyPDF2 import PdfReader
 from cryptography.hazmat.backends import default_backend
 from datetime import datetime
 from cryptography.hazmat.primitives import serialization
-from cryptography.hazmat.primitives.serialization import pkcs12
-from cryptography.x509 import load_pem_x509_certificate
 from models.signer import Signer
+from utils.crypto_utils import load_certificate
 from endesive import pdf
 
 def sign_document(document: bytes, signer: Signer):
     pass
 
 
+def load_signing_material(signer: Signer):
+    """
+    Carrega a chave privada e o certificado do Signer para assinar documentos.
+    Separado de sign_pdf para que vários documentos possam ser assinados
+    carregando a chave apenas uma vez.
+    """
+    # Verifica se o Signer tem uma chave privada e um certificado
+    if not signer.private_key or not signer.certificate:
+        raise ValueError("Signer must have a private key and a certificate")
+
+    # Carrega a chave privada
+    private_key = serialization.load_pem_private_key(
+        signer.private_key, password=None, backend=default_backend()
+    )
+
+    # Carrega o certificado do Signer (a partir do cache, se já foi carregado)
+    certificate = load_certificate(signer.certificate)
+    return private_key, certificate
+
+
 def sign_pdf(
     input_file: bytes,
     signer: Signer,
     reason: str | None,
     location: str | None,
     signature_position=(470, 840, 570, 640),
+    signing_material=None,
 ):
     """
     Função para assinar um documento PDF com um certificado digital.
@@ -25,6 +44,8 @@ def sign_pdf(
     o documento a ser assinado, a razão da assinatura e a localização da assinatura.
     O atributo signature_position é uma tupla com as coordenadas da assinatura no documento para
     implementações futuras.
+    Opcionalmente recebe em signing_material a chave e o certificado já carregados
+    por load_signing_material.
     Retorna o documento assinado em bytes.
     """
 
@@ -42,6 +63,21 @@ def sign_pdf(
         raise ValueError("Invalid PDF file")
     ###
 
+    return datau + sign_increment(datau, signer, reason, location, signing_material)
+
+
+def sign_increment(
+    datau,
+    signer: Signer,
+    reason: str | None,
+    location: str | None,
+    signing_material=None,
+) -> bytes:
+    """
+    Gera a atualização incremental (assinatura) a acrescentar ao fim do documento.
+    datau pode ser bytes ou um mmap do arquivo; o documento assinado é datau
+    seguido dos bytes retornados.
+    """
     if not reason:
         reason = f"Documento assinado por {signer.name}"
 
@@ -62,147 +98,733 @@ def sign_pdf(
         "type": "CERTIFICATION",
     }
 
-    # Carrega a chave privada
-    private_key = serialization.load_pem_private_key(
-        signer.private_key, password=None, backend=default_backend()
-    )
+    if signing_material is None:
+        signing_material = load_signing_material(signer)
+    private_key, certificate = signing_material
 
-    # Carrega o certificado do Signer
-    certificate = load_pem_x509_certificate(
-        signer.certificate, backend=default_backend()
-    )
+    from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+    from services.key_and_certificate_services import digest_algorithm_for
 
-    # Serializa a chave privada e o certificado no formato PKCS12
-    pfx_data = pkcs12.serialize_key_and_certificates(
-        name=signer.name.encode(),
-        key=private_key,
-        cert=certificate,
-        cas=None,
-        encryption_algorithm=serialization.NoEncryption(),
-    )
-
-    # Carrega a chave privada e o certificado do PKCS12
-    key, cert, others = pkcs12.load_key_and_certificates(
-        pfx_data, None, default_backend()
-    )
+    algomd = digest_algorithm_for(private_key)
+    othercerts = [load_certificate(cert) for cert in signer.chain]
+    key, hsm, signature_algorithm = private_key, None, None
+    if isinstance(private_key, ec.EllipticCurvePrivateKey):
+        # O tamanho das assinaturas ECDSA varia, por isso é reservado espaço fixo
+        dct["aligned"] = _signature_space(certificate, othercerts)
+        signature_algorithm = f"{algomd}_ecdsa"
+    elif isinstance(private_key, ed25519.Ed25519PrivateKey):
+        # O endesive não assina com Ed25519; a assinatura é feita através da interface HSM
+        key, hsm, signature_algorithm = None, _Ed25519Signer(private_key, certificate), "ed25519"
 
     # Assina o documento utilizando o certificado e a chave privada
     datas = pdf.cms.sign(
         datau=datau,  # PDF data
         udct=dct,  # Signature properties
         key=key,  # Private key
-        cert=cert,  # Certificate
-        othercerts=others,  # Additional certificates
-        algomd="sha256",  # Digest algorithm
+        cert=certificate,  # Certificate
+        othercerts=othercerts,  # Additional certificates (CA intermediária)
+        algomd=algomd,  # Digest algorithm
+        hsm=hsm,
         timestampurl=None,
     )
 
-    return datau + datas
+    if signature_algorithm is not None:
+        # O endesive identifica sempre a assinatura como RSA (PKCS#1 v1.5)
+        datas = _set_signature_algorithm(datas, len(datau), signature_algorithm)
+    return datas
+
+
+def _signature_space(certificate, othercerts=()) -> int:
+    """
+    Número de bytes a reservar no /Contents para o CMS: os certificados incluídos
+    mais uma margem para os atributos assinados e a assinatura.
+    """
+    from cryptography.hazmat.primitives import serialization
+
+    der = serialization.Encoding.DER
+    return 1024 + sum(len(cert.public_bytes(der)) for cert in (certificate, *othercerts))
+
+
+class _Ed25519Signer:
+    """
+    Implementa a interface HSM do endesive (certificate/sign) para assinar com uma
+    chave Ed25519, que o endesive não suporta diretamente.
+    """
+
+    def __init__(self, private_key, certificate):
+        from cryptography.hazmat.primitives import serialization
+
+        self.private_key = private_key
+        self.certificate_der = certificate.public_bytes(serialization.Encoding.DER)
+
+    def certificate(self):
+        return None, self.certificate_der
+
+    def sign(self, keyid, data, mech):
+        return self.private_key.sign(data)
+
+
+def _set_signature_algorithm(datas: bytes, startdata: int, algorithm: str) -> bytes:
+    """
+    Altera o algoritmo de assinatura indicado no SignerInfo do CMS gerado pelo
+    endesive. O algoritmo não faz parte dos dados assinados, por isso a assinatura
+    continua válida; o CMS é escrito no mesmo espaço, completado com zeros.
+    """
+    from asn1crypto import algos, cms
+    from utils.pdf_utils import _parse_byte_range
+
+    start1, length1, start2, _ = _parse_byte_range(datas, datas.rfind(b"/ByteRange"))
+    begin = start1 + length1 - startdata + 1
+    end = start2 - startdata - 1
+    signed_data = cms.ContentInfo.load(bytes.fromhex(datas[begin:end].decode("ascii")), strict=False)
+    signer_info = signed_data["content"]["signer_infos"][0]
+    signer_info["signature_algorithm"] = algos.SignedDigestAlgorithm({"algorithm": algorithm})
+    contents = signed_data.dump(force=True).hex().encode("ascii")
+    if len(contents) > end - begin:
+        raise ValueError("O espaço reservado para a assinatura é insuficiente")
+    return datas[:begin] + contents.ljust(end - begin, b"0") + datas[end:]
 
 
-async def verify_document(
-    document: bytes, trusted_signers: list
+def sign_pdf_file(
+    input_path: str,
+    output_path: str,
+    signer: Signer,
+    reason: str | None,
+    location: str | None,
+    signature_position=(470, 840, 570, 640),
+) -> dict:
+    """
+    Assina o documento guardado em input_path e escreve o documento assinado em
+    output_path. O documento original é lido através de um mmap e copiado em disco,
+    sem passar pela memória do processo que trata o pedido.
+    Retorna o hash e o tamanho do documento assinado.
+    """
+    from utils.crypto_utils import StreamingHasher
+    from utils.upload_utils import open_view, iter_file
+
+    with open_view(input_path) as datau:
+        if datau[:7] != b"%PDF-1.":
+            raise ValueError("Invalid PDF file")
+        datas = sign_increment(datau, signer, reason, location)
+
+    # Copia o original e acrescenta a assinatura, calculando o hash na mesma passagem
+    hasher = StreamingHasher("sha256")
+    with open(output_path, "wb") as f:
+        for chunk in iter_file(input_path):
+            f.write(chunk)
+            hasher.update(chunk)
+        f.write(datas)
+        hasher.update(datas)
+
+    return {"hash": hasher.hexdigest(), "size": hasher.size}
+
+
+def verify_document_file(
+    path: str,
+    trusted_signers: list,
+    fields: list | None = None,
+    authorities: list[bytes] = (),
+    revoked: dict | None = None,
+) -> Optional[Dict]:
+    """
+    Versão de verify_document para documentos guardados em disco, lidos através de um mmap.
+    """
+    from utils.upload_utils import open_view
+
+    with open_view(path) as document:
+        return verify_document(document, trusted_signers, fields, authorities, revoked)
+
+
+def read_signatures(path: str) -> tuple:
+    """
+    Encontra as assinaturas de um documento guardado em disco (ver
+    utils.pdf_utils.find_signatures) e os identificadores do signatário de cada uma
+    (signer_identifiers). O resultado pode ser passado a verify_document_file para que
+    o documento não seja interpretado outra vez.
+    Antes de interpretar o documento é feita uma verificação rápida
+    (File.get_signature_status); arquivos que não são PDF ou não têm assinaturas são
+    rejeitados sem serem interpretados. Retorna (estado, assinaturas, identificadores
+    por assinatura) ou lança PdfSyntaxError / ValueError.
+    A função é síncrona para poder ser executada no pool de processos.
+    """
+    from models.file import File, SignatureStatus
+    from utils.pdf_utils import find_signatures
+    from utils.upload_utils import open_view
+
+    with open_view(path) as document:
+        status = File.get_signature_status(document)
+        if status != SignatureStatus.SIGNED:
+            return status, [], []
+        fields = find_signatures(document)
+    try:
+        identifiers = [signer_identifiers(field) for field in fields]
+    except Exception as e:
+        raise ValueError(str(e)) from e
+    return status, fields, identifiers
+
+
+def signer_identifiers(field) -> list[dict]:
+    """
+    Identificadores do signatário de cada SignerInfo do CMS de uma assinatura:
+    o emissor (DER) e número de série ou o Subject Key Identifier indicados no
+    SignerIdentifier, e a impressão digital SHA-256 do certificado embutido que lhe
+    corresponde (None se o CMS não o incluir). Permitem encontrar o usuário
+    através de um índice em vez de comparar com todos os certificados conhecidos.
+    """
+    import hashlib
+    from asn1crypto import cms
+
+    signed_data = cms.ContentInfo.load(field.contents)["content"]
+    identifiers = []
+    for signer_info in signed_data["signer_infos"]:
+        sid = signer_info["sid"]
+        identifier = {
+            "issuer": None,
+            "serial_number": None,
+            "key_identifier": None,
+            "fingerprint": None,
+        }
+        if sid.name == "issuer_and_serial_number":
+            identifier["issuer"] = sid.chosen["issuer"].dump()
+            identifier["serial_number"] = sid.chosen["serial_number"].native
+        else:
+            identifier["key_identifier"] = sid.chosen.native
+        for choice in signed_data["certificates"] or []:
+            if choice.name != "certificate":
+                continue
+            embedded = choice.chosen
+            if sid.name == "issuer_and_serial_number":
+                matches = (
+                    embedded.serial_number == identifier["serial_number"]
+                    and embedded.issuer.dump() == identifier["issuer"]
+                )
+            else:
+                matches = embedded.key_identifier == identifier["key_identifier"]
+            if matches:
+                identifier["fingerprint"] = hashlib.sha256(embedded.dump()).hexdigest()
+                identifier["key_identifier"] = embedded.key_identifier or identifier["key_identifier"]
+                identifier["issuer"] = embedded.issuer.dump()
+                identifier["serial_number"] = embedded.serial_number
+                break
+        identifiers.append(identifier)
+    return identifiers
+
+
+def sign_pdf_batch(
+    documents: list[tuple[str, bytes]],
+    signer: Signer,
+    reason: str | None,
+    location: str | None,
+    signature_position=(470, 840, 570, 640),
+) -> list[dict]:
+    """
+    Assina vários documentos PDF com o mesmo Signer, carregando a chave privada e o
+    certificado apenas uma vez. Recebe uma lista de tuplas (nome do arquivo, conteúdo).
+    Uma falha em um documento não interrompe os demais: cada documento tem o seu
+    resultado, com o documento assinado em base64 ou com a mensagem de erro.
+    """
+    import base64
+    from utils.crypto_utils import create_hash
+
+    try:
+        signing_material = load_signing_material(signer)
+    except Exception as e:
+        return [
+            {"filename": filename, "status": "error", "error": f"Erro ao carregar a chave: {e}"}
+            for filename, _ in documents
+        ]
+
+    results = []
+    for filename, content in documents:
+        try:
+            signed_document = sign_pdf(
+                content, signer, reason, location, signature_position, signing_material
+            )
+            results.append(
+                {
+                    "filename": filename.replace(".pdf", "-signed.pdf"),
+                    "status": "ok",
+                    "hash": create_hash(signed_document),
+                    "size": len(signed_document),
+                    "signed_document": base64.b64encode(signed_document).decode("utf-8"),
+                }
+            )
+        except Exception as e:
+            results.append({"filename": filename, "status": "error", "error": str(e)})
+    return results
+
+
+class TrustAnchors:
+    """
+    Certificados em que a aplicação confia para validar assinaturas.
+    Um certificado que seja exatamente um dos certificados confiáveis (comparado pela
+    impressão digital SHA-256) é aceito diretamente, o que é o caso dos certificados
+    autoassinados dos usuários; os demais têm de formar uma cadeia válida até
+    um dos certificados confiáveis ou até uma das raízes de authorities (a CA interna,
+    ver services.certificate_authority).
+    revoked são os certificados revogados, indexados por
+    utils.crypto_utils.revocation_key (ver services.revocation.RevocationService.revoked_for);
+    um certificado revogado nunca é confiável.
+    """
+
+    def __init__(self, certificates: list[bytes], authorities: list[bytes] = (), revoked: dict | None = None):
+        from utils.crypto_utils import certificate_fingerprint
+
+        self.certificates = {certificate_fingerprint(cert): cert for cert in certificates}
+        self.authorities = list(authorities)
+        self.revoked = revoked or {}
+        self._verifier = None
+
+    def _chain_verifier(self):
+        from cryptography.x509.verification import PolicyBuilder, Store
+
+        if self._verifier is None:
+            store = Store(
+                [load_certificate(cert) for cert in [*self.certificates.values(), *self.authorities]]
+            )
+            self._verifier = PolicyBuilder().store(store).max_chain_depth(4).build_client_verifier()
+        return self._verifier
+
+    def is_pinned(self, certificate) -> bool:
+        """
+        Indica se o certificado é um dos certificados confiáveis (e não uma cadeia).
+        """
+        from cryptography.hazmat.primitives import hashes
+
+        return certificate.fingerprint(hashes.SHA256()).hex() in self.certificates
+
+    def revocation(self, certificate) -> dict | None:
+        """
+        Registro de revogação do certificado, ou None se não estiver revogado.
+        """
+        from utils.crypto_utils import revocation_key
+
+        if not self.revoked:
+            return None
+        return self.revoked.get(revocation_key(certificate.issuer.public_bytes(), certificate.serial_number))
+
+    def is_trusted(self, certificate, intermediates: list) -> bool:
+        from datetime import timezone
+        from cryptography.hazmat.primitives import hashes
+
+        if not self.certificates and not self.authorities:
+            return False
+        fingerprint = certificate.fingerprint(hashes.SHA256()).hex()
+        if fingerprint in self.certificates:
+            now = datetime.now(timezone.utc)
+            return certificate.not_valid_before_utc <= now <= certificate.not_valid_after_utc
+        try:
+            self._chain_verifier().verify(certificate, intermediates)
+            return True
+        except Exception:
+            return False
+
+
+def _signer_certificate(signed_data, signer_info):
+    """
+    Procura, entre os certificados embutidos no CMS, o certificado identificado pelo
+    SignerIdentifier (emissor e número de série ou Subject Key Identifier).
+    Retorna o certificado do signatário e a lista dos demais certificados.
+    """
+    from cryptography import x509
+
+    sid = signer_info["sid"]
+    certificate = None
+    others = []
+    for choice in signed_data["certificates"] or []:
+        if choice.name != "certificate":
+            continue
+        embedded = choice.chosen
+        if sid.name == "issuer_and_serial_number":
+            matches = (
+                embedded.serial_number == sid.chosen["serial_number"].native
+                and embedded.issuer == sid.chosen["issuer"]
+            )
+        else:
+            matches = embedded.key_identifier == sid.chosen.native
+        loaded = x509.load_der_x509_certificate(embedded.dump())
+        if matches and certificate is None:
+            certificate = loaded
+        else:
+            others.append(loaded)
+    return certificate, others
+
+
+# Algoritmos de hash aceitos nas assinaturas (MD5 e SHA-1 não são seguros)
+DIGEST_ALGORITHMS = ("sha256", "sha384", "sha512")
+
+
+def _verify_cms_signature(public_key, signer_info, signed_bytes: bytes, digest_algorithm: str) -> bool:
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import ec, ed25519, padding, rsa
+
+    if digest_algorithm not in DIGEST_ALGORITHMS:
+        return False
+    signature = signer_info["signature"].native
+    hash_algorithm = getattr(hashes, digest_algorithm.upper())()
+    try:
+        if isinstance(public_key, ec.EllipticCurvePublicKey):
+            public_key.verify(signature, signed_bytes, ec.ECDSA(hash_algorithm))
+        elif isinstance(public_key, ed25519.Ed25519PublicKey):
+            public_key.verify(signature, signed_bytes)
+        elif isinstance(public_key, rsa.RSAPublicKey):
+            signature_algorithm = signer_info["signature_algorithm"]
+            if signature_algorithm.signature_algo == "rsassa_pss":
+                parameters = signature_algorithm["parameters"]
+                pss_digest = parameters["hash_algorithm"]["algorithm"].native
+                if pss_digest not in DIGEST_ALGORITHMS:
+                    return False
+                pss_hash = getattr(hashes, pss_digest.upper())()
+                public_key.verify(
+                    signature,
+                    signed_bytes,
+                    padding.PSS(padding.MGF1(pss_hash), parameters["salt_length"].native),
+                    pss_hash,
+                )
+            else:
+                public_key.verify(signature, signed_bytes, padding.PKCS1v15(), hash_algorithm)
+        else:
+            return False
+    except InvalidSignature:
+        return False
+    return True
+
+
+def _invalid_signature(error: str) -> dict:
+    return {
+        "hash_ok": False,
+        "signature_ok": False,
+        "certificate_ok": False,
+        "certificate": None,
+        "signing_time": None,
+        "revocation": None,
+        "error": error,
+    }
+
+
+def verify_signature(document, field, trust_anchors: TrustAnchors) -> dict:
+    """
+    Verifica uma assinatura encontrada por utils.pdf_utils.find_signatures.
+    O hash das partes assinadas é calculado diretamente sobre o documento (bytes ou
+    mmap), sem as concatenar. Retorna o estado do hash, da assinatura e do certificado,
+    e o certificado do signatário, e a data de assinatura dos atributos assinados do
+    CMS (None se não existir). Se o certificado estiver revogado, o registro de
+    revogação segue em "revocation" e o certificado não é confiável.
+    """
+    import hashlib
+    from asn1crypto import cms, core
+
+    signed_data = cms.ContentInfo.load(field.contents)["content"]
+    # O documento é assinado por um único signatário em cada assinatura
+    if len(signed_data["signer_infos"]) != 1:
+        return _invalid_signature("A assinatura deve ter exatamente um SignerInfo")
+    signer_info = signed_data["signer_infos"][0]
+    digest_algorithm = signer_info["digest_algorithm"]["algorithm"].native
+    if digest_algorithm not in DIGEST_ALGORITHMS:
+        return _invalid_signature(f"Algoritmo de hash não aceito: {digest_algorithm}")
+
+    digest = hashlib.new(digest_algorithm)
+    for part in field.signed_ranges(document):
+        digest.update(part)
+    document_digest = digest.digest()
+
+    signed_attrs = signer_info["signed_attrs"]
+    signing_time = None
+    if signed_attrs is not None and not isinstance(signed_attrs, core.Void) and len(signed_attrs):
+        message_digest = None
+        for attr in signed_attrs:
+            if attr["type"].native == "message_digest":
+                message_digest = attr["values"][0].native
+            elif attr["type"].native == "signing_time":
+                signing_time = attr["values"][0].native
+        # Os atributos assinados são codificados como SET OF (0x31)
+        signed_bytes = b"\x31" + signed_attrs.dump()[1:]
+    else:
+        message_digest = document_digest
+        signed_bytes = b"".join(bytes(part) for part in field.signed_ranges(document))
+    hash_ok = message_digest == document_digest
+
+    certificate, others = _signer_certificate(signed_data, signer_info)
+    if certificate is None:
+        return {
+            "hash_ok": hash_ok,
+            "signature_ok": False,
+            "certificate_ok": False,
+            "certificate": None,
+            "signing_time": signing_time,
+            "revocation": None,
+        }
+    signature_ok = _verify_cms_signature(
+        certificate.public_key(), signer_info, signed_bytes, digest_algorithm
+    )
+    # Sem carimbo temporal confiável, a data de assinatura não prova que a assinatura
+    # é anterior à revogação, por isso um certificado revogado invalida a assinatura
+    revocation = trust_anchors.revocation(certificate)
+    return {
+        "hash_ok": hash_ok,
+        "signature_ok": signature_ok,
+        "certificate_ok": revocation is None and trust_anchors.is_trusted(certificate, others),
+        "certificate": certificate,
+        "signing_time": signing_time,
+        "revocation": revocation,
+    }
+
+
+def signature_metadata(field, certificate) -> dict:
+    """
+    Dados da assinatura lidos do dicionário de assinatura. Se o dicionário não tiver
+    /Name, é utilizado o nome comum (CN) do certificado do signatário.
+    """
+    from cryptography.x509.oid import NameOID
+
+    name = field.text("/Name")
+    if not name and certificate is not None:
+        common_names = certificate.subject.get_attributes_for_oid(NameOID.COMMON_NAME)
+        name = common_names[0].value if common_names else ""
+    return {
+        "name": name,
+        "reason": field.text("/Reason"),
+        "location": field.text("/Location"),
+        "data": field.text("/M"),
+        "contact": field.text("/Contact"),
+    }
+
+
+def certificate_identity(certificate) -> dict:
+    """
+    Usuário identificado em um certificado emitido pela CA interna: id (atributo UID),
+    nome (CN) e e-mail (SubjectAlternativeName).
+    """
+    from cryptography import x509
+    from cryptography.x509.oid import NameOID
+
+    def attribute(oid):
+        values = certificate.subject.get_attributes_for_oid(oid)
+        return values[0].value if values else None
+
+    try:
+        emails = certificate.extensions.get_extension_for_class(
+            x509.SubjectAlternativeName
+        ).value.get_values_for_type(x509.RFC822Name)
+    except x509.ExtensionNotFound:
+        emails = []
+    return {
+        "user_id": attribute(NameOID.USER_ID),
+        "name": attribute(NameOID.COMMON_NAME) or "",
+        "email": emails[0] if emails else None,
+    }
+
+
+def trusted_signer(
+    result: dict, metadata: dict, signers_by_fingerprint: dict, trust_anchors: TrustAnchors | None = None
+) -> Optional[Dict]:
+    """
+    Usuário da aplicação que fez a assinatura: o dono do certificado que assinou,
+    desde que o e-mail em /Contact (onde o endesive guarda o e-mail do signatário)
+    seja o dele. Um certificado validado por cadeia até a CA interna identifica ele
+    próprio o usuário (certificate_identity). Retorna None se a assinatura não for
+    de um signatário confiável.
+    """
+    from cryptography.hazmat.primitives import hashes
+
+    if result["certificate"] is None:
+        return None
+    signer = signers_by_fingerprint.get(result["certificate"].fingerprint(hashes.SHA256()).hex())
+    if (
+        signer is None
+        and trust_anchors is not None
+        and trust_anchors.authorities
+        and result["certificate_ok"]
+        and not trust_anchors.is_pinned(result["certificate"])
+    ):
+        signer = certificate_identity(result["certificate"])
+    if signer is None or not signer["email"] or metadata["contact"] != signer["email"]:
+        return None
+    return signer
+
+
+def verify_revision(
+    document, field, trusted_signers: list, authorities: list[bytes] = (), revoked: dict | None = None
+) -> dict:
+    """
+    Relatório de uma assinatura (revisão) do documento: intervalo de bytes assinado,
+    signatário, data de assinatura, estado do hash, da assinatura e do certificado e
+    registro de revogação do certificado (revocation).
+    authorities são as raízes da CA interna e revoked os certificados revogados (ver
+    TrustAnchors).
+    O resultado contém apenas tipos simples para poder ser retornado pelo pool de
+    processos.
+    """
+    from utils.crypto_utils import certificate_fingerprint
+
+    trust_anchors = TrustAnchors([signer["certificate"] for signer in trusted_signers], authorities, revoked)
+    signers_by_fingerprint = {
+        certificate_fingerprint(signer["certificate"]): signer for signer in trusted_signers
+    }
+    report = {
+        "byte_range": list(field.byte_range),
+        "signed_until": field.signed_until,
+        "signer": None,
+        "trusted_signer": None,
+        "signing_time": field.text("/M"),
+        "hash_ok": False,
+        "signature_ok": False,
+        "certificate_ok": False,
+        "revocation": None,
+        "validated": False,
+    }
+    try:
+        result = verify_signature(document, field, trust_anchors)
+    except Exception as exc:
+        report["error"] = str(exc)
+        return report
+
+    if "error" in result:
+        report["error"] = result["error"]
+    metadata = signature_metadata(field, result["certificate"])
+    signer = trusted_signer(result, metadata, signers_by_fingerprint, trust_anchors)
+    report.update(
+        signer=metadata,
+        trusted_signer={"name": signer["name"], "email": signer["email"]} if signer else None,
+        hash_ok=result["hash_ok"],
+        signature_ok=result["signature_ok"],
+        certificate_ok=result["certificate_ok"],
+        revocation=result["revocation"],
+        validated=bool(
+            result["hash_ok"] and result["signature_ok"] and result["certificate_ok"] and signer
+        ),
+    )
+    # A data dos atributos assinados do CMS é preferível à do dicionário (/M)
+    if result["signing_time"] is not None:
+        report["signing_time"] = result["signing_time"].isoformat()
+    return report
+
+
+def verify_revision_file(
+    path: str, field, trusted_signers: list, authorities: list[bytes] = (), revoked: dict | None = None
+) -> dict:
+    """
+    Versão de verify_revision para documentos guardados em disco, lidos através de um
+    mmap. Cada assinatura pode assim ser verificada em um processo diferente.
+    """
+    from utils.upload_utils import open_view
+
+    with open_view(path) as document:
+        return verify_revision(document, field, trusted_signers, authorities, revoked)
+
+
+def revision_changes(fields: list, document_size: int) -> list[dict]:
+    """
+    Para cada assinatura, indica se o documento foi alterado depois dela e se essas
+    alterações estão cobertas por uma assinatura posterior. Alterações depois da última
+    assinatura não estão assinadas por ninguém.
+    """
+    changes = []
+    for index, field in enumerate(fields):
+        later = [other for other in fields[index + 1 :] if other.signed_until > field.signed_until]
+        last_signed = max((other.signed_until for other in later), default=field.signed_until)
+        changes.append(
+            {
+                "modified_after": field.signed_until < document_size,
+                "later_signatures": len(later),
+                "unsigned_changes_after": last_signed < document_size,
+            }
+        )
+    return changes
+
+
+def verify_document(
+    document: bytes,
+    trusted_signers: list,
+    fields: list | None = None,
+    authorities: list[bytes] = (),
+    revoked: dict | None = None,
 ) -> Optional[Dict]:
     """
     Essa função recebe um documento PDF e uma lista de signatários confiáveis.
     Os signatários são apenas os existentes na base de dados da aplicação.
     Se o documento foi assinado por um signatário confiável, a função retorna
     os dados da assinatura.
+    O documento é percorrido uma única vez para encontrar as assinaturas; essa mesma
+    leitura serve para a verificação criptográfica e para obter os dados da assinatura.
+    Se as assinaturas já tiverem sido encontradas (read_signatures), são passadas em fields.
+    authorities são as raízes da CA interna: os certificados emitidos por ela são
+    validados pela cadeia e não precisam estar em trusted_signers. revoked são os
+    certificados revogados (ver TrustAnchors); se o signatário da última assinatura
+    estiver revogado, o registro de revogação é retornado em "revocation".
+    A função é síncrona para poder ser executada no pool de processos.
     """
-    from endesive import pdf
-    from io import BytesIO
-
-    print("Verifying document")
-    pdf_bytes = BytesIO(document)
-    # try:
-    #     pdf_document = PdfReader(pdf_bytes)
-    # except Exception as exc:
-    #     print('Error reading PDF')
-    #     print(exc)
-    #     return False
-    validated = False
-    signatures = []
-    verify_result = []
-    trusted_cert_pems = [signer["certificate"] for signer in trusted_signers]
-    trusted_signers = [signer["email"] for signer in trusted_signers]
+    from utils.crypto_utils import certificate_fingerprint
+    from utils.pdf_utils import find_signatures, PdfSyntaxError
+
+    try:
+        if fields is None:
+            fields = find_signatures(document)
+    except PdfSyntaxError as exc:
+        return {"validated": False, "signatures": None, "error": str(exc)}
+    if not fields:
+        return {"validated": False, "signatures": None}
+    # Alterações depois da última assinatura não estão assinadas por ninguém (a mesma
+    # regra do relatório por assinatura, ver revision_changes)
+    if revision_changes(fields, len(document))[-1]["unsigned_changes_after"]:
+        return {
+            "validated": False,
+            "signatures": None,
+            "error": "O documento foi alterado depois da última assinatura",
+        }
+
+    trust_anchors = TrustAnchors([signer["certificate"] for signer in trusted_signers], authorities, revoked)
+    signers_by_fingerprint = {
+        certificate_fingerprint(signer["certificate"]): signer for signer in trusted_signers
+    }
+    validated = True
     try:
-        # Verifica a assinatura do documento
-        verify_result = pdf.verify(document, trusted_cert_pems)
-        for hashok, signatureok, certok in verify_result:
-            # Verifica se foi assinado com um certificado confiável
-            print(f"Signature: {signatureok}, Hash: {hashok}, Cert: {certok}")
-            validated = signatureok and hashok and certok
+        for field in fields:
+            result = verify_signature(document, field, trust_anchors)
+            if "error" in result:
+                return {"validated": False, "signatures": None, "error": result["error"]}
+            # Todas as assinaturas têm de estar intactas, não apenas a última
+            validated = validated and result["signature_ok"] and result["hash_ok"]
     except Exception as exc:
-        print('failed to verify')
-        print(exc)
         return {
-            "validated": validated,
+            "validated": False,
             "signatures": None,
             "error": str(exc)
         }
-    if validated:
-        signatures = extract_signature(pdf_bytes)
-        if not signatures or not isinstance(signatures, dict):
-            validated = False
-        else:
-            if not signatures.get("name"):
-                validated = False
-            else:
-                # Verifica se a assinatura foi feita por um signatário confiável
-                for signer in trusted_signers:
-                    if signer == signatures.get("name"):
-                        validated = True
-                        break
-    else:
-        return {
+    # O signatário da última assinatura, a que cobre o documento, tem de ser confiável
+    if not validated or not result["certificate_ok"]:
+        res = {
             "validated": False,
             "signatures": None
         }
+        if result["revocation"] is not None:
+            res["revocation"] = result["revocation"]
+        return res
+
+    signatures = signature_metadata(fields[-1], result["certificate"])
+    # Verifica se a assinatura foi feita por um signatário confiável
+    validated = trusted_signer(result, signatures, signers_by_fingerprint, trust_anchors) is not None
     return {"validated": validated, "signatures": signatures}
 
 
-def extract_signature(pdf_bytes: bytes):
+def warm_up() -> bool:
     """
-    Essa função tenta obter os dados da assinatura de um documento PDF.
+    Assina e valida um documento em branco com uma chave temporária, para que o código
+    de assinatura e de validação (endesive, PyPDF2, cryptography, asn1crypto) fique
+    importado e inicializado antes do primeiro pedido.
+    Retorna True se o documento assinado foi validado.
     """
-    try:
-        if pdf_bytes:
-            reader = PdfReader(pdf_bytes)
-
-            root_obj = reader.trailer["/Root"].get_object()
-
-            # Verificar se há um formulário AcroForm
-            if "/AcroForm" not in root_obj:
-                return "Nenhum formulário AcroForm encontrado."
-
-            acroform_obj = root_obj["/AcroForm"].get_object()  # Resolver IndirectObject
-
-            # Verificar se há campos
-            if "/Fields" not in acroform_obj:
-                return "Nenhum campo de assinatura encontrado."
-
-            fields = acroform_obj["/Fields"]  # Lista de campos do PDF
-
-            for field in fields:
-                field_obj = field.get_object()  # Resolvendo o IndirectObject
-                if field_obj.get("/FT") == "/Sig":  # Verifica se é uma assinatura
-                    signature = field_obj.get("/V")  # Pega o valor da assinatura
-                    if signature:
-                        signature_obj = (
-                            signature.get_object()
-                            if isinstance(signature, type(field))
-                            else signature
-                        )
-
-                        signature_data = {
-                            "name": signature_obj.get("/Name", ""),
-                            "reason": signature_obj.get("/Reason", ""),
-                            "location": signature_obj.get("/Location", ""),
-                            "data": signature_obj.get("/M", ""),
-                        }
-                        return signature_data
-            return "Nenhuma assinatura encontrada."
-        else:
-            return "Arquivo PDF vazio"
-    except Exception as e:
-        return f"Erro ao extrair assinatura: {str(e)}"
+    import io
+    from PyPDF2 import PdfWriter
+    from services.key_and_certificate_services import generate_key_and_certificate
+
+    writer = PdfWriter()
+    writer.add_blank_page(width=595, height=842)
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    private_key, public_key, certificate = generate_key_and_certificate("Warm-up")
+    signer = Signer("Warm-up", "warm-up@localhost", private_key, public_key, certificate)
+    signed = sign_pdf(buffer.getvalue(), signer, "Warm-up", None)
+    result = verify_document(signed, [{"certificate": certificate, "email": signer.email}])
+    return bool(result and result["validated"])
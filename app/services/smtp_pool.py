@@ -0,0 +1,276 @@
+import asyncio
+import smtplib
+import ssl
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.message import Message
+
+from config import (
+    SMTP_SERVER,
+    SMTP_PORT,
+    SMTP_USER,
+    SMTP_PASSWORD,
+    SMTP_STARTTLS,
+    SMTP_POOL_SIZE,
+    SMTP_IDLE_TIMEOUT,
+    SMTP_TIMEOUT,
+)
+
+
+def _stale(error: Exception) -> bool:
+    """
+    Indica se o erro significa que a sessão já não serve (conexão fechada pelo servidor,
+    ex: por inatividade, ou erro de rede), e não que a mensagem foi recusada.
+    """
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    if isinstance(error, smtplib.SMTPResponseException):
+        # 421: o servidor vai fechar a conexão
+        return error.smtp_code == 421
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+def _close(session: smtplib.SMTP):
+    try:
+        session.quit()
+    except Exception:
+        session.close()
+
+
+class SmtpServerPool:
+    """
+    Sessões SMTP (já com STARTTLS e autenticadas) de um servidor, reutilizadas entre
+    envios. O smtplib é síncrono, por isso cada envio é executado em uma thread de um
+    pool próprio do servidor, com tantas threads como max_sessions: o número de
+    sessões abertas simultaneamente nunca passa de max_sessions e os demais envios
+    esperam (semáforo) sem bloquear o event loop.
+
+    Uma sessão inativa há mais de idle_timeout segundos é fechada em vez de
+    reutilizada. Uma sessão reutilizada é verificada com NOOP antes do envio e, se o
+    servidor já a tiver fechado, substituída por uma nova. O envio (MAIL FROM, RCPT e
+    DATA) nunca é repetido: uma falha no meio, sobretudo depois do DATA, pode acontecer
+    com a mensagem já aceita pelo servidor, e repeti-la entregaria a mensagem duas vezes.
+
+    Se o pedido que envia for cancelado, o envio continua na sua thread e a sessão
+    volta ao pool (ou é fechada) quando terminar.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        user: str | None = None,
+        password: str | None = None,
+        starttls: bool = True,
+        max_sessions: int = SMTP_POOL_SIZE,
+        idle_timeout: float = SMTP_IDLE_TIMEOUT,
+        timeout: float = SMTP_TIMEOUT,
+    ):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.max_sessions = max(1, max_sessions)
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=self.max_sessions, thread_name_prefix="smtp")
+        self._semaphore = asyncio.Semaphore(self.max_sessions)
+        # Sessões livres e o instante (monotonic) em que foram usadas pela última vez
+        self._idle: list[tuple[smtplib.SMTP, float]] = []
+        self.in_use = 0
+        self.sent = 0
+        self.failed = 0
+        self.connections = 0
+        self.reconnects = 0
+
+    def _connect(self) -> smtplib.SMTP:
+        session = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            session.ehlo()
+            if self.starttls:
+                session.starttls(context=ssl.create_default_context())
+                session.ehlo()
+            if self.user:
+                session.login(self.user, self.password)
+        except Exception:
+            session.close()
+            raise
+        self.connections += 1
+        return session
+
+    def _deliver(self, session: smtplib.SMTP | None, from_addr: str, to_addrs: list[str], message: Message):
+        """
+        Envia a mensagem (executado em uma thread do pool). Retorna uma tupla (sessão,
+        erro), sem lançar exceções: a sessão que pode voltar a ser usada (None se foi
+        fechada) e o erro do envio, se houve.
+        """
+        if session is not None:
+            try:
+                code, reply = session.noop()
+                if code != 250:
+                    raise smtplib.SMTPResponseException(code, reply)
+            except Exception:
+                # Fechada pelo servidor (ex: por inatividade): a mensagem ainda não foi enviada
+                session.close()
+                session = None
+                self.reconnects += 1
+        if session is None:
+            try:
+                session = self._connect()
+            except Exception as e:
+                return None, e
+        try:
+            session.sendmail(from_addr, to_addrs, message.as_bytes())
+            return session, None
+        except Exception as e:
+            if _stale(e):
+                session.close()
+                return None, e
+            return session, e
+
+    def _checkout(self) -> smtplib.SMTP | None:
+        """
+        Sessão livre usada mais recentemente, ou None se não houver nenhuma. As sessões
+        inativas há mais de idle_timeout segundos são fechadas.
+        """
+        now = time.monotonic()
+        while self._idle:
+            session, last_used = self._idle.pop()
+            if now - last_used < self.idle_timeout:
+                return session
+            self._executor.submit(_close, session)
+        return None
+
+    async def send(self, message: Message, from_addr: str, to_addrs: list[str]):
+        """
+        Envia a mensagem (MIME) de from_addr para to_addrs. Lança as exceções do
+        smtplib se o envio falhar.
+        """
+        await self._semaphore.acquire()
+        self.in_use += 1
+        session = self._checkout()
+        try:
+            future = asyncio.get_running_loop().run_in_executor(
+                self._executor, self._deliver, session, from_addr, to_addrs, message
+            )
+        except BaseException:
+            self._release(None)
+            if session is not None:
+                session.close()
+            raise
+        # A sessão e o semáforo são liberados quando o envio termina, mesmo que o pedido
+        # seja cancelado antes (shield: o cancelamento não chega ao envio)
+        future.add_done_callback(self._finished)
+        session, error = await asyncio.shield(future)
+        if error is not None:
+            raise error
+
+    def _finished(self, future: asyncio.Future):
+        if future.cancelled() or future.exception() is not None:
+            self.failed += 1
+            self._release(None)
+            return
+        session, error = future.result()
+        if error is None:
+            self.sent += 1
+        else:
+            self.failed += 1
+        self._release(session)
+
+    def _release(self, session: smtplib.SMTP | None):
+        if session is not None:
+            self._idle.append((session, time.monotonic()))
+        self.in_use -= 1
+        self._semaphore.release()
+
+    def close(self):
+        """
+        Fecha as sessões livres (QUIT) e o pool de threads.
+        """
+        idle, self._idle = self._idle, []
+        for session, _ in idle:
+            self._executor.submit(_close, session)
+        self._executor.shutdown(wait=True)
+
+    def stats(self) -> dict:
+        return {
+            "max_sessions": self.max_sessions,
+            "in_use": self.in_use,
+            "idle": len(self._idle),
+            "sent": self.sent,
+            "failed": self.failed,
+            "connections": self.connections,
+            "reconnects": self.reconnects,
+        }
+
+
+class SmtpPool:
+    """
+    Pools de sessões SMTP (SmtpServerPool), um por servidor e usuário, criados no
+    primeiro envio para cada servidor. Por padrão é usado o servidor definido em
+    config (SMTP_SERVER, SMTP_PORT, SMTP_USER e SMTP_PASSWORD).
+    """
+
+    def __init__(
+        self,
+        host: str | None = SMTP_SERVER,
+        port: int = SMTP_PORT,
+        user: str | None = SMTP_USER,
+        password: str | None = SMTP_PASSWORD,
+        starttls: bool = SMTP_STARTTLS,
+        max_sessions: int = SMTP_POOL_SIZE,
+        idle_timeout: float = SMTP_IDLE_TIMEOUT,
+    ):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self._servers: dict[tuple, SmtpServerPool] = {}
+
+    def start(self):
+        # Os semáforos ficam associados ao event loop em que são usados
+        self._servers = {}
+
+    async def stop(self):
+        from starlette.concurrency import run_in_threadpool
+
+        servers, self._servers = self._servers, {}
+        await asyncio.gather(*[run_in_threadpool(server.close) for server in servers.values()])
+
+    def server(
+        self, host: str | None = None, port: int | None = None, user: str | None = None, password: str | None = None
+    ) -> SmtpServerPool:
+        """
+        Pool de sessões do servidor indicado (por padrão, o de config).
+        """
+        if host is None:
+            host, port, user, password = self.host, self.port, self.user, self.password
+        if not host:
+            raise RuntimeError("O servidor SMTP não está configurado (SMTP_SERVER)")
+        key = (host, port, user)
+        server = self._servers.get(key)
+        if server is None:
+            server = SmtpServerPool(
+                host, port, user, password, self.starttls, self.max_sessions, self.idle_timeout
+            )
+            self._servers[key] = server
+        return server
+
+    async def send(self, message: Message, from_addr: str, to_addrs: list[str]):
+        """
+        Envia a mensagem através do servidor SMTP de config.
+        """
+        await self.server().send(message, from_addr, to_addrs)
+
+    def stats(self) -> dict:
+        return {
+            f"{user}@{host}:{port}" if user else f"{host}:{port}": server.stats()
+            for (host, port, user), server in self._servers.items()
+        }
+
+
+smtp_pool = SmtpPool()
@@ -0,0 +1,286 @@
+import asyncio
+import hashlib
+import time
+from datetime import datetime, timezone
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes
+
+from config import TRUST_STORE_POLL_INTERVAL, TRUST_STORE_FULL_RELOAD_INTERVAL
+from services.certificate_authority import CA_ISSUER
+from utils.crypto_utils import load_certificate
+
+
+class TrustedCertificate:
+    """
+    Certificado de um usuário guardado no trust store, com os identificadores
+    pelos quais pode ser encontrado já calculados.
+    """
+
+    def __init__(self, user_id: str, name: str, email: str, certificate: bytes):
+        self.user_id = user_id
+        self.name = name
+        self.email = email
+        self.certificate = certificate
+        loaded = load_certificate(certificate)
+        self.fingerprint = loaded.fingerprint(hashes.SHA256()).hex()
+        self.issuer = loaded.issuer.public_bytes()
+        self.serial_number = loaded.serial_number
+        try:
+            self.key_identifier = loaded.extensions.get_extension_for_class(
+                x509.SubjectKeyIdentifier
+            ).value.digest
+        except x509.ExtensionNotFound:
+            self.key_identifier = x509.SubjectKeyIdentifier.from_public_key(
+                loaded.public_key()
+            ).digest
+        # Identifica o conteúdo da entrada para calcular TrustStore.generation
+        self.digest = int.from_bytes(
+            hashlib.sha256(f"{user_id}|{self.fingerprint}|{email}".encode()).digest(), "big"
+        )
+
+    def as_trusted_signer(self) -> dict:
+        """
+        Formato esperado por services.signer_services.verify_document.
+        """
+        return {
+            "user_id": self.user_id,
+            "name": self.name,
+            "email": self.email,
+            "certificate": self.certificate,
+        }
+
+
+class TrustStore:
+    """
+    Certificados dos usuários mantidos em memória no processo, indexados por
+    impressão digital SHA-256, Subject Key Identifier e emissor + número de série.
+    É carregado na inicialização e mantido atualizado através de um change stream do
+    MongoDB ou, em servidores standalone, consultando periodicamente os certificados
+    alterados desde a última consulta.
+    Os certificados emitidos pela CA interna (users.certificate_issuer) não são
+    guardados: a validação confia na raiz da CA (services.certificate_authority).
+    """
+
+    def __init__(
+        self,
+        poll_interval: float = TRUST_STORE_POLL_INTERVAL,
+        full_reload_interval: float = TRUST_STORE_FULL_RELOAD_INTERVAL,
+    ):
+        self.poll_interval = poll_interval
+        self.full_reload_interval = full_reload_interval
+        self.version = 0
+        self._generation = 0
+        self._by_user: dict[str, TrustedCertificate] = {}
+        self._by_fingerprint: dict[str, TrustedCertificate] = {}
+        self._by_key_identifier: dict[bytes, list[TrustedCertificate]] = {}
+        self._by_issuer_serial: dict[tuple[bytes, int], TrustedCertificate] = {}
+        self._task: asyncio.Task | None = None
+        self._mode = "stopped"
+
+    def __len__(self):
+        return len(self._by_user)
+
+    @property
+    def generation(self) -> str:
+        """
+        Identificador do conjunto de certificados atual, calculado a partir do conteúdo
+        (e não do número de alterações, como version). Processos com os mesmos
+        certificados têm a mesma geração, o que permite compartilhar resultados de
+        validação guardados no banco de dados.
+        """
+        return f"{self._generation:064x}"
+
+    def _index(self, entry: TrustedCertificate):
+        self._generation ^= entry.digest
+        self._by_user[entry.user_id] = entry
+        self._by_fingerprint[entry.fingerprint] = entry
+        self._by_key_identifier.setdefault(entry.key_identifier, []).append(entry)
+        self._by_issuer_serial[(entry.issuer, entry.serial_number)] = entry
+
+    def _unindex(self, entry: TrustedCertificate):
+        self._generation ^= entry.digest
+        self._by_user.pop(entry.user_id, None)
+        self._by_fingerprint.pop(entry.fingerprint, None)
+        same_key = self._by_key_identifier.get(entry.key_identifier, [])
+        if entry in same_key:
+            same_key.remove(entry)
+        if not same_key:
+            self._by_key_identifier.pop(entry.key_identifier, None)
+        self._by_issuer_serial.pop((entry.issuer, entry.serial_number), None)
+
+    def add_certificate(self, user_id, name: str, email: str, certificate: bytes):
+        """
+        Adiciona ou substitui o certificado de um usuário.
+        """
+        user_id = str(user_id)
+        current = self._by_user.get(user_id)
+        if current is not None:
+            if current.certificate == certificate and current.email == email:
+                return
+            self._unindex(current)
+        self._index(TrustedCertificate(user_id, name, email, certificate))
+        self.version += 1
+
+    def remove_user(self, user_id):
+        current = self._by_user.get(str(user_id))
+        if current is not None:
+            self._unindex(current)
+            self.version += 1
+
+    def _apply_user(self, user: dict):
+        if user.get("certificate") and user.get("certificate_issuer") != CA_ISSUER:
+            try:
+                self.add_certificate(user["_id"], user.get("name", ""), user.get("email", ""), user["certificate"])
+            except ValueError as e:
+                print(f"Certificado inválido do usuário {user['_id']}: {e}")
+        else:
+            self.remove_user(user["_id"])
+
+    def snapshot(self) -> "TrustStore":
+        """
+        Cópia dos índices atuais, que não é alterada por atualizações posteriores.
+        Permite validar um lote de documentos com o mesmo conjunto de certificados.
+        """
+        snapshot = TrustStore(self.poll_interval, self.full_reload_interval)
+        snapshot.version = self.version
+        snapshot._generation = self._generation
+        snapshot._by_user = dict(self._by_user)
+        snapshot._by_fingerprint = dict(self._by_fingerprint)
+        snapshot._by_key_identifier = {
+            key_identifier: list(entries)
+            for key_identifier, entries in self._by_key_identifier.items()
+        }
+        snapshot._by_issuer_serial = dict(self._by_issuer_serial)
+        return snapshot
+
+    def find_by_fingerprint(self, fingerprint: str) -> TrustedCertificate | None:
+        return self._by_fingerprint.get(fingerprint)
+
+    def find_by_key_identifier(self, key_identifier: bytes) -> list[TrustedCertificate]:
+        return list(self._by_key_identifier.get(key_identifier, []))
+
+    def find_by_issuer_serial(self, issuer: bytes, serial_number: int) -> TrustedCertificate | None:
+        return self._by_issuer_serial.get((issuer, serial_number))
+
+    def find_signer(self, identifier: dict) -> list[TrustedCertificate]:
+        """
+        Encontra os certificados candidatos para um signatário identificado por
+        services.signer_services.signer_identifiers, sem percorrer o trust store:
+        primeiro pela impressão digital do certificado embutido, depois pelo emissor e
+        número de série e por fim pelo Subject Key Identifier.
+        """
+        if identifier.get("fingerprint"):
+            entry = self.find_by_fingerprint(identifier["fingerprint"])
+            if entry is not None:
+                return [entry]
+        if identifier.get("issuer") is not None and identifier.get("serial_number") is not None:
+            entry = self.find_by_issuer_serial(identifier["issuer"], identifier["serial_number"])
+            if entry is not None:
+                return [entry]
+        if identifier.get("key_identifier"):
+            return self.find_by_key_identifier(identifier["key_identifier"])
+        return []
+
+    async def load(self, db):
+        """
+        Carrega todos os certificados do banco de dados, substituindo os atuais.
+        """
+        cursor = db.users.find(
+            {"certificate": {"$exists": True}, "certificate_issuer": {"$ne": CA_ISSUER}},
+            {"_id": 1, "name": 1, "email": 1, "certificate": 1},
+        )
+        entries = {}
+        for user in await cursor.to_list(None):
+            if not user.get("certificate"):
+                continue
+            user_id = str(user["_id"])
+            current = self._by_user.get(user_id)
+            if current is not None and current.certificate == user["certificate"] and current.email == user.get("email", ""):
+                entries[user_id] = current
+                continue
+            try:
+                entries[user_id] = TrustedCertificate(
+                    user_id, user.get("name", ""), user.get("email", ""), user["certificate"]
+                )
+            except ValueError as e:
+                print(f"Certificado inválido do usuário {user_id}: {e}")
+
+        # A versão só muda se o conjunto de certificados mudou
+        if entries.keys() == self._by_user.keys() and all(
+            entries[user_id] is self._by_user[user_id] for user_id in entries
+        ):
+            return
+        for entry in list(self._by_user.values()):
+            self._unindex(entry)
+        for entry in entries.values():
+            self._index(entry)
+        self.version += 1
+
+    async def start(self, db):
+        await self.load(db)
+        self._task = asyncio.create_task(self._keep_current(db))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._mode = "stopped"
+
+    async def _keep_current(self, db):
+        try:
+            await self._watch(db)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Change streams só existem em replica sets / clusters
+            print(f"Change stream indisponível, consultando periodicamente: {e}")
+        await self._poll(db)
+
+    async def _watch(self, db):
+        from services.user_loader import user_loader
+
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}}]
+        async with db.users.watch(pipeline, full_document="updateLookup") as stream:
+            self._mode = "change_stream"
+            async for change in stream:
+                # O usuário pode ter sido alterado em outro processo
+                user_loader.invalidate(change["documentKey"]["_id"])
+                if change["operationType"] == "delete":
+                    self.remove_user(change["documentKey"]["_id"])
+                elif change.get("fullDocument"):
+                    self._apply_user(change["fullDocument"])
+
+    async def _poll(self, db):
+        self._mode = "polling"
+        since = datetime.now(timezone.utc)
+        last_full_reload = time.monotonic()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                if time.monotonic() - last_full_reload >= self.full_reload_interval:
+                    # Recarga completa para pegar certificados removidos
+                    since = datetime.now(timezone.utc)
+                    await self.load(db)
+                    last_full_reload = time.monotonic()
+                    continue
+                checked_at = datetime.now(timezone.utc)
+                cursor = db.users.find(
+                    {"certificate_updated_at": {"$gte": since}},
+                    {"_id": 1, "name": 1, "email": 1, "certificate": 1, "certificate_issuer": 1},
+                )
+                for user in await cursor.to_list(None):
+                    self._apply_user(user)
+                since = checked_at
+            except Exception as e:
+                print(f"Erro ao atualizar o trust store: {e}")
+
+    def stats(self) -> dict:
+        return {"certificates": len(self), "version": self.version, "mode": self._mode}
+
+
+trust_store = TrustStore()
@@ -0,0 +1,141 @@
+import asyncio
+
+from bson import ObjectId
+
+from config import USER_CACHE_SIZE, USER_CACHE_TTL, USER_LOADER_BATCH_WINDOW, USER_LOADER_MAX_BATCH
+from services.certificate_store import CURRENT_CERTIFICATE_LOOKUP
+from utils.cache import TTLCache
+
+
+class UserLoader:
+    """
+    Carrega usuários por id, compartilhado por todos os controllers, para que uma
+    operação que precisa do mesmo usuário em vários passos (ex: assinar e enviar
+    por e-mail) faça no máximo uma consulta ao MongoDB.
+
+    - Pedidos concorrentes do mesmo id esperam pela mesma consulta (single-flight).
+    - Os ids pedidos dentro de batch_window segundos são obtidos com uma única
+      consulta $in (até max_batch ids).
+    - Os usuários ficam em um cache com TTL curto. Cada escrita em um usuário deve
+      chamar invalidate; o TTL limita o tempo em que uma escrita feita em outro
+      processo não é vista (com change streams, o trust store também invalida).
+
+    A password nunca é carregada. Na mesma consulta vem o registro do certificado atual
+    do usuário (ver services.certificate_store.CertificateStore.current), que é por
+    isso invalidado também sempre que um certificado é emitido ou revogado. Os
+    documentos retornados são compartilhados e não devem ser alterados.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = USER_CACHE_SIZE,
+        ttl: float = USER_CACHE_TTL,
+        batch_window: float = USER_LOADER_BATCH_WINDOW,
+        max_batch: int = USER_LOADER_MAX_BATCH,
+    ):
+        self.batch_window = batch_window
+        self.max_batch = max(1, max_batch)
+        self.db = None
+        self._cache = TTLCache(maxsize, ttl)
+        self._loading: dict[ObjectId, asyncio.Future] = {}
+        self._queue: dict[ObjectId, asyncio.Future] = {}
+        self._flush_handle: asyncio.TimerHandle | None = None
+        # Incrementado em cada invalidação: uma consulta iniciada antes não é guardada
+        self._epoch = 0
+        self.queries = 0
+
+    async def start(self, db):
+        self.db = db
+        self._cache.clear()
+
+    async def load(self, user_id) -> dict | None:
+        """
+        Retorna o usuário com o id dado (str ou ObjectId), ou None se não existir.
+        Um id inválido lança bson.errors.InvalidId.
+        """
+        user_id = ObjectId(user_id)
+        user = self._cache.get(user_id)
+        if user is not None:
+            return user
+        future = self._loading.get(user_id)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._loading[user_id] = future
+            self._queue[user_id] = future
+            self._schedule_flush()
+        # shield: um pedido cancelado não cancela a consulta dos outros
+        return await asyncio.shield(future)
+
+    async def load_many(self, user_ids: list) -> dict[str, dict]:
+        """
+        Retorna {id: usuário} para os ids que existem.
+        """
+        users = await asyncio.gather(*(self.load(user_id) for user_id in user_ids))
+        return {str(user["_id"]): user for user in users if user is not None}
+
+    def invalidate(self, user_id):
+        self.invalidate_many([user_id])
+
+    def invalidate_many(self, user_ids):
+        """
+        Descarta os usuários do cache. Os pedidos seguintes não reutilizam as
+        consultas já em curso, que podem ter lido o documento antes da escrita. Uma
+        consulta que ainda está na fila só é feita depois da escrita e continua sendo
+        compartilhada.
+        """
+        self._epoch += 1
+        for user_id in user_ids:
+            user_id = ObjectId(user_id)
+            self._cache.pop(user_id)
+            if user_id not in self._queue:
+                self._loading.pop(user_id, None)
+
+    def _schedule_flush(self):
+        loop = asyncio.get_running_loop()
+        if len(self._queue) >= self.max_batch:
+            if self._flush_handle is not None:
+                self._flush_handle.cancel()
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_window, self._flush)
+
+    def _flush(self):
+        self._flush_handle = None
+        batch, self._queue = self._queue, {}
+        if batch:
+            asyncio.get_running_loop().create_task(self._fetch(batch))
+
+    async def _fetch(self, batch: dict[ObjectId, asyncio.Future]):
+        epoch = self._epoch
+        try:
+            self.queries += 1
+            pipeline = [
+                {"$match": {"_id": {"$in": list(batch)}}},
+                {"$project": {"password": 0}},
+                CURRENT_CERTIFICATE_LOOKUP,
+            ]
+            found = {user["_id"]: user async for user in self.db.users.aggregate(pipeline)}
+        except Exception as e:
+            found, error = {}, e
+        else:
+            error = None
+        for user_id, future in batch.items():
+            if self._loading.get(user_id) is future:
+                del self._loading[user_id]
+            user = found.get(user_id)
+            if user is not None and epoch == self._epoch:
+                self._cache.set(user_id, user)
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(user)
+
+    def stats(self) -> dict:
+        stats = self._cache.stats()
+        stats["queries"] = self.queries
+        return stats
+
+
+user_loader = UserLoader()
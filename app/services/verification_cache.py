@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta, timezone
+
+from config import VERIFY_CACHE_SIZE, VERIFY_CACHE_TTL, VERIFY_CACHE_MONGO
+from utils.cache import TTLCache
+from utils.date_utils import as_utc
+
+
+class VerificationCache:
+    """
+    Resultados de validação de documentos, indexados pelo SHA-256 do documento, pela
+    geração dos dados de validação (validation_generation) e pelo modo de
+    validação ("summary" ou "report"). Um documento já validado com os mesmos
+    certificados não volta a ser interpretado.
+
+    O primeiro nível é um cache LRU em memória; opcionalmente, os resultados são
+    também guardados na coleção verification_cache do MongoDB, compartilhada entre
+    processos e expirada por um índice TTL.
+    """
+
+    def __init__(self, maxsize: int = VERIFY_CACHE_SIZE, ttl: float = VERIFY_CACHE_TTL):
+        self.ttl = ttl
+        self.memory = TTLCache(maxsize, ttl)
+        self.collection = None
+        self.mongo_hits = 0
+        self.mongo_misses = 0
+
+    async def start(self, db, use_mongo: bool = VERIFY_CACHE_MONGO):
+        """
+        Ativa o segundo nível no MongoDB e cria os índices necessários.
+        """
+        if not use_mongo:
+            return
+        self.collection = db.verification_cache
+        await self.collection.create_index("created_at", expireAfterSeconds=int(self.ttl))
+        await self.collection.create_index("generation")
+
+    async def get(self, sha256: str, generation: str, mode: str = "summary"):
+        key = f"{sha256}:{generation}:{mode}"
+        result = self.memory.get(key)
+        if result is not None or self.collection is None:
+            return result
+        try:
+            cached = await self.collection.find_one({"_id": key}, {"result": 1, "created_at": 1})
+        except Exception as e:
+            print(f"Erro ao consultar o cache de validação: {e}")
+            return None
+        # O índice TTL só remove os documentos expirados periodicamente
+        if cached is None or as_utc(cached["created_at"]) < _now() - timedelta(seconds=self.ttl):
+            self.mongo_misses += 1
+            return None
+        self.mongo_hits += 1
+        self.memory.set(key, cached["result"])
+        return cached["result"]
+
+    async def set(self, sha256: str, generation: str, result: dict, mode: str = "summary"):
+        key = f"{sha256}:{generation}:{mode}"
+        self.memory.set(key, result)
+        if self.collection is None:
+            return
+        try:
+            await self.collection.replace_one(
+                {"_id": key},
+                {
+                    "sha256": sha256,
+                    "generation": generation,
+                    "mode": mode,
+                    "result": result,
+                    "created_at": _now(),
+                },
+                upsert=True,
+            )
+        except Exception as e:
+            print(f"Erro ao guardar no cache de validação: {e}")
+
+    async def invalidate(self, generation: str):
+        """
+        Descarta os resultados calculados com outros certificados. Chamado quando um
+        certificado é adicionado, substituído ou revogado.
+        """
+        self.memory.clear()
+        if self.collection is None:
+            return
+        try:
+            await self.collection.delete_many({"generation": {"$ne": generation}})
+        except Exception as e:
+            print(f"Erro ao invalidar o cache de validação: {e}")
+
+    def stats(self) -> dict:
+        stats = self.memory.stats()
+        stats["mongo"] = (
+            {"hits": self.mongo_hits, "misses": self.mongo_misses}
+            if self.collection is not None
+            else None
+        )
+        return stats
+
+
+def validation_generation(store=None) -> str:
+    """
+    Geração dos dados de que depende a validação: o trust store (ou a cópia store) e
+    os certificados revogados (services.revocation.RevocationService.generation).
+    """
+    from services.revocation import revocation
+    from services.trust_store import trust_store
+
+    store = store or trust_store
+    return f"{int(store.generation, 16) ^ int(revocation.generation, 16):064x}"
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+verification_cache = VerificationCache()
@@ -0,0 +1,15 @@
+import os
+import sys
+
+import pytest
+
+# Os testes são executados sem MongoDB nem servidor SMTP; a aplicação é importada a
+# partir da pasta app, como em produção
+os.environ.setdefault("MONGODB_URI", "mongodb://localhost:27017")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def app_directory(monkeypatch):
+    # Os documentos de teste (static/pdf.pdf) são lidos a partir da pasta app
+    monkeypatch.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,19 @@
+from models.signer import Signer
+from services.key_and_certificate_services import generate_key_and_certificate
+from services.signer_services import sign_pdf
+
+
+def load_document() -> bytes:
+    with open("static/pdf.pdf", "rb") as f:
+        return f.read()
+
+
+def new_signer(key_algorithm: str = "rsa-2048") -> Signer:
+    private_key, public_key, certificate = generate_key_and_certificate("Alice", key_algorithm=key_algorithm)
+    return Signer("Alice", "alice@ipb.pt", private_key, public_key, certificate)
+
+
+def signed_document(key_algorithm: str = "rsa-2048", signer: Signer | None = None):
+    signer = signer or new_signer(key_algorithm)
+    signed = sign_pdf(load_document(), signer, "Aprovado", "Bragança")
+    return signed, [{"certificate": signer.certificate, "name": "Alice", "email": "alice@ipb.pt"}]
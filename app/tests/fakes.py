@@ -0,0 +1,261 @@
+import asyncio
+import copy
+
+from bson import ObjectId
+from pymongo.results import BulkWriteResult, InsertOneResult, UpdateResult
+
+
+class FakeCursor:
+    def __init__(self, documents: list[dict], gate: asyncio.Event | None = None):
+        self.documents = documents
+        self.gate = gate
+
+    def sort(self, field: str, direction: int = 1) -> "FakeCursor":
+        self.documents.sort(key=lambda document: document[field], reverse=direction < 0)
+        return self
+
+    def limit(self, count: int) -> "FakeCursor":
+        if count:
+            self.documents = self.documents[:count]
+        return self
+
+    async def to_list(self, length: int | None = None) -> list[dict]:
+        return [document async for document in self]
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        if self.gate is not None:
+            await self.gate.wait()
+        for document in self.documents:
+            yield document
+
+
+class FakeChangeStream:
+    """
+    Change stream de uma FakeCollection: recebe os documentos inseridos depois de
+    aberto.
+    """
+
+    def __init__(self, collection: "FakeCollection"):
+        self.collection = collection
+        self.changes: asyncio.Queue = asyncio.Queue()
+
+    async def __aenter__(self):
+        self.collection.streams.append(self)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.collection.streams.remove(self)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> dict:
+        return await self.changes.get()
+
+
+class FakeUsers:
+    """
+    Coleção users em memória com o subconjunto de find e aggregate usado por
+    services.user_loader ({"_id": {"$in": [...]}}, com o $lookup do certificado atual
+    na coleção certificates do banco de dados). Com gate, as consultas esperam que o
+    evento seja ativado, para simular uma consulta em curso.
+    """
+
+    def __init__(self, documents: list[dict], database: "FakeDatabase | None" = None):
+        self.documents = {document["_id"]: document for document in documents}
+        self.database = database
+        self.queries: list[list] = []
+        self.gate: asyncio.Event | None = None
+
+    def _find(self, ids: list, projection: dict | None) -> list[dict]:
+        self.queries.append(ids)
+        found = []
+        for user_id in ids:
+            if user_id in self.documents:
+                document = copy.deepcopy(self.documents[user_id])
+                for field, include in (projection or {}).items():
+                    if not include:
+                        document.pop(field, None)
+                found.append(document)
+        return found
+
+    def find(self, query: dict, projection: dict | None = None):
+        return FakeCursor(self._find(list(query["_id"]["$in"]), projection), self.gate)
+
+    def aggregate(self, pipeline: list[dict]):
+        stages = {name: stage for step in pipeline for name, stage in step.items()}
+        found = self._find(list(stages["$match"]["_id"]["$in"]), stages.get("$project"))
+        lookup = stages.get("$lookup")
+        if lookup is not None:
+            collection = getattr(self.database, lookup["from"])
+            for document in found:
+                records = sorted(
+                    (record for record in collection.documents if record.get("user_id") == str(document["_id"])),
+                    key=lambda record: record["issued_at"],
+                    reverse=True,
+                )
+                document[lookup["as"]] = [
+                    {"certificate": record["certificate"], "revoked_at": record.get("revoked_at")}
+                    for record in records[:1]
+                ]
+        return FakeCursor(found, self.gate)
+
+
+class FakeCollection:
+    """
+    Coleção em memória com as operações usadas pelos serviços (igualdade de campos,
+    $in / $nin / $ne / $lte / $exists, índices únicos, $inc / $set / $unset,
+    replace_one e change streams das inserções). reads conta as consultas (find e find_one).
+    """
+
+    def __init__(self):
+        self.documents: list[dict] = []
+        self.unique: list[str] = []
+        self.streams: list[FakeChangeStream] = []
+        self.reads = 0
+
+    @staticmethod
+    def _matches(document: dict, query: dict) -> bool:
+        for field, condition in query.items():
+            value = document.get(field)
+            if not isinstance(condition, dict):
+                if value != condition:
+                    return False
+                continue
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+            if "$nin" in condition and value in condition["$nin"]:
+                return False
+            if "$ne" in condition and value == condition["$ne"]:
+                return False
+            if "$lte" in condition and (value is None or value > condition["$lte"]):
+                return False
+            if "$exists" in condition and (field in document) != condition["$exists"]:
+                return False
+        return True
+
+    @staticmethod
+    def _project(document: dict, projection: dict | None) -> dict:
+        document = copy.deepcopy(document)
+        for field, include in (projection or {}).items():
+            if not include:
+                document.pop(field, None)
+        return document
+
+    async def create_index(self, key, unique: bool = False, **kwargs):
+        from pymongo.errors import OperationFailure
+
+        if unique and isinstance(key, str):
+            values = [document.get(key) for document in self.documents]
+            if len(values) != len(set(values)):
+                raise OperationFailure(f"E11000 duplicate key: {key}", 11000)
+            self.unique.append(key)
+        return key
+
+    def watch(self, pipeline: list | None = None) -> FakeChangeStream:
+        return FakeChangeStream(self)
+
+    def find(self, query: dict | None = None, projection: dict | None = None):
+        self.reads += 1
+        return FakeCursor(
+            [self._project(document, projection) for document in self.documents if self._matches(document, query or {})]
+        )
+
+    async def find_one(self, query: dict, projection: dict | None = None, sort: list | None = None):
+        self.reads += 1
+        documents = [document for document in self.documents if self._matches(document, query)]
+        for field, direction in reversed(sort or []):
+            documents.sort(key=lambda document: document[field], reverse=direction < 0)
+        return self._project(documents[0], projection) if documents else None
+
+    async def insert_many(self, documents: list[dict], ordered: bool = True):
+        from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+        errors, inserted = [], 0
+        for index, document in enumerate(documents):
+            try:
+                await self.insert_one(document)
+                inserted += 1
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": inserted})
+
+    async def update_one(self, query: dict, update: dict) -> UpdateResult:
+        matched = 0
+        for document in self.documents:
+            if self._matches(document, query):
+                document.update(update.get("$set", {}))
+                for field, amount in update.get("$inc", {}).items():
+                    document[field] = document.get(field, 0) + amount
+                for field in update.get("$unset", {}):
+                    document.pop(field, None)
+                matched = 1
+                break
+        return UpdateResult({"n": matched, "nModified": matched}, True)
+
+    async def bulk_write(self, requests: list, ordered: bool = True):
+        matched = 0
+        for request in requests:
+            matched += (await self.update_one(request._filter, request._doc)).matched_count
+        return BulkWriteResult({"nMatched": matched, "nModified": matched}, True)
+
+    async def replace_one(self, query: dict, replacement: dict, upsert: bool = False):
+        for index, document in enumerate(self.documents):
+            if self._matches(document, query):
+                self.documents[index] = dict(replacement, _id=document["_id"])
+                return
+        if upsert:
+            await self.insert_one(dict(replacement, **query))
+
+    async def delete_many(self, query: dict):
+        self.documents = [document for document in self.documents if not self._matches(document, query)]
+
+    async def insert_one(self, document: dict):
+        from pymongo.errors import DuplicateKeyError
+
+        document = dict(document)
+        document.setdefault("_id", ObjectId())
+        for field in ["_id", *self.unique]:
+            if any(other.get(field) == document.get(field) for other in self.documents):
+                raise DuplicateKeyError(f"E11000 duplicate key: {field}")
+        self.documents.append(document)
+        for stream in self.streams:
+            stream.changes.put_nowait({"operationType": "insert", "fullDocument": copy.deepcopy(document)})
+        return InsertOneResult(document["_id"], True)
+
+    async def find_one_and_update(self, query: dict, update: dict, upsert: bool = False, return_document=False):
+        for document in self.documents:
+            if self._matches(document, query):
+                break
+        else:
+            if not upsert:
+                return None
+            document = dict(query)
+            self.documents.append(document)
+        before = copy.deepcopy(document)
+        document.update(update.get("$set", {}))
+        for field, amount in update.get("$inc", {}).items():
+            document[field] = document.get(field, 0) + amount
+        return copy.deepcopy(document) if return_document else before
+
+
+class FakeDatabase:
+    """
+    Banco de dados em memória: users é uma FakeUsers e as demais coleções são
+    FakeCollection, criadas no primeiro acesso.
+    """
+
+    def __init__(self, users: list[dict] = ()):
+        self.users = FakeUsers(list(users), self)
+        self._collections: dict[str, FakeCollection] = {}
+
+    def __getattr__(self, name: str) -> FakeCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self._collections.setdefault(name, FakeCollection())
@@ -0,0 +1,86 @@
+import asyncio
+import hashlib
+import io
+
+import pytest
+from fastapi import UploadFile
+
+import controllers.document_controller as document_controller_module
+import services.revocation as revocation_module
+import services.trust_store as trust_store_module
+import services.verification_cache as verification_cache_module
+from controllers.document_controller import DocumentController
+from services.revocation import RevocationService
+from services.trust_store import TrustStore
+from services.verification_cache import VerificationCache
+from tests.documents import load_document, signed_document
+
+
+class InlineExecutor:
+    """
+    Executa as tarefas no próprio processo, em vez do pool de processos.
+    """
+
+    max_workers = 2
+
+    async def run(self, fn, *args, **kwargs):
+        return fn(*args)
+
+
+@pytest.fixture
+def store(monkeypatch):
+    """
+    Trust store, cache de validação e conjunto de certificados revogados novos, no
+    lugar das instâncias da aplicação.
+    """
+    store = TrustStore()
+    monkeypatch.setattr(trust_store_module, "trust_store", store)
+    monkeypatch.setattr(verification_cache_module, "verification_cache", VerificationCache())
+    monkeypatch.setattr(revocation_module, "revocation", RevocationService())
+    monkeypatch.setattr(document_controller_module, "cpu_executor", InlineExecutor())
+    return store
+
+
+def upload(filename: str, content: bytes) -> UploadFile:
+    return UploadFile(io.BytesIO(content), filename=filename)
+
+
+def test_batch_reports_each_document_and_a_summary(store):
+    async def scenario():
+        trusted, trusted_signers = signed_document("ecdsa-p256")
+        untrusted, _ = signed_document("ecdsa-p256")
+        store.add_certificate("alice", "Alice", "alice@ipb.pt", trusted_signers[0]["certificate"])
+        files = {
+            "pasta/assinado.pdf": trusted,
+            "desconhecido.pdf": untrusted,
+            "sem_assinatura.pdf": load_document(),
+            "alterado.pdf": trusted,
+            "notas.txt": b"isto nao e um PDF",
+        }
+        manifest = {
+            "assinado.pdf": hashlib.sha256(trusted).hexdigest(),
+            "alterado.pdf": hashlib.sha256(b"outro conteudo").hexdigest(),
+            "em_falta.pdf": hashlib.sha256(b"").hexdigest(),
+        }
+        results = await DocumentController(None).validate_documents_batch(
+            [upload(name, content) for name, content in files.items()], manifest
+        )
+        lines = [line async for line in results]
+        by_name = {line["filename"]: line for line in lines if "filename" in line}
+
+        assert by_name["pasta/assinado.pdf"]["status"] == "validated"
+        assert by_name["pasta/assinado.pdf"]["hash_ok"] is True
+        assert by_name["desconhecido.pdf"]["status"] == "not_validated"
+        assert by_name["desconhecido.pdf"]["hash_ok"] is None
+        assert by_name["sem_assinatura.pdf"]["status"] == "not_validated"
+        assert by_name["sem_assinatura.pdf"]["signature_status"] == "not signed"
+        assert by_name["alterado.pdf"]["status"] == "hash_mismatch"
+        assert by_name["notas.txt"]["signature_status"] == "not a PDF"
+        assert by_name["em_falta.pdf"]["status"] == "missing"
+        summary = lines[-1]["summary"]
+        assert summary["total"] == 5
+        assert summary["validated"] == 1 and summary["not_validated"] == 3 and summary["error"] == 0
+        assert summary["hash_mismatch"] == 1 and summary["missing"] == 1
+        assert summary["elapsed_ms"] >= 0
+
+    asyncio.run(scenario())
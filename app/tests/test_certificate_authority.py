@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.x509 import ocsp
+
+import services.certificate_authority as certificate_authority_module
+from models.signer import Signer
+from services.certificate_authority import CertificateAuthority
+from services.key_and_certificate_services import generate_key_pair
+from services.revocation import RevocationService
+from services.signer_services import verify_document
+from tests.documents import signed_document
+from tests.fakes import FakeDatabase
+
+
+@pytest.fixture
+def ca(monkeypatch):
+    """
+    CA interna iniciada em um banco de dados em memória, no lugar da instância da aplicação.
+    """
+    authority = CertificateAuthority(enabled=True, key_algorithm="ecdsa-p256", password="teste")
+    asyncio.run(authority.start(FakeDatabase()))
+    monkeypatch.setattr(certificate_authority_module, "certificate_authority", authority)
+    return authority
+
+
+def issued_signer(authority: CertificateAuthority) -> Signer:
+    private_key, public_key = generate_key_pair("ecdsa-p256")
+    certificate = authority.issue(public_key, "Alice", "alice@ipb.pt")
+    return Signer("Alice", "alice@ipb.pt", private_key, public_key, certificate, chain=authority.chain_for(certificate))
+
+
+def test_intermediate_key_is_stored_encrypted():
+    async def scenario():
+        db = FakeDatabase()
+        authority = CertificateAuthority(enabled=True, key_algorithm="ecdsa-p256", password="teste")
+        await authority.start(db)
+        stored = await db.certificate_authority.find_one({"_id": "internal"})
+        assert b"ENCRYPTED PRIVATE KEY" in stored["intermediate_private_key"]
+        # Outro processo carrega a mesma CA
+        other = CertificateAuthority(enabled=True, key_algorithm="ecdsa-p256", password="teste")
+        await other.start(db)
+        assert other.root == authority.root and other.active
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize(
+    "key_algorithm, password",
+    [("ed25519", "teste"), ("ecdsa-p256", None)],
+)
+def test_invalid_configuration_is_rejected(key_algorithm, password):
+    db = FakeDatabase()
+    authority = CertificateAuthority(enabled=True, key_algorithm=key_algorithm, password=password)
+    with pytest.raises(ValueError):
+        asyncio.run(authority.start(db))
+    assert db.certificate_authority.documents == []
+
+
+def test_document_signed_with_an_issued_certificate_is_validated_by_the_chain(ca):
+    signed, _ = signed_document(signer=issued_signer(ca))
+
+    # Sem trusted_signers: o signatário é identificado pelo próprio certificado
+    result = verify_document(signed, [], authorities=ca.anchors)
+
+    assert result["validated"] is True
+    assert result["signatures"]["contact"] == "alice@ipb.pt"
+    # Sem a raiz da CA, a cadeia não chega a um certificado confiável
+    assert verify_document(signed, [])["validated"] is False
+    other = CertificateAuthority(enabled=True, key_algorithm="ecdsa-p256", password="teste")
+    asyncio.run(other.start(FakeDatabase()))
+    assert verify_document(signed, [], authorities=other.anchors)["validated"] is False
+
+
+def test_revoked_issued_certificate_is_rejected(ca):
+    signer = issued_signer(ca)
+    signed, _ = signed_document(signer=signer)
+    certificate = x509.load_pem_x509_certificate(signer.certificate)
+    identifier = {"issuer": certificate.issuer.public_bytes(), "serial_number": certificate.serial_number}
+
+    async def revoke():
+        service = RevocationService(update_interval=300)
+        await service.start(FakeDatabase())
+        await service.stop()
+        await service.revoke(signer.certificate, "user", "key_compromise")
+        return service
+
+    service = asyncio.run(revoke())
+    result = verify_document(signed, [], authorities=ca.anchors, revoked=service.revoked_for([identifier]))
+
+    assert result["validated"] is False
+    assert result["revocation"]["reason"] == "key_compromise"
+    # A CRL e o OCSP da CA interna publicam a mesma revogação
+    crl = x509.load_der_x509_crl(service.crl)
+    assert crl.get_revoked_certificate_by_serial_number(certificate.serial_number) is not None
+    issuer = x509.load_pem_x509_certificate(ca.intermediate)
+    request = ocsp.OCSPRequestBuilder().add_certificate(certificate, issuer, hashes.SHA1()).build()
+    response = ocsp.load_der_ocsp_response(service.ocsp_response(request.public_bytes(serialization.Encoding.DER)))
+    assert response.certificate_status == ocsp.OCSPCertStatus.REVOKED
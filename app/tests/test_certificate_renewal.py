@@ -0,0 +1,163 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from bson import ObjectId
+
+import services.certificate_authority as certificate_authority_module
+import services.certificate_store as certificate_store_module
+from services.certificate_authority import CA_ISSUER, CertificateAuthority
+from services.certificate_renewal import LEASE_ID, CertificateRenewal
+from services.certificate_store import CertificateStore
+from services.key_and_certificate_services import generate_key_pair
+from tests.fakes import FakeCollection
+from utils.crypto_utils import certificate_expiry, certificate_fingerprint
+
+
+class Database:
+    def __init__(self):
+        self._collections: dict[str, FakeCollection] = {}
+
+    def __getattr__(self, name: str) -> FakeCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self._collections.setdefault(name, FakeCollection())
+
+
+@pytest.fixture
+def ca(monkeypatch):
+    """
+    CA interna e coleção certificates em um banco de dados em memória, no lugar das
+    instâncias da aplicação.
+    """
+    db = Database()
+    authority = CertificateAuthority(enabled=True, key_algorithm="ecdsa-p256", password="teste")
+    store = CertificateStore()
+    asyncio.run(authority.start(db))
+    asyncio.run(store.start(db))
+    monkeypatch.setattr(certificate_authority_module, "certificate_authority", authority)
+    monkeypatch.setattr(certificate_store_module, "certificate_store", store)
+    return db, authority
+
+
+def expiring_users(db: Database, authority: CertificateAuthority, count: int) -> list[dict]:
+    """
+    Usuários com certificados da CA interna guardados como se expirassem amanhã.
+    """
+    tomorrow = datetime.now(timezone.utc) + timedelta(days=1)
+    users = []
+    for i in range(count):
+        _, public_key = generate_key_pair("ecdsa-p256")
+        user_id = ObjectId()
+        user = {
+            "_id": user_id,
+            "name": f"User {i}",
+            "email": f"u{i}@ipb.pt",
+            "public_key": public_key,
+            "certificate": authority.issue(public_key, f"User {i}", f"u{i}@ipb.pt", user_id),
+            "certificate_issuer": CA_ISSUER,
+            "certificate_not_valid_after": tomorrow + timedelta(minutes=i),
+        }
+        db.users.documents.append(user)
+        users.append(dict(user))
+    return users
+
+
+async def started_renewal(db: Database, **kwargs) -> CertificateRenewal:
+    renewal = CertificateRenewal(enabled=False, interval=60, batch_size=2, batch_delay=0, **kwargs)
+    await renewal.start(db)
+    return renewal
+
+
+def test_lease_is_held_by_one_process_until_it_expires():
+    async def scenario():
+        db = Database()
+        first, second = await started_renewal(db), await started_renewal(db)
+        assert await first._acquire_lease()
+        assert not await second._acquire_lease()
+        await db.scheduler_leases.update_one(
+            {"_id": LEASE_ID}, {"$set": {"expires_at": datetime.now(timezone.utc) - timedelta(seconds=1)}}
+        )
+        assert await second._acquire_lease()
+        assert not await first._acquire_lease()
+
+    asyncio.run(scenario())
+
+
+def test_due_certificates_are_renewed_and_recorded(ca):
+    async def scenario():
+        db, authority = ca
+        users = expiring_users(db, authority, 3)
+        renewal = await started_renewal(db)
+        assert await renewal.run_once() == 3
+        for user, stored in zip(users, db.users.documents):
+            assert stored["certificate"] != user["certificate"]
+            assert stored["certificate_not_valid_after"] == certificate_expiry(stored["certificate"])
+        history = await renewal.history(users[0]["_id"])
+        assert len(history) == 1
+        assert history[0]["previous_fingerprint"] == certificate_fingerprint(users[0]["certificate"])
+        assert history[0]["fingerprint"] == certificate_fingerprint(db.users.documents[0]["certificate"])
+        assert len(db.certificates.documents) == 3
+        # Os certificados renovados já não estão na janela
+        assert await renewal.run_once() == 0
+
+    asyncio.run(scenario())
+
+
+def test_certificate_changed_during_the_renewal_is_kept(ca):
+    async def scenario():
+        db, authority = ca
+        users = expiring_users(db, authority, 2)
+        renewal = await started_renewal(db)
+        bulk_write = db.users.bulk_write
+
+        async def concurrent_bulk_write(requests, ordered=True):
+            # Outro processo emite um certificado entre a leitura e a escrita
+            db.users.documents[0]["certificate"] = b"emitido entretanto"
+            return await bulk_write(requests, ordered)
+
+        db.users.bulk_write = concurrent_bulk_write
+        assert await renewal.run_once() == 1
+        assert db.users.documents[0]["certificate"] == b"emitido entretanto"
+        assert renewal.stats()["skipped"] == 1
+        assert [entry["user_id"] for entry in db.certificate_renewals.documents] == [str(users[1]["_id"])]
+        assert [record["user_id"] for record in db.certificates.documents] == [str(users[1]["_id"])]
+
+    asyncio.run(scenario())
+
+
+def test_each_user_is_renewed_at_most_once_per_run(ca):
+    async def scenario():
+        db, authority = ca
+        expiring_users(db, authority, 3)
+        # Janela maior que a validade: os certificados renovados continuam na janela
+        renewal = await started_renewal(db, window_days=400)
+        assert await asyncio.wait_for(renewal.run_once(), 10) == 3
+        assert len(db.certificate_renewals.documents) == 3
+
+    asyncio.run(scenario())
+
+
+def test_window_longer_than_the_validity_is_rejected():
+    renewal = CertificateRenewal(enabled=True, window_days=30, validity_days=30)
+    with pytest.raises(ValueError):
+        asyncio.run(renewal.start(Database()))
+
+
+def test_backfill_stores_the_expiry_of_older_certificates(ca):
+    async def scenario():
+        db, authority = ca
+        users = expiring_users(db, authority, 3)
+        for user in db.users.documents:
+            del user["certificate_not_valid_after"]
+        db.users.documents[2]["certificate"] = b"certificado invalido"
+        renewal = await started_renewal(db)
+        await renewal._backfill()
+        assert renewal.stats()["backfilled"] == 3
+        assert db.users.documents[0]["certificate_not_valid_after"] == certificate_expiry(users[0]["certificate"])
+        # Os certificados que não podem ser lidos não são processados de novo
+        assert db.users.documents[2]["certificate_not_valid_after"] is None
+        await renewal._backfill()
+        assert renewal.stats()["backfilled"] == 3
+
+    asyncio.run(scenario())
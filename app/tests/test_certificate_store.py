@@ -0,0 +1,90 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+
+import controllers.key_and_certificate_controller as controller_module
+import services.revocation as revocation_module
+from controllers.key_and_certificate_controller import KeyCertController
+from models.request_models import RevokeRequest
+from services.certificate_store import CertificateStore, certificate_record
+from services.key_and_certificate_services import generate_key_and_certificate
+from services.revocation import RevocationService
+from services.user_loader import UserLoader
+from tests.fakes import FakeDatabase
+
+
+def new_certificate() -> bytes:
+    return generate_key_and_certificate("Alice", key_algorithm="ecdsa-p256")[2]
+
+
+def test_current_certificate_is_the_latest_issued():
+    async def scenario():
+        store = CertificateStore()
+        await store.start(FakeDatabase())
+        user = {"_id": ObjectId()}
+        old, new = new_certificate(), new_certificate()
+        now = datetime.now(timezone.utc)
+        await store.record_many(
+            [
+                certificate_record(user["_id"], new, "self_signed", now),
+                certificate_record(user["_id"], old, "self_signed", now - timedelta(days=1)),
+            ]
+        )
+        assert await store.current(user) == new
+
+    asyncio.run(scenario())
+
+
+def test_revoked_current_certificate_is_not_returned():
+    async def scenario():
+        store = CertificateStore()
+        await store.start(FakeDatabase())
+        user = {"_id": ObjectId(), "certificate": new_certificate()}
+        await store.record(user["_id"], user["certificate"], "self_signed")
+        fingerprint = certificate_record(user["_id"], user["certificate"], "self_signed")["fingerprint"]
+        await store.mark_revoked(fingerprint, "key_compromise", datetime.now(timezone.utc))
+        assert await store.current(user) is None
+
+    asyncio.run(scenario())
+
+
+def test_users_not_yet_migrated_use_the_user_document():
+    async def scenario():
+        store = CertificateStore()
+        await store.start(FakeDatabase())
+        certificate = new_certificate()
+        assert await store.current({"_id": ObjectId(), "certificate": certificate}) == certificate
+        assert await store.current({"_id": ObjectId()}) is None
+
+    asyncio.run(scenario())
+
+
+def test_revoke_certificate_revokes_the_current_certificate(monkeypatch):
+    async def scenario():
+        user_id = ObjectId()
+        old, new = new_certificate(), new_certificate()
+        # users.certificate ainda com o certificado anterior
+        db = FakeDatabase([{"_id": user_id, "name": "Alice", "email": "alice@ipb.pt", "certificate": old}])
+        store, loader, revocation = CertificateStore(), UserLoader(batch_window=0), RevocationService()
+        await store.start(db)
+        await loader.start(db)
+        await revocation.start(db)
+        await revocation.stop()
+        monkeypatch.setattr(controller_module, "certificate_store", store)
+        monkeypatch.setattr(controller_module, "user_loader", loader)
+        monkeypatch.setattr(revocation_module, "revocation", revocation)
+        now = datetime.now(timezone.utc)
+        await store.record_many(
+            [
+                certificate_record(user_id, old, "self_signed", now - timedelta(days=1)),
+                certificate_record(user_id, new, "self_signed", now),
+            ]
+        )
+        await KeyCertController(db).revoke_certificate(RevokeRequest(user_id=str(user_id), reason="key_compromise"))
+        assert await revocation.is_revoked(new)
+        assert not await revocation.is_revoked(old)
+        assert (await store.find(certificate_record(user_id, new, "self_signed")["fingerprint"]))["revoked_at"]
+        assert await store.current(await loader.load(user_id)) is None
+
+    asyncio.run(scenario())
@@ -0,0 +1,96 @@
+import asyncio
+from datetime import datetime, timezone
+
+from services.document_registry import DocumentRegistry
+from tests.fakes import FakeDatabase
+
+SHA256 = "ab" * 32
+
+
+async def started_registry(db: FakeDatabase, batch_size: int = 100) -> DocumentRegistry:
+    registry = DocumentRegistry(batch_size=batch_size, flush_interval=60)
+    await registry.start(db)
+    return registry
+
+
+def test_record_is_found_before_and_after_it_is_written():
+    async def scenario():
+        db = FakeDatabase()
+        registry = await started_registry(db)
+        signed_at = datetime(2026, 1, 2, tzinfo=timezone.utc)
+        registry.record(SHA256, "alice", "contrato.pdf", 1234, "cd" * 32, signed_at)
+        assert db.signed_documents.documents == []
+        # Ainda na fila: encontrado sem consultar o banco de dados
+        assert (await registry.find(SHA256.upper() + "\n"))["filename"] == "contrato.pdf"
+        assert db.signed_documents.reads == 0
+
+        await registry.stop()
+        assert registry.stats() == {"pending": 0, "inserted": 1}
+        record = await registry.find(SHA256)
+        assert record == {
+            "sha256": SHA256,
+            "user_id": "alice",
+            "filename": "contrato.pdf",
+            "size": 1234,
+            "signed_at": signed_at,
+            "certificate_fingerprint": "cd" * 32,
+        }
+        assert await registry.find("ef" * 32) is None
+
+    asyncio.run(scenario())
+
+
+def test_full_queue_is_written_without_waiting_for_the_interval():
+    async def scenario():
+        db = FakeDatabase()
+        registry = await started_registry(db, batch_size=2)
+        registry.record("01" * 32, "alice", "a.pdf", 1, "cd" * 32)
+        registry.record("02" * 32, "alice", "b.pdf", 1, "cd" * 32)
+        for _ in range(100):
+            if registry.stats()["inserted"] == 2:
+                break
+            await asyncio.sleep(0.01)
+        assert len(db.signed_documents.documents) == 2
+        await registry.stop()
+
+    asyncio.run(scenario())
+
+
+def test_document_signed_again_is_not_an_error():
+    async def scenario():
+        db = FakeDatabase()
+        registry = await started_registry(db)
+        registry.record(SHA256, "alice", "contrato.pdf", 1234, "cd" * 32)
+        await registry.flush()
+        registry.record(SHA256, "alice", "contrato.pdf", 1234, "cd" * 32)
+        registry.record("ef" * 32, "bob", "outro.pdf", 10, "cd" * 32)
+        await registry.stop()
+        assert registry.stats() == {"pending": 0, "inserted": 2}
+        assert len(db.signed_documents.documents) == 2
+
+    asyncio.run(scenario())
+
+
+def test_records_are_kept_when_the_write_fails():
+    async def scenario():
+        db = FakeDatabase()
+        registry = await started_registry(db)
+        insert_many = db.signed_documents.insert_many
+
+        async def unavailable(documents, ordered=True):
+            # Um documento é assinado de novo enquanto a escrita está em curso
+            registry.record(SHA256, "bob", "novo.pdf", 1, "cd" * 32)
+            raise ConnectionError("MongoDB indisponível")
+
+        registry.record(SHA256, "alice", "contrato.pdf", 1234, "cd" * 32)
+        db.signed_documents.insert_many = unavailable
+        await registry.flush()
+        assert registry.stats()["pending"] == 1
+        # O registro mais recente não é substituído pelo que falhou
+        assert (await registry.find(SHA256))["filename"] == "novo.pdf"
+
+        db.signed_documents.insert_many = insert_many
+        await registry.stop()
+        assert registry.stats() == {"pending": 0, "inserted": 1}
+
+    asyncio.run(scenario())
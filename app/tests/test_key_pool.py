@@ -0,0 +1,75 @@
+import asyncio
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+
+from services.key_pool import KeyPool
+
+
+async def filled(pool: KeyPool, depth: int) -> KeyPool:
+    for _ in range(1000):
+        if len(pool) >= depth:
+            return pool
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"O pool não chegou a {depth} chaves: {pool.stats()}")
+
+
+def new_pool(size: int = 4, low_water: int = 2) -> KeyPool:
+    return KeyPool(size=size, low_water=low_water, workers=1, batch=2, algorithm="ecdsa-p256")
+
+
+def test_take_is_refilled_below_the_low_water_mark():
+    async def scenario():
+        pool = new_pool()
+        await pool.start()
+        try:
+            await filled(pool, 4)
+            private_key, public_key = pool.take()
+            assert isinstance(serialization.load_pem_private_key(private_key, None), ec.EllipticCurvePrivateKey)
+            assert serialization.load_pem_public_key(public_key) == serialization.load_pem_private_key(
+                private_key, None
+            ).public_key()
+            # Acima de low_water não há reabastecimento
+            await asyncio.sleep(0.1)
+            assert len(pool) == 3 and pool.stats()["generated"] == 4
+            pool.take()
+            pool.take()
+            await filled(pool, 4)
+            stats = pool.stats()
+            assert stats["hits"] == 3 and stats["misses"] == 0
+            assert stats["depth"] == 4 and stats["generated"] == 7
+            assert stats["refill_rate"] > 0
+        finally:
+            await pool.stop()
+
+    asyncio.run(scenario())
+
+
+def test_empty_pool_is_a_miss_and_generates_in_the_request():
+    async def scenario():
+        pool = new_pool(size=0, low_water=0)
+        await pool.start()
+        assert pool.take() is None
+        private_key, _ = await pool.take_or_generate()
+        assert isinstance(serialization.load_pem_private_key(private_key, None), ec.EllipticCurvePrivateKey)
+        stats = pool.stats()
+        assert stats["hits"] == 0 and stats["misses"] == 2 and stats["generated"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_other_algorithms_are_not_taken_from_the_pool():
+    async def scenario():
+        pool = new_pool(size=2, low_water=1)
+        await pool.start()
+        try:
+            await filled(pool, 2)
+            private_key, _ = await pool.take_or_generate("ed25519")
+            assert isinstance(serialization.load_pem_private_key(private_key, None), ed25519.Ed25519PrivateKey)
+            assert len(pool) == 2 and pool.stats()["hits"] == 0
+            await pool.take_or_generate()
+            assert pool.stats()["hits"] == 1
+        finally:
+            await pool.stop()
+
+    asyncio.run(scenario())
@@ -0,0 +1,23 @@
+from tests.documents import load_document, signed_document
+from utils.pdf_utils import SIGNATURE_TAIL_WINDOW, has_signature_markers
+
+
+def test_signed_document_has_markers():
+    signed, _ = signed_document("ecdsa-p256")
+    assert has_signature_markers(signed)
+    assert not has_signature_markers(load_document())
+
+
+def test_contents_must_be_in_the_signature_object():
+    document = load_document() + (
+        b"\n90 0 obj\n<< /Type /Sig /ByteRange [0 1 2 3] >>\nendobj\n"
+        b"91 0 obj\n<< /Type /XObject /Contents <00> >>\nendobj\n"
+    )
+    assert not has_signature_markers(document)
+    assert has_signature_markers(document.replace(b"[0 1 2 3] >>", b"[0 1 2 3] /Contents <00> >>"))
+
+
+def test_search_is_limited_to_the_end_of_the_file():
+    signed, _ = signed_document("ecdsa-p256")
+    assert has_signature_markers(b"%" * (4 * SIGNATURE_TAIL_WINDOW) + signed[-SIGNATURE_TAIL_WINDOW // 2 :])
+    assert not has_signature_markers(signed + b"\n%" + b"x" * SIGNATURE_TAIL_WINDOW)
@@ -0,0 +1,51 @@
+import asyncio
+import os
+
+import pytest
+from concurrent.futures.process import BrokenProcessPool
+
+from utils.process_pool import CpuExecutor
+
+
+def _exit_worker():
+    os._exit(1)
+
+
+def _pid() -> int:
+    return os.getpid()
+
+
+def test_broken_pool_is_replaced_and_its_tasks_released():
+    async def scenario():
+        executor = CpuExecutor(max_workers=1, queue_depth=1, warm_up=False)
+        await executor.start()
+        broken = executor._executor
+        shutdowns = []
+        shutdown = broken.shutdown
+        broken.shutdown = lambda **kwargs: shutdowns.append(kwargs) or shutdown(**kwargs)
+        with pytest.raises(BrokenProcessPool):
+            await executor.run(_exit_worker)
+        # O pool antigo é fechado sem esperar e substituído no pedido seguinte
+        assert await executor.run(_pid) != os.getpid()
+        assert executor._executor is not broken
+        assert shutdowns == [{"wait": False, "cancel_futures": True}]
+        assert executor.in_flight == 0
+        executor.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_lost_tasks_of_a_broken_pool_stop_counting_as_in_flight():
+    async def scenario():
+        executor = CpuExecutor(max_workers=1, queue_depth=0, warm_up=False)
+        await executor.start()
+        broken = executor._executor
+        # Tarefa sem resposta de um pool que deixou de funcionar
+        executor._futures[asyncio.Future()] = broken
+        assert executor.in_flight == 1
+        executor._discard(broken)
+        assert executor.in_flight == 0
+        assert await executor.run(_pid) != os.getpid()
+        executor.shutdown()
+
+    asyncio.run(scenario())
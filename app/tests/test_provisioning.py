@@ -0,0 +1,65 @@
+import asyncio
+
+from bson import ObjectId
+
+from services.certificate_store import certificate_store
+from services.provisioning import Provisioner
+from tests.fakes import FakeCollection
+
+
+class Database:
+    def __init__(self):
+        self._collections: dict[str, FakeCollection] = {}
+
+    def __getattr__(self, name: str) -> FakeCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self._collections.setdefault(name, FakeCollection())
+
+
+class InlineExecutor:
+    """
+    Executa as tarefas no próprio processo, em vez do pool de processos.
+    """
+
+    max_workers = 2
+
+    async def run(self, fn, *args):
+        return fn(*args)
+
+
+async def provisioned(db, job, interrupt_after: int | None = None) -> list[dict]:
+    credentials = []
+    run = Provisioner(db, InlineExecutor(), chunk_size=2).run(job)
+    async for chunk in run:
+        credentials.extend(chunk)
+        if interrupt_after is not None and len(credentials) >= interrupt_after:
+            # O cliente se desconectou depois de receber o primeiro bloco
+            await run.aclose()
+            break
+    return credentials
+
+
+def test_resumed_job_lists_users_whose_keys_are_not_in_the_archive():
+    async def scenario():
+        db = Database()
+        await certificate_store.start(db)
+        users = [{"_id": ObjectId(), "name": f"U{i}", "email": f"u{i}@ipb.pt"} for i in range(6)]
+        db.users.documents = [dict(user) for user in users]
+        provisioner = Provisioner(db, InlineExecutor(), chunk_size=2)
+        job = await provisioner.create_job([str(user["_id"]) for user in users], "ecdsa-p256")
+
+        first = await provisioned(db, job, interrupt_after=2)
+        resumed = await provisioned(db, await provisioner.get_job(str(job["_id"])))
+        finished = await provisioner.get_job(str(job["_id"]))
+
+        rekey = {entry["user_id"] for entry in finished["needs_rekey"]}
+        # As chaves gravadas pela primeira execução (entregues ou perdidas quando o cliente
+        # se desligou) não são geradas de novo, mas ficam indicadas no manifesto
+        assert {credential["user_id"] for credential in first} <= rekey
+        assert len(rekey) > len(first)
+        assert rekey | {credential["user_id"] for credential in resumed} == {str(user["_id"]) for user in users}
+        assert not rekey & {credential["user_id"] for credential in resumed}
+        assert finished["status"] == "completed" and finished["issued"] == 6
+
+    asyncio.run(scenario())
@@ -0,0 +1,134 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from cryptography import x509
+
+import services.certificate_authority as certificate_authority_module
+from services.certificate_authority import CertificateAuthority
+from services.key_and_certificate_services import generate_key_and_certificate, generate_key_pair
+from services.revocation import RevocationService
+from tests.fakes import FakeDatabase
+
+
+@pytest.fixture
+def ca(monkeypatch):
+    """
+    CA interna criada em um banco de dados em memória, no lugar da instância da aplicação.
+    """
+    authority = CertificateAuthority(enabled=True, key_algorithm="ecdsa-p256", password="teste")
+    monkeypatch.setattr(certificate_authority_module, "certificate_authority", authority)
+    return authority
+
+
+def issued_certificate(authority: CertificateAuthority) -> bytes:
+    _, public_key = generate_key_pair("ecdsa-p256")
+    return authority.issue(public_key, "Alice", "alice@ipb.pt")
+
+
+async def started_service(db: FakeDatabase) -> RevocationService:
+    service = RevocationService(update_interval=300)
+    await service.start(db)
+    await service.stop()
+    return service
+
+
+def test_is_revoked_answers_from_memory_until_the_set_is_stale(ca):
+    async def scenario():
+        db = FakeDatabase()
+        await ca.start(db)
+        certificate = issued_certificate(ca)
+        worker, other = await started_service(db), await started_service(db)
+        await other.revoke(certificate, "user", "key_compromise")
+        reads = db.revoked_certificates.reads
+        generation = worker.generation
+        # Sem change stream, a revogação feita no outro processo só é vista no nextUpdate
+        assert not await worker.is_revoked(certificate)
+        assert db.revoked_certificates.reads == reads
+
+        worker.next_update = datetime.now(timezone.utc) - timedelta(seconds=1)
+        results = await asyncio.gather(*(worker.is_revoked(certificate) for _ in range(5)))
+        assert all(results)
+        # Um único recarregamento para os pedidos concorrentes
+        assert db.revoked_certificates.reads == reads + 1
+        assert worker.generation != generation
+        assert [entry.serial_number for entry in x509.load_der_x509_crl(worker.crl)] == [
+            x509.load_pem_x509_certificate(certificate).serial_number
+        ]
+
+    asyncio.run(scenario())
+
+
+def test_change_stream_brings_revocations_from_other_processes(ca):
+    async def scenario():
+        db = FakeDatabase()
+        await ca.start(db)
+        certificate = issued_certificate(ca)
+        worker = RevocationService(update_interval=300)
+        await worker.start(db)
+        other = await started_service(db)
+        try:
+            while worker.stats()["mode"] != "change_stream":
+                await asyncio.sleep(0.005)
+            await other.revoke(certificate, "user", "key_compromise")
+            reads = db.revoked_certificates.reads
+            for _ in range(100):
+                if await worker.is_revoked(certificate):
+                    break
+                await asyncio.sleep(0.01)
+            assert await worker.is_revoked(certificate)
+            assert db.revoked_certificates.reads == reads
+            assert len(x509.load_der_x509_crl(worker.crl)) == 1
+        finally:
+            await worker.stop()
+
+    asyncio.run(scenario())
+
+
+def test_crl_numbers_increase_across_processes(ca):
+    async def scenario():
+        db = FakeDatabase()
+        await ca.start(db)
+        services = [await started_service(db) for _ in range(3)]
+        numbers = []
+        for service in services * 2:
+            await service._publish()
+            crl = x509.load_der_x509_crl(service.crl)
+            numbers.append(crl.extensions.get_extension_for_class(x509.CRLNumber).value.crl_number)
+        assert numbers == sorted(set(numbers))
+        assert len(numbers) == 6
+
+    asyncio.run(scenario())
+
+
+def test_revoke_is_idempotent_and_checks_the_reason():
+    async def scenario():
+        db = FakeDatabase()
+        service = await started_service(db)
+        _, _, certificate = generate_key_and_certificate("Bob", key_algorithm="ecdsa-p256")
+        with pytest.raises(ValueError):
+            await service.revoke(certificate, "user", "nope")
+        first = await service.revoke(certificate, "user", "superseded")
+        assert await service.revoke(certificate, "user") == first
+        assert len(db.revoked_certificates.documents) == 1
+        # Sem CA interna não há CRL
+        assert service.crl is None
+        assert await service.is_revoked(certificate)
+
+    asyncio.run(scenario())
+
+
+def test_reload_sees_revocations_from_other_processes(ca):
+    async def scenario():
+        db = FakeDatabase()
+        await ca.start(db)
+        certificate = issued_certificate(ca)
+        loaded = x509.load_pem_x509_certificate(certificate)
+        worker, other = await started_service(db), await started_service(db)
+        await other.revoke(certificate, "user")
+        identifier = {"issuer": loaded.issuer.public_bytes(), "serial_number": loaded.serial_number}
+        assert worker.revoked_for([identifier]) == {}
+        await worker.load()
+        assert list(worker.revoked_for([identifier]).values())[0]["reason"] == "unspecified"
+
+    asyncio.run(scenario())
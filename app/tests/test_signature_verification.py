@@ -0,0 +1,120 @@
+import pytest
+
+from services.signer_services import (
+    TrustAnchors,
+    revision_changes,
+    sign_pdf,
+    verify_document,
+    verify_signature,
+)
+from tests.documents import load_document, new_signer, signed_document
+from utils.pdf_utils import PdfSyntaxError, SignatureField, find_signatures
+
+KEY_ALGORITHMS = ["rsa-2048", "rsa-3072", "ecdsa-p256", "ecdsa-p384", "ed25519"]
+
+
+@pytest.mark.parametrize("key_algorithm", KEY_ALGORITHMS)
+def test_signed_document_is_validated(key_algorithm):
+    signed, trusted_signers = signed_document(key_algorithm)
+
+    result = verify_document(signed, trusted_signers)
+
+    assert result["validated"] is True
+    assert result["signatures"]["contact"] == "alice@ipb.pt"
+
+
+@pytest.mark.parametrize("key_algorithm", KEY_ALGORITHMS)
+def test_content_appended_after_last_signature_is_rejected(key_algorithm):
+    signed, trusted_signers = signed_document(key_algorithm)
+    tampered = signed + b"\n1 0 obj\n<< /Evil true >>\nendobj\n"
+
+    result = verify_document(tampered, trusted_signers)
+
+    assert result["validated"] is False
+    # O relatório por assinatura aponta a mesma alteração
+    assert revision_changes(find_signatures(tampered), len(tampered))[-1]["unsigned_changes_after"]
+
+
+def test_modified_signed_bytes_are_rejected():
+    signed, trusted_signers = signed_document()
+    position = signed.index(b"/Type") + 1
+    tampered = signed[:position] + b"X" + signed[position + 1 :]
+
+    assert verify_document(tampered, trusted_signers)["validated"] is False
+
+
+def test_untrusted_signer_is_rejected():
+    signed, _ = signed_document()
+    _, other = signed_document()
+
+    assert verify_document(signed, other)["validated"] is False
+
+
+def test_weak_digest_algorithm_is_rejected(monkeypatch):
+    import services.key_and_certificate_services as keys
+
+    signer = new_signer()
+    monkeypatch.setattr(keys, "digest_algorithm_for", lambda key: "sha1")
+    signed, trusted_signers = signed_document(signer=signer)
+
+    result = verify_document(signed, trusted_signers)
+
+    assert result["validated"] is False
+    assert "sha1" in result["error"]
+
+
+def test_more_than_one_signer_info_is_rejected():
+    from asn1crypto import cms
+
+    signed, trusted_signers = signed_document()
+    field = find_signatures(signed)[-1]
+    content_info = cms.ContentInfo.load(field.contents)
+    signed_data = content_info["content"]
+    signer_info = signed_data["signer_infos"][0]
+    signed_data["signer_infos"] = cms.SignerInfos([signer_info, signer_info.copy()])
+    forged = SignatureField(field.byte_range, content_info.dump(force=True), field.dictionary)
+
+    result = verify_signature(signed, forged, TrustAnchors([trusted_signers[0]["certificate"]]))
+
+    assert result["signature_ok"] is False
+    assert "SignerInfo" in result["error"]
+
+
+def replace_byte_range(document: bytes, old: list[int], new: list[int]) -> bytes:
+    """
+    Substitui um /ByteRange mantendo o tamanho do documento (o /ByteRange tem espaços
+    de reserva depois do "]").
+    """
+    old_text = b"/ByteRange [%d %d %d %d]" % tuple(old)
+    new_text = b"/ByteRange [%d %d %d %d]" % tuple(new)
+    position = document.index(old_text)
+    padding = len(old_text) + 20 - len(new_text)
+    assert document[position + len(old_text) : position + len(old_text) + 20] == b" " * 20
+    return document[:position] + new_text + b" " * padding + document[position + len(old_text) + 20 :]
+
+
+def test_unsigned_prefix_is_rejected():
+    signed, trusted_signers = signed_document()
+    start1, length1, start2, length2 = find_signatures(signed)[-1].byte_range
+    prefix = b"%" + b"x" * 30 + b"\n"
+    # Os bytes assinados continuam a ser os mesmos, mas o prefixo não está assinado
+    tampered = prefix + replace_byte_range(
+        signed, [start1, length1, start2, length2], [len(prefix), length1, start2 + len(prefix), length2]
+    )
+
+    with pytest.raises(PdfSyntaxError):
+        find_signatures(tampered)
+    assert verify_document(tampered, trusted_signers)["validated"] is False
+
+
+def test_later_signature_must_cover_the_earlier_revisions():
+    signed, trusted_signers = signed_document()
+    twice = sign_pdf(signed, new_signer(), "Visto", "Bragança")
+    first, second = find_signatures(twice)
+    assert first.byte_range[0] == second.byte_range[0] == 0
+    # A segunda assinatura aponta para o /Contents da primeira: não cobre a primeira revisão
+    start1, length1, start2, _ = first.byte_range
+    forged = replace_byte_range(twice, second.byte_range, [start1, length1, start2, len(twice) - start2])
+
+    with pytest.raises(PdfSyntaxError):
+        find_signatures(forged)
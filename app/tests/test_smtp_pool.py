@@ -0,0 +1,115 @@
+import asyncio
+import smtplib
+
+import pytest
+
+from benchmarks.smtp_server import StandInSmtpServer
+from services.email_services import build_message
+from services.smtp_pool import SmtpServerPool
+
+SENDER = "teste@ipb.pt"
+RECIPIENTS = ["destinatario@ipb.pt"]
+
+
+def message(subject: str = "Documento assinado"):
+    return build_message(SENDER, "Teste", RECIPIENTS, subject, "Segue em anexo.", "doc.pdf", b"%PDF-1.7")
+
+
+async def started_server(**kwargs) -> StandInSmtpServer:
+    server = StandInSmtpServer(**kwargs)
+    await server.start()
+    return server
+
+
+def new_pool(server: StandInSmtpServer, **kwargs) -> SmtpServerPool:
+    return SmtpServerPool(server.host, server.port, "teste", "senha", starttls=False, **kwargs)
+
+
+def run(scenario):
+    asyncio.run(asyncio.wait_for(scenario(), 30))
+
+
+def test_sessions_are_reused():
+    async def scenario():
+        server = await started_server()
+        pool = new_pool(server)
+        for i in range(5):
+            await pool.send(message(f"Envio {i}"), SENDER, RECIPIENTS)
+        assert len(server.messages) == 5
+        assert server.connections == 1
+        assert pool.stats()["sent"] == 5
+        await asyncio.to_thread(pool.close)
+        await server.stop()
+
+    run(scenario)
+
+
+def test_session_closed_by_the_server_is_replaced_before_sending():
+    async def scenario():
+        server = await started_server(idle_timeout=0.2)
+        pool = new_pool(server)
+        await pool.send(message(), SENDER, RECIPIENTS)
+        await asyncio.sleep(0.5)
+        await pool.send(message(), SENDER, RECIPIENTS)
+        assert len(server.messages) == 2
+        assert server.connections == 2
+        assert pool.stats()["reconnects"] == 1
+        await asyncio.to_thread(pool.close)
+        await server.stop()
+
+    run(scenario)
+
+
+def test_concurrent_sends_are_capped_at_max_sessions():
+    async def scenario():
+        server = await started_server(latency=0.01)
+        pool = new_pool(server, max_sessions=3)
+        await asyncio.gather(*(pool.send(message(), SENDER, RECIPIENTS) for _ in range(20)))
+        assert len(server.messages) == 20
+        assert server.connections <= 3
+        assert pool.stats()["in_use"] == 0
+        await asyncio.to_thread(pool.close)
+        await server.stop()
+
+    run(scenario)
+
+
+def test_failure_after_data_is_not_retried():
+    async def scenario():
+        server = await started_server()
+        pool = new_pool(server)
+        await pool.send(message(), SENDER, RECIPIENTS)
+        server.drop_after_data = 1
+        with pytest.raises(smtplib.SMTPServerDisconnected):
+            await pool.send(message(), SENDER, RECIPIENTS)
+        # A mensagem chegou ao servidor uma única vez
+        assert len(server.messages) == 2
+        assert pool.stats()["failed"] == 1
+        await pool.send(message(), SENDER, RECIPIENTS)
+        assert len(server.messages) == 3
+        await asyncio.to_thread(pool.close)
+        await server.stop()
+
+    run(scenario)
+
+
+def test_cancelled_send_returns_the_session_to_the_pool():
+    async def scenario():
+        server = await started_server(latency=0.05)
+        pool = new_pool(server, max_sessions=1)
+        task = asyncio.ensure_future(pool.send(message(), SENDER, RECIPIENTS))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # O envio termina na thread e a sessão volta ao pool
+        while pool.stats()["in_use"]:
+            await asyncio.sleep(0.05)
+        assert pool.stats()["idle"] == 1
+        await pool.send(message(), SENDER, RECIPIENTS)
+        assert len(server.messages) == 2
+        assert server.connections == 1
+        await asyncio.to_thread(pool.close)
+        await server.stop()
+
+    run(scenario)
@@ -0,0 +1,145 @@
+import asyncio
+import hashlib
+from tempfile import SpooledTemporaryFile
+from urllib.parse import unquote
+
+import pytest
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import StreamingResponse
+
+from utils.upload_utils import attachment_headers, spool_upload
+
+
+def upload(content: bytes, spool_max_size: int) -> UploadFile:
+    # Como o Starlette: em memória até spool_max_size bytes, depois em um arquivo sem nome
+    file = SpooledTemporaryFile(max_size=spool_max_size)
+    file.write(content)
+    file.seek(0)
+    return UploadFile(file, filename="doc.pdf")
+
+
+@pytest.mark.parametrize("spool_max_size", [1024 * 1024, 16], ids=["memory", "disk"])
+def test_upload_is_spooled_once_with_its_hashes(spool_max_size):
+    content = b"%PDF-1.7\n" + bytes(range(256)) * 64
+    document = asyncio.run(spool_upload(upload(content, spool_max_size), hash_algorithm="sha512"))
+    try:
+        assert document.read() == content
+        assert document.size == len(content)
+        assert document.hash == hashlib.sha512(content).hexdigest()
+        assert document.sha256 == hashlib.sha256(content).hexdigest()
+    finally:
+        document.cleanup()
+
+
+def test_empty_upload():
+    document = asyncio.run(spool_upload(upload(b"", 16)))
+    assert document.size == 0 and document.sha256 == hashlib.sha256(b"").hexdigest()
+    document.cleanup()
+
+
+def test_upload_above_the_limit_is_rejected(tmp_path, monkeypatch):
+    monkeypatch.setattr("utils.upload_utils.UPLOAD_TMP_DIR", str(tmp_path))
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(spool_upload(upload(b"x" * 100, 16), max_size=50))
+    assert error.value.status_code == 413
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize("filename", ["contrato_€.pdf", "合同.pdf", 'relatório "final".pdf'])
+def test_attachment_headers_are_latin1_and_keep_the_name(filename):
+    headers = attachment_headers(filename)
+    # O Starlette codifica os cabeçalhos em latin-1 ao criar a resposta
+    response = StreamingResponse(iter([b""]), headers=headers)
+    disposition = response.headers["content-disposition"]
+    fallback = disposition.split('filename="', 1)[1].split('"', 1)[0]
+    assert fallback.isascii() and '"' not in fallback
+    assert unquote(disposition.split("filename*=UTF-8''", 1)[1]) == filename
+    assert unquote(response.headers["x-document-filename"]) == filename
+
+
+def upload_app(monkeypatch):
+    from fastapi import FastAPI, File, Form
+
+    from utils import upload_utils
+    from utils.upload_utils import UploadRoute
+
+    app = FastAPI()
+    app.router.route_class = UploadRoute
+    spooled, pending = [], []
+    spool_file = upload_utils._spool_file
+
+    def spy(source, max_size, hashers):
+        pending.extend(hasher.algorithm for hasher in hashers)
+        return spool_file(source, max_size, hashers)
+
+    monkeypatch.setattr(upload_utils, "_spool_file", spy)
+
+    @app.post("/upload")
+    async def receive(hash_algorithm: str = Form("sha256"), file: UploadFile = File(...)):
+        document = await spool_upload(file, hash_algorithm=hash_algorithm)
+        spooled.append(document)
+        return {
+            "hash": document.hash,
+            "sha256": document.sha256,
+            "pending": pending,
+            "adopted": document.path == file.file.path,
+            "content": document.read() == content,
+        }
+
+    # Maior do que o limite em memória do Starlette (1 MB): passa para disco
+    content = b"%PDF-1.7\n" + bytes(range(256)) * 8192
+    return app, spooled, content
+
+
+@pytest.mark.parametrize("algorithm", ["sha256", "sha512"])
+def test_upload_is_hashed_while_received_and_adopted_without_copy(monkeypatch, algorithm):
+    from fastapi.testclient import TestClient
+
+    app, spooled, content = upload_app(monkeypatch)
+    with TestClient(app) as client:
+        # hash_algorithm antes do arquivo: o hash pedido também é calculado na recepção
+        response = client.post(
+            "/upload", data={"hash_algorithm": algorithm}, files={"file": ("doc.pdf", content)}
+        )
+    try:
+        assert response.status_code == 200
+        assert response.json() == {
+            "hash": hashlib.new(algorithm, content).hexdigest(),
+            "sha256": hashlib.sha256(content).hexdigest(),
+            "pending": [],
+            "adopted": True,
+            "content": True,
+        }
+    finally:
+        for document in spooled:
+            document.cleanup()
+
+
+def test_upload_above_the_limit_is_refused_while_received(monkeypatch, tmp_path):
+    from starlette.datastructures import Headers
+
+    from utils import upload_utils
+
+    monkeypatch.setattr(upload_utils, "UPLOAD_TMP_DIR", str(tmp_path))
+    content = b"%PDF-1.7\n" + bytes(range(256)) * 8192
+    body = (
+        b"--limite\r\n"
+        b'Content-Disposition: form-data; name="file"; filename="doc.pdf"\r\n\r\n'
+        + content
+        + b"\r\n--limite--\r\n"
+    )
+    received = []
+
+    async def stream():
+        for start in range(0, len(body), 64 * 1024):
+            received.append(start)
+            yield body[start:start + 64 * 1024]
+
+    parser = upload_utils.UploadParser(Headers({"Content-Type": "multipart/form-data; boundary=limite"}), stream())
+    # Recusado depois de o upload ter passado para disco (1 MB), antes do fim do corpo
+    parser.max_size = len(content) - 256 * 1024
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(parser.parse())
+    assert error.value.status_code == 413
+    assert len(received) < len(body) // (64 * 1024)
+    assert list(tmp_path.iterdir()) == []
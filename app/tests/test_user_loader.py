@@ -0,0 +1,115 @@
+import asyncio
+
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+from services.certificate_store import CertificateStore, certificate_record
+from services.key_and_certificate_services import generate_key_and_certificate
+from services.user_loader import UserLoader
+from tests.fakes import FakeDatabase
+
+
+def new_users(count: int) -> list[dict]:
+    return [
+        {"_id": ObjectId(), "name": f"User {i}", "email": f"u{i}@ipb.pt", "password": "segredo"}
+        for i in range(count)
+    ]
+
+
+async def started_loader(users: list[dict]) -> tuple[UserLoader, FakeDatabase]:
+    db = FakeDatabase(users)
+    loader = UserLoader(batch_window=0.01)
+    await loader.start(db)
+    return loader, db
+
+
+def test_concurrent_loads_of_one_user_share_a_query():
+    async def scenario():
+        users = new_users(1)
+        loader, db = await started_loader(users)
+        results = await asyncio.gather(*(loader.load(str(users[0]["_id"])) for _ in range(20)))
+        assert len(db.users.queries) == 1
+        assert all(user["email"] == "u0@ipb.pt" for user in results)
+        assert "password" not in results[0]
+        # Os pedidos seguintes são servidos pelo cache
+        await loader.load(users[0]["_id"])
+        assert len(db.users.queries) == 1
+
+    asyncio.run(scenario())
+
+
+def test_loads_of_different_users_are_batched():
+    async def scenario():
+        users = new_users(10)
+        loader, db = await started_loader(users)
+        found = await loader.load_many([user["_id"] for user in users] + [ObjectId()])
+        assert len(found) == 10
+        assert len(db.users.queries) == 1
+
+    asyncio.run(scenario())
+
+
+def test_invalidation_while_queued_resolves_every_caller():
+    async def scenario():
+        users = new_users(1)
+        user_id = users[0]["_id"]
+        loader, db = await started_loader(users)
+        first = asyncio.ensure_future(loader.load(user_id))
+        await asyncio.sleep(0)
+        loader.invalidate(user_id)
+        second = asyncio.ensure_future(loader.load(user_id))
+        results = await asyncio.wait_for(asyncio.gather(first, second), 1)
+        assert [user["_id"] for user in results] == [user_id, user_id]
+        assert len(db.users.queries) == 1
+
+    asyncio.run(scenario())
+
+
+def test_invalidation_during_query_forces_a_new_read():
+    async def scenario():
+        users = new_users(1)
+        user_id = users[0]["_id"]
+        loader, db = await started_loader(users)
+        db.users.gate = asyncio.Event()
+        stale = asyncio.ensure_future(loader.load(user_id))
+        while not db.users.queries:
+            await asyncio.sleep(0.005)
+        # Escrita feita enquanto a consulta está em curso
+        db.users.documents[user_id]["name"] = "Novo nome"
+        loader.invalidate(user_id)
+        fresh = asyncio.ensure_future(loader.load(user_id))
+        db.users.gate.set()
+        await asyncio.wait_for(asyncio.gather(stale, fresh), 1)
+        assert fresh.result()["name"] == "Novo nome"
+        assert len(db.users.queries) == 2
+        # O resultado da consulta antiga não fica no cache
+        assert (await loader.load(user_id))["name"] == "Novo nome"
+        assert len(db.users.queries) == 2
+
+    asyncio.run(scenario())
+
+
+def test_current_certificate_is_loaded_with_the_user():
+    async def scenario():
+        users = new_users(1)
+        user_id = users[0]["_id"]
+        loader, db = await started_loader(users)
+        store = CertificateStore()
+        await store.start(db)
+        certificate = generate_key_and_certificate("Alice", key_algorithm="ecdsa-p256")[2]
+        await store.record(user_id, certificate, "self_signed")
+
+        async def find_one(*args, **kwargs):
+            raise AssertionError("O certificado atual deve vir com o usuário")
+
+        store.collection.find_one = find_one
+        assert await store.current(await loader.load(user_id)) == certificate
+        # A revogação é vista depois de invalidar o usuário
+        fingerprint = certificate_record(user_id, certificate, "self_signed")["fingerprint"]
+        await store.mark_revoked(fingerprint, "key_compromise", datetime.now(timezone.utc))
+        loader.invalidate(user_id)
+        assert await store.current(await loader.load(user_id)) is None
+        assert len(db.users.queries) == 2
+
+    asyncio.run(scenario())
@@ -0,0 +1,66 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from controllers.user_controller import UserController, create_user_indexes
+from models.request_models import RegisterUserRequest
+from tests.fakes import FakeCollection
+from utils.password_utils import PasswordHasher, PasswordHasherBusyError
+
+
+class UsersDatabase:
+    def __init__(self, users: list[dict] = ()):
+        self.users = FakeCollection()
+        self.users.documents = [dict(user) for user in users]
+
+
+def request(email: str) -> RegisterUserRequest:
+    return RegisterUserRequest(name="Alice", email=email, password="segredo")
+
+
+def test_duplicate_email_is_rejected_by_the_unique_index():
+    async def scenario():
+        db = UsersDatabase()
+        await create_user_indexes(db)
+        controller = UserController(db)
+        await controller.register(request("alice@ipb.pt"))
+        with pytest.raises(HTTPException) as error:
+            await controller.register(request("alice@ipb.pt"))
+        assert error.value.status_code == 400
+        assert len(db.users.documents) == 1
+
+    asyncio.run(scenario())
+
+
+def test_email_is_checked_while_the_unique_index_is_missing():
+    async def scenario():
+        # E-mails repetidos de antes do índice: o índice único não pode ser criado
+        db = UsersDatabase([{"email": "bob@ipb.pt"}, {"email": "bob@ipb.pt"}])
+        await create_user_indexes(db)
+        assert db.users.unique == []
+        controller = UserController(db)
+        with pytest.raises(HTTPException) as error:
+            await controller.register(request("bob@ipb.pt"))
+        assert error.value.status_code == 400
+        await controller.register(request("alice@ipb.pt"))
+        assert len(db.users.documents) == 3
+
+    asyncio.run(scenario())
+
+
+def test_password_hasher_rejects_work_above_its_queue():
+    async def scenario():
+        release = threading.Event()
+        hasher = PasswordHasher(max_workers=1, queue_depth=1)
+        running = [asyncio.ensure_future(hasher._run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        with pytest.raises(PasswordHasherBusyError):
+            await hasher.hash("segredo")
+        release.set()
+        await asyncio.gather(*running)
+        assert await hasher.verify("segredo", await hasher.hash("segredo")) == (True, False)
+        hasher.shutdown()
+
+    asyncio.run(scenario())
@@ -0,0 +1,96 @@
+import asyncio
+import hashlib
+
+import pytest
+
+import controllers.document_controller as document_controller_module
+import services.revocation as revocation_module
+import services.verification_cache as verification_cache_module
+from controllers.document_controller import DocumentController
+from services.revocation import RevocationService
+from services.trust_store import TrustStore
+from services.verification_cache import VerificationCache, validation_generation
+from tests.documents import signed_document
+from tests.fakes import FakeDatabase
+
+
+class InlineExecutor:
+    """
+    Executa as tarefas no próprio processo, em vez do pool de processos, e conta-as.
+    """
+
+    def __init__(self):
+        self.calls = 0
+
+    async def run(self, fn, *args, **kwargs):
+        self.calls += 1
+        return fn(*args)
+
+
+@pytest.fixture
+def services(monkeypatch):
+    """
+    Cache de validação, conjunto de certificados revogados e pool de processos novos,
+    no lugar das instâncias da aplicação.
+    """
+    cache, revocation, executor = VerificationCache(), RevocationService(update_interval=300), InlineExecutor()
+    monkeypatch.setattr(verification_cache_module, "verification_cache", cache)
+    monkeypatch.setattr(revocation_module, "revocation", revocation)
+    monkeypatch.setattr(document_controller_module, "cpu_executor", executor)
+    return cache, revocation, executor
+
+
+def test_cached_result_follows_the_trust_store_and_revocations(services, tmp_path):
+    async def scenario():
+        _, revocation, executor = services
+        await revocation.start(FakeDatabase())
+        await revocation.stop()
+        signed, trusted_signers = signed_document("ecdsa-p256")
+        path = tmp_path / "signed.pdf"
+        path.write_bytes(signed)
+        sha256 = hashlib.sha256(signed).hexdigest()
+        store, controller = TrustStore(), DocumentController(None)
+
+        async def verify():
+            return await controller.verify_document(str(path), sha256, store=store)
+
+        assert (await verify())["validated"] is False
+        calls = executor.calls
+        assert (await verify())["validated"] is False
+        assert executor.calls == calls
+
+        # Um certificado novo no trust store muda a geração: o resultado não é reutilizado
+        store.add_certificate("alice", "Alice", "alice@ipb.pt", trusted_signers[0]["certificate"])
+        assert (await verify())["validated"] is True
+        assert executor.calls > calls
+
+        # Assim como uma revogação
+        await revocation.revoke(trusted_signers[0]["certificate"], "alice", "key_compromise")
+        result = await verify()
+        assert result["validated"] is False
+        assert result["revocation"]["reason"] == "key_compromise"
+
+    asyncio.run(scenario())
+
+
+def test_invalidate_keeps_only_the_current_generation(services):
+    async def scenario():
+        cache = VerificationCache(ttl=60)
+        await cache.start(FakeDatabase(), use_mongo=True)
+        store = TrustStore()
+        old = validation_generation(store)
+        await cache.set("a" * 64, old, {"validated": False})
+        _, trusted_signers = signed_document("ecdsa-p256")
+        store.add_certificate("alice", "Alice", "alice@ipb.pt", trusted_signers[0]["certificate"])
+        current = validation_generation(store)
+        assert current != old
+        await cache.set("b" * 64, current, {"validated": True})
+
+        await cache.invalidate(current)
+        assert await cache.get("a" * 64, old) is None
+        assert [document["generation"] for document in cache.collection.documents] == [current]
+        # O resultado da geração atual é lido do MongoDB, depois de limpar a memória
+        assert await cache.get("b" * 64, current) == {"validated": True}
+        assert cache.stats()["mongo"] == {"hits": 1, "misses": 1}
+
+    asyncio.run(scenario())
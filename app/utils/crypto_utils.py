@@ -1,26 +1,174 @@
+import base64
 import hashlib
+from cryptography import x509
+from config import CERT_CACHE_SIZE, CERT_CACHE_TTL
+from utils.cache import TTLCache
 
-def create_hash(input_file: bytes) -> str:
+_certificate_cache = TTLCache(CERT_CACHE_SIZE, CERT_CACHE_TTL)
+
+# Algoritmos de hash que podem ser escolhidos em cada pedido
+HASH_ALGORITHMS = ("sha256", "sha512", "blake2b")
+
+
+def _hash_function(algorithm: str):
+    if algorithm not in HASH_ALGORITHMS:
+        raise ValueError(f"Algoritmo de hash não suportado: {algorithm}")
+    return hashlib.new(algorithm)
+
+
+class StreamingHasher:
+    """
+    Calcula um hash de forma incremental, bloco a bloco, para que o hash de um
+    documento possa ser obtido enquanto este é recebido ou copiado, sem uma segunda
+    leitura completa do documento.
+    """
+
+    def __init__(self, algorithm: str = "sha256"):
+        self.algorithm = algorithm
+        self._hash = _hash_function(algorithm)
+        self.size = 0
+
+    def update(self, chunk: bytes) -> "StreamingHasher":
+        self._hash.update(chunk)
+        self.size += len(chunk)
+        return self
+
+    def hexdigest(self) -> str:
+        return self._hash.hexdigest()
+
+
+def create_hash(input_file: bytes, algorithm: str = "sha256") -> str:
     """
     Cria um hash a partir de um arquivo em bytes.
 
-    :param input_file: O conteúdo do arquivo em bytes.
-    O algoritmo de hash a ser utilizado é 'sha256').
+    :param input_file: O conteúdo do arquivo em bytes (ou um mmap).
+    :param algorithm: O algoritmo de hash ('sha256', 'sha512' ou 'blake2b').
     :return: O hash gerado em formato hexadecimal.
     """
-    hash_func = hashlib.new("sha256")
+    hash_func = _hash_function(algorithm)
     hash_func.update(input_file)
     return hash_func.hexdigest()
 
 
-def verify_hash(input_file: bytes, hash: str) -> bool:
+def compare_hash(hash: str | bytes, expected: str | bytes) -> bool:
+    """
+    Compara dois hashes em hexadecimal em tempo constante, ignorando espaços,
+    quebras de linha e maiúsculas.
+
+    :param hash: O hash calculado.
+    :param expected: O hash esperado.
+    :return: True se os hashes forem iguais, False caso contrário.
+    """
+    import hmac
+
+    if isinstance(hash, str):
+        hash = hash.encode()
+    if isinstance(expected, str):
+        expected = expected.encode()
+    return hmac.compare_digest(hash.strip().lower(), expected.strip().lower())
+
+
+def parse_hash_manifest(content: bytes) -> dict[str, str]:
+    """
+    Interpreta um manifesto com os hashes esperados de vários documentos. São aceitos
+    um objeto JSON {"nome do arquivo": "hash"} ou o formato do sha256sum, uma linha
+    "hash  nome do arquivo" por documento.
+
+    :param content: O conteúdo do manifesto.
+    :return: Um dicionário nome do arquivo -> hash em hexadecimal.
+    """
+    import json
+
+    text = content.decode("utf-8-sig").strip()
+    if text.startswith("{"):
+        manifest = json.loads(text)
+        if not all(isinstance(value, str) for value in manifest.values()):
+            raise ValueError("Os hashes do manifesto têm de ser strings")
+        return manifest
+    manifest = {}
+    for number, line in enumerate(text.splitlines(), start=1):
+        if not line.strip():
+            continue
+        parts = line.strip().split(maxsplit=1)
+        if len(parts) != 2:
+            raise ValueError(f"Linha {number} do manifesto inválida")
+        # O sha256sum marca os arquivos lidos em modo binário com "*"
+        manifest[parts[1].lstrip("*")] = parts[0]
+    return manifest
+
+
+def verify_hash(input_file: bytes, hash: str, algorithm: str = "sha256") -> bool:
     """
     Verifica se o hash gerado a partir do arquivo em bytes corresponde ao hash esperado.
 
     :param input_file: O conteúdo do arquivo em bytes.
     :param hash: O hash esperado para comparação.
-    O algoritmo de hash a ser utilizado é 'sha256').
+    :param algorithm: O algoritmo de hash ('sha256', 'sha512' ou 'blake2b').
     :return: True se os hashes corresponderem, False caso contrário.
     """
-    hash_gerado = create_hash(input_file)
-    return hash_gerado == hash
\ No newline at end of file
+    hash_gerado = create_hash(input_file, algorithm)
+    return compare_hash(hash_gerado, hash)
+
+
+def certificate_to_der(cert: bytes) -> bytes:
+    """
+    Converte um certificado em PEM para DER. Se o certificado já estiver em DER,
+    é retornado sem alterações.
+
+    :param cert: O certificado em formato PEM ou DER.
+    :return: O certificado em formato DER.
+    """
+    if not cert.lstrip().startswith(b"-----BEGIN"):
+        return cert
+    body = b"".join(
+        line for line in cert.strip().splitlines() if not line.startswith(b"-----")
+    )
+    return base64.b64decode(body)
+
+
+def certificate_fingerprint(cert: bytes) -> str:
+    """
+    Calcula a impressão digital SHA-256 de um certificado (PEM ou DER) sem o carregar.
+
+    :param cert: O certificado em formato PEM ou DER.
+    :return: A impressão digital em formato hexadecimal.
+    """
+    return hashlib.sha256(certificate_to_der(cert)).hexdigest()
+
+
+def load_certificate(cert: bytes) -> x509.Certificate:
+    """
+    Carrega um certificado (PEM ou DER) utilizando um cache LRU com TTL indexado
+    pela impressão digital SHA-256, para que o mesmo certificado só seja
+    interpretado uma vez por processo.
+
+    :param cert: O certificado em formato PEM ou DER.
+    :return: O objeto x509.Certificate correspondente.
+    """
+    der = certificate_to_der(cert)
+    fingerprint = hashlib.sha256(der).hexdigest()
+    certificate = _certificate_cache.get(fingerprint)
+    if certificate is None:
+        certificate = x509.load_der_x509_certificate(der)
+        _certificate_cache.set(fingerprint, certificate)
+    return certificate
+
+
+def revocation_key(issuer: bytes, serial_number: int) -> str:
+    """
+    Identifica um certificado no conjunto de certificados revogados: o número de série
+    só é único para cada emissor, por isso a chave inclui um hash do emissor.
+
+    :param issuer: O nome do emissor do certificado em DER.
+    :param serial_number: O número de série do certificado.
+    :return: A chave "hash do emissor:número de série" em hexadecimal.
+    """
+    return f"{hashlib.sha256(issuer).hexdigest()[:16]}:{serial_number:x}"
+
+
+def certificate_expiry(cert: bytes):
+    """
+    Data (UTC) em que o certificado (PEM ou DER) expira, guardada em
+    users.certificate_not_valid_after para a renovação automática.
+    """
+    return load_certificate(cert).not_valid_after_utc
@@ -0,0 +1,39 @@
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from config import (
+    MONGODB_URI,
+    MONGO_MIN_POOL_SIZE,
+    MONGO_MAX_POOL_SIZE,
+    MONGO_MAX_IDLE_TIME_MS,
+    MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    MONGO_CONNECT_TIMEOUT_MS,
+    MONGO_SERVER_SELECTION_TIMEOUT_MS,
+)
+
+
+def create_client(uri: str = MONGODB_URI) -> AsyncIOMotorClient:
+    """
+    Cliente MongoDB com o pool de conexões e os tempos limite definidos em config.
+    O cliente deve ser criado com o event loop já em execução (no lifespan da aplicação)
+    e compartilhado por todos os pedidos.
+    """
+    return AsyncIOMotorClient(
+        uri,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    )
+
+
+def pool_options() -> dict:
+    return {
+        "min_pool_size": MONGO_MIN_POOL_SIZE,
+        "max_pool_size": MONGO_MAX_POOL_SIZE,
+        "max_idle_time_ms": MONGO_MAX_IDLE_TIME_MS,
+        "wait_queue_timeout_ms": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "connect_timeout_ms": MONGO_CONNECT_TIMEOUT_MS,
+        "server_selection_timeout_ms": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    }
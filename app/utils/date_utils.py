@@ -0,0 +1,9 @@
+from datetime import datetime, timezone
+
+
+def as_utc(value: datetime) -> datetime:
+    """
+    Data com fuso horário UTC. O MongoDB retorna as datas sem fuso horário (em UTC),
+    que não podem ser comparadas com as de datetime.now(timezone.utc).
+    """
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
@@ -0,0 +1,107 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from config import (
+    PASSWORD_HASH_WORKERS,
+    PASSWORD_HASH_QUEUE_DEPTH,
+    PASSWORD_SCRYPT_N,
+    PASSWORD_SCRYPT_R,
+    PASSWORD_SCRYPT_P,
+)
+
+# Prefixo das passwords guardadas com hash; as demais são passwords antigas em claro
+SCRYPT_PREFIX = "scrypt"
+
+
+class PasswordHasherBusyError(Exception):
+    """
+    Lançada quando o PasswordHasher já tem o número máximo de hashes em execução e em
+    espera.
+    """
+
+
+def hash_password(password: str, n: int = PASSWORD_SCRYPT_N, r: int = PASSWORD_SCRYPT_R, p: int = PASSWORD_SCRYPT_P) -> str:
+    """
+    Calcula o hash scrypt (memory-hard) de uma password com um salt aleatório, no
+    formato "scrypt$N$r$p$salt$hash" (salt e hash em base64).
+    """
+    salt = os.urandom(16)
+    digest = _scrypt(password, salt, n, r, p)
+    return "$".join(
+        [SCRYPT_PREFIX, str(n), str(r), str(p), base64.b64encode(salt).decode(), base64.b64encode(digest).decode()]
+    )
+
+
+def verify_password(password: str, stored: str) -> tuple[bool, bool]:
+    """
+    Verifica uma password em tempo constante. Retorna (válida, precisa de novo hash):
+    uma password antiga guardada em claro, ou com parâmetros do scrypt diferentes dos
+    atuais, deve ser substituída por um hash novo depois de um login válido.
+    """
+    if not stored.startswith(SCRYPT_PREFIX + "$"):
+        return hmac.compare_digest(password.encode(), stored.encode()), True
+    _, n, r, p, salt, digest = stored.split("$")
+    n, r, p = int(n), int(r), int(p)
+    valid = hmac.compare_digest(_scrypt(password, base64.b64decode(salt), n, r, p), base64.b64decode(digest))
+    return valid, (n, r, p) != (PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P)
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r * p, dklen=32)
+
+
+class PasswordHasher:
+    """
+    Executa os hashes das passwords em um pool de threads (o scrypt libera o GIL), para
+    que um pico de logins (ex: depois de um deploy) não bloqueie o event loop nem os
+    outros pedidos. O número de hashes em execução e em espera é limitado por
+    max_workers + queue_depth; acima disso é lançada PasswordHasherBusyError.
+    """
+
+    def __init__(self, max_workers: int = PASSWORD_HASH_WORKERS, queue_depth: int = PASSWORD_HASH_QUEUE_DEPTH):
+        self.max_workers = max(1, max_workers)
+        self.queue_depth = max(0, queue_depth)
+        self._executor: ThreadPoolExecutor | None = None
+        self._in_flight = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="password")
+        return self._executor
+
+    async def _run(self, fn, *args):
+        if self._in_flight >= self.max_workers + self.queue_depth:
+            raise PasswordHasherBusyError("O servidor está ocupado, tente novamente mais tarde")
+        self._in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self._in_flight -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password)
+
+    async def verify(self, password: str, stored: str) -> tuple[bool, bool]:
+        """
+        Ver verify_password.
+        """
+        return await self._run(verify_password, password, stored)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "max_workers": self.max_workers,
+            "queue_depth": self.queue_depth,
+            "in_flight": self._in_flight,
+        }
+
+
+password_hasher = PasswordHasher()
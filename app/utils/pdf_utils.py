@@ -0,0 +1,306 @@
+import re
+
+_WHITESPACE = b" \t\r\n\f\x00"
+_DELIMITERS = b"()<>[]{}/%"
+_NUMBER = re.compile(rb"[+-]?(\d+\.?\d*|\.\d+)")
+_CONTENTS = re.compile(rb"/Contents\s*<")
+_ESCAPES = {
+    ord("n"): b"\n",
+    ord("r"): b"\r",
+    ord("t"): b"\t",
+    ord("b"): b"\b",
+    ord("f"): b"\f",
+    ord("("): b"(",
+    ord(")"): b")",
+    ord("\\"): b"\\",
+}
+
+
+# O cabeçalho %PDF- pode não estar no início do arquivo, mas tem de estar no primeiro KB
+PDF_HEADER_WINDOW = 1024
+# As assinaturas são acrescentadas em atualizações incrementais no fim do arquivo; a
+# última tem de estar nesta janela (depois dela só pode vir o xref e o trailer)
+SIGNATURE_TAIL_WINDOW = 64 * 1024
+
+
+class PdfSyntaxError(ValueError):
+    pass
+
+
+def has_pdf_header(data) -> bool:
+    """
+    Indica se data (bytes ou mmap) começa com um cabeçalho PDF.
+    """
+    return data.find(b"%PDF-", 0, PDF_HEADER_WINDOW) != -1
+
+
+def has_signature_markers(data) -> bool:
+    """
+    Verificação rápida, sem interpretar o documento, da existência de uma assinatura:
+    procura, apenas nos últimos SIGNATURE_TAIL_WINDOW bytes, um /ByteRange com um
+    /Contents <...> no mesmo objeto. Um documento com mais do que isso acrescentado
+    depois da última assinatura é tratado como não assinado, o que também não seria
+    válido (ver services.signer_services.revision_changes). Um resultado verdadeiro
+    não garante que a assinatura seja válida (ver find_signatures).
+    """
+    tail = max(0, len(data) - SIGNATURE_TAIL_WINDOW)
+    marker = data.rfind(b"/ByteRange", tail)
+    if marker == -1:
+        return False
+    # Objeto do dicionário de assinatura: de "N 0 obj" até "endobj"
+    start = max(tail, data.rfind(b"obj", tail, marker))
+    end = data.find(b"endobj", marker)
+    if end == -1:
+        end = len(data)
+    return _CONTENTS.search(data[start:end]) is not None
+
+
+class SignatureField:
+    """
+    Assinatura encontrada em um PDF: o /ByteRange, o conteúdo CMS (/Contents) já
+    decodificado e as demais entradas do dicionário de assinatura (/Reason,
+    /Location, /M, /Contact, ...).
+    """
+
+    def __init__(self, byte_range: list[int], contents: bytes, dictionary: dict):
+        self.byte_range = byte_range
+        self.contents = contents
+        self.dictionary = dictionary
+
+    @property
+    def signed_until(self) -> int:
+        """
+        Posição do fim da revisão do documento coberta por esta assinatura.
+        """
+        return self.byte_range[2] + self.byte_range[3]
+
+    def signed_ranges(self, data):
+        """
+        Retorna as duas partes do documento cobertas pela assinatura, sem as copiar
+        quando data é um mmap ou memoryview.
+        """
+        view = memoryview(data)
+        start1, length1, start2, length2 = self.byte_range
+        return view[start1 : start1 + length1], view[start2 : start2 + length2]
+
+    def text(self, key: str) -> str:
+        return decode_text(self.dictionary.get(key, b""))
+
+
+def decode_text(value) -> str:
+    """
+    Converte uma string PDF em texto (UTF-16 com BOM ou PDFDocEncoding, aproximado
+    por latin-1).
+    """
+    if isinstance(value, str):
+        return value
+    if not isinstance(value, (bytes, bytearray)):
+        return str(value)
+    if value.startswith(b"\xfe\xff"):
+        return value[2:].decode("utf-16-be", errors="replace")
+    return bytes(value).decode("latin-1")
+
+
+def _skip_whitespace(data, pos: int) -> int:
+    length = len(data)
+    while pos < length:
+        char = data[pos]
+        if char in _WHITESPACE:
+            pos += 1
+        elif char == ord("%"):
+            # comentário até o fim da linha
+            while pos < length and data[pos] not in b"\r\n":
+                pos += 1
+        else:
+            break
+    return pos
+
+
+def _parse_literal_string(data, pos: int):
+    # pos aponta para o "(" inicial
+    pos += 1
+    depth = 1
+    out = bytearray()
+    while pos < len(data):
+        char = data[pos]
+        if char == ord("\\"):
+            pos += 1
+            escaped = data[pos]
+            if escaped in _ESCAPES:
+                out += _ESCAPES[escaped]
+                pos += 1
+            elif ord("0") <= escaped <= ord("7"):
+                digits = data[pos : pos + 3]
+                count = 0
+                while count < len(digits) and ord("0") <= digits[count] <= ord("7"):
+                    count += 1
+                out.append(int(digits[:count], 8) & 0xFF)
+                pos += count
+            elif escaped in b"\r\n":
+                # continuação de linha
+                pos += 2 if data[pos : pos + 2] == b"\r\n" else 1
+            else:
+                out.append(escaped)
+                pos += 1
+            continue
+        if char == ord("("):
+            depth += 1
+        elif char == ord(")"):
+            depth -= 1
+            if depth == 0:
+                return bytes(out), pos + 1
+        out.append(char)
+        pos += 1
+    raise PdfSyntaxError("String não terminada")
+
+
+def _parse_name(data, pos: int):
+    end = pos + 1
+    while end < len(data) and data[end] not in _WHITESPACE and data[end] not in _DELIMITERS:
+        end += 1
+    return "/" + bytes(data[pos + 1 : end]).decode("latin-1"), end
+
+
+def parse_object(data, pos: int):
+    """
+    Interpreta o objeto PDF que começa em pos e retorna (valor, posição seguinte).
+    Dicionários são retornados como dict, arrays como list, nomes como str
+    começados por "/", strings como bytes e referências indiretas como tuplas
+    (número, geração).
+    """
+    pos = _skip_whitespace(data, pos)
+    if pos >= len(data):
+        raise PdfSyntaxError("Fim inesperado do documento")
+    char = data[pos]
+
+    if data[pos : pos + 2] == b"<<":
+        result = {}
+        pos += 2
+        while True:
+            pos = _skip_whitespace(data, pos)
+            if data[pos : pos + 2] == b">>":
+                return result, pos + 2
+            key, pos = parse_object(data, pos)
+            if not isinstance(key, str):
+                raise PdfSyntaxError("Chave de dicionário inválida")
+            result[key], pos = parse_object(data, pos)
+    if char == ord("<"):
+        end = data.find(b">", pos)
+        if end == -1:
+            raise PdfSyntaxError("String hexadecimal não terminada")
+        digits = re.sub(rb"\s", b"", bytes(data[pos + 1 : end]))
+        if len(digits) % 2:
+            digits += b"0"
+        return bytes.fromhex(digits.decode("ascii")), end + 1
+    if char == ord("("):
+        return _parse_literal_string(data, pos)
+    if char == ord("/"):
+        return _parse_name(data, pos)
+    if char == ord("["):
+        items = []
+        pos += 1
+        while True:
+            pos = _skip_whitespace(data, pos)
+            if data[pos : pos + 1] == b"]":
+                return items, pos + 1
+            item, pos = parse_object(data, pos)
+            items.append(item)
+
+    match = _NUMBER.match(bytes(data[pos : pos + 32]))
+    if match:
+        token = match.group(0)
+        end = pos + len(token)
+        value = float(token) if b"." in token else int(token)
+        # Referência indireta "n g R"
+        if isinstance(value, int):
+            ref = re.match(rb"\s+(\d+)\s+R(?![^\s/<>\[\]()])", bytes(data[end : end + 24]))
+            if ref:
+                return (value, int(ref.group(1))), end + ref.end()
+        return value, end
+
+    end = pos
+    while end < len(data) and data[end] not in _WHITESPACE and data[end] not in _DELIMITERS:
+        end += 1
+    keyword = bytes(data[pos:end])
+    if keyword == b"true":
+        return True, end
+    if keyword == b"false":
+        return False, end
+    if keyword == b"null":
+        return None, end
+    raise PdfSyntaxError(f"Token desconhecido: {keyword[:20]!r}")
+
+
+def _parse_byte_range(data, pos: int) -> list[int]:
+    start = data.find(b"[", pos)
+    stop = data.find(b"]", start)
+    if start == -1 or stop == -1 or start - pos > 32:
+        raise PdfSyntaxError("/ByteRange inválido")
+    byte_range = [int(value) for value in bytes(data[start + 1 : stop]).split()]
+    if len(byte_range) != 4:
+        raise PdfSyntaxError("/ByteRange inválido")
+    return byte_range
+
+
+def _signature_dictionary(data, marker: int, byte_range: list[int]) -> dict:
+    """
+    Interpreta o dicionário de assinatura que contém o /ByteRange em marker.
+    O dicionário começa no "<<" do objeto indireto que o contém; o /Contents
+    (que pode ter dezenas de KB) é pulado utilizando as posições do /ByteRange.
+    """
+    obj = data.rfind(b"obj", 0, marker)
+    start = data.find(b"<<", obj) if obj != -1 else -1
+    if start == -1 or start > marker:
+        start = data.rfind(b"<<", 0, marker)
+    if start == -1:
+        return {}
+    # Substitui o /Contents por uma string vazia para não o interpretar de novo
+    contents_start = byte_range[0] + byte_range[1]
+    end = data.find(b"endobj", byte_range[2])
+    if end == -1:
+        end = min(len(data), byte_range[2] + 4096)
+    head = bytes(data[start:contents_start])
+    tail = bytes(data[byte_range[2] : end])
+    try:
+        dictionary, _ = parse_object(head + b"()" + tail, 0)
+    except (PdfSyntaxError, ValueError, IndexError):
+        return {}
+    return dictionary if isinstance(dictionary, dict) else {}
+
+
+def find_signatures(data) -> list[SignatureField]:
+    """
+    Percorre o documento uma única vez e retorna todas as assinaturas encontradas,
+    pela ordem em que aparecem (da revisão mais antiga para a mais recente).
+    data pode ser bytes ou um mmap. Lança PdfSyntaxError se um /ByteRange não
+    apontar para um /Contents válido, não começar no início do arquivo ou, a partir
+    da segunda assinatura, não cobrir as revisões anteriores (o /Contents tem de
+    estar depois do fim da revisão assinada anterior).
+    """
+    signatures = []
+    previous_end = 0
+    marker = data.find(b"/ByteRange")
+    while marker != -1:
+        byte_range = _parse_byte_range(data, marker)
+        start1, length1, start2, length2 = byte_range
+        contents_start = start1 + length1
+        if start1 != 0:
+            # Os bytes antes de start1 não estariam assinados
+            raise PdfSyntaxError("/ByteRange não começa no início do documento")
+        if (
+            length1 <= 0
+            or length2 < 0
+            or start2 <= contents_start
+            or start2 + length2 > len(data)
+            or data[contents_start] != ord("<")
+            or data[start2 - 1] != ord(">")
+        ):
+            raise PdfSyntaxError("/ByteRange não aponta para o /Contents da assinatura")
+        if contents_start < previous_end:
+            raise PdfSyntaxError("/ByteRange não cobre as revisões anteriores do documento")
+        contents = bytes.fromhex(bytes(data[contents_start + 1 : start2 - 1]).decode("ascii"))
+        dictionary = _signature_dictionary(data, marker, byte_range)
+        signatures.append(SignatureField(byte_range, contents, dictionary))
+        previous_end = start2 + length2
+        marker = data.find(b"/ByteRange", max(start2, marker + 1))
+    return signatures
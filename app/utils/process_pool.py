@@ -0,0 +1,195 @@
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from config import (
+    CPU_POOL_SIZE,
+    CPU_POOL_QUEUE_DEPTH,
+    CPU_TASK_TIMEOUT,
+    CPU_POOL_START_METHOD,
+    CPU_POOL_WARM_UP,
+)
+
+
+class CpuPoolBusyError(Exception):
+    """
+    Lançada quando o pool já tem o número máximo de tarefas em execução e em espera.
+    """
+
+
+# Duração (em milissegundos) do aquecimento do processo atual, medida em _warm_worker
+_warm_up_ms: float | None = None
+
+
+def _warm_worker(warm_up: bool = False):
+    """
+    Inicializador de cada processo do pool. Importa antecipadamente as bibliotecas
+    de criptografia e de PDF para que a primeira tarefa não pague o custo das importações.
+    Com warm_up, assina e valida também um documento em branco
+    (services.signer_services.warm_up), o que inicializa o resto do código de assinatura.
+    """
+    global _warm_up_ms
+
+    started = time.perf_counter()
+    import endesive.pdf  # noqa: F401
+    import PyPDF2  # noqa: F401
+    from cryptography.hazmat.primitives import serialization  # noqa: F401
+    from cryptography import x509  # noqa: F401
+    import services.signer_services  # noqa: F401
+
+    if warm_up:
+        try:
+            services.signer_services.warm_up()
+        except Exception as e:
+            # Um processo que não foi aquecido continua podendo assinar
+            print(f"Erro ao aquecer o processo do pool: {e}")
+    _warm_up_ms = (time.perf_counter() - started) * 1000
+
+
+def _noop():
+    return _warm_up_ms
+
+
+class CpuExecutor:
+    """
+    Executor de tarefas pesadas de CPU (assinatura e validação de PDFs) em um pool de
+    processos, para que o event loop do servidor não fique bloqueado.
+    O número de tarefas em execução e em espera é limitado por max_workers + queue_depth
+    e cada tarefa tem um tempo limite de espera.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = CPU_POOL_SIZE,
+        queue_depth: int = CPU_POOL_QUEUE_DEPTH,
+        timeout: float = CPU_TASK_TIMEOUT,
+        start_method: str = CPU_POOL_START_METHOD,
+        warm_up: bool = CPU_POOL_WARM_UP,
+    ):
+        self.max_workers = max(1, max_workers)
+        self.queue_depth = max(0, queue_depth)
+        self.timeout = timeout
+        self.start_method = start_method
+        self.warm_up = warm_up
+        self._executor: ProcessPoolExecutor | None = None
+        # Tarefas em curso e o pool em que foram submetidas
+        self._futures: dict[Future, ProcessPoolExecutor] = {}
+        self._draining = False
+        self.warm_up_ms: list[float] = []
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.queue_depth
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._futures)
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=multiprocessing.get_context(self.start_method),
+            initializer=_warm_worker,
+            initargs=(self.warm_up,),
+        )
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = self._create_executor()
+        return self._executor
+
+    async def start(self):
+        """
+        Cria o pool e aguarda que todos os processos estejam prontos (com as
+        bibliotecas já importadas e, com warm_up, já aquecidos).
+        """
+        self._draining = False
+        executor = self._get_executor()
+        loop = asyncio.get_running_loop()
+        warm_up_ms = await asyncio.gather(
+            *[loop.run_in_executor(executor, _noop) for _ in range(self.max_workers)]
+        )
+        self.warm_up_ms = [round(ms, 1) for ms in warm_up_ms if ms is not None]
+
+    async def drain(self, timeout: float) -> int:
+        """
+        Deixa de aceitar novas tarefas e espera, no máximo timeout segundos, que as
+        tarefas em curso terminem. Retorna o número de tarefas que não terminaram.
+        """
+        self._draining = True
+        deadline = time.monotonic() + timeout
+        while self.in_flight and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        return self.in_flight
+
+    def shutdown(self, wait: bool = True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=not wait)
+            self._executor = None
+
+    def _release(self, future):
+        self._futures.pop(future, None)
+
+    def _submit(self, fn, *args) -> Future:
+        try:
+            executor = self._get_executor()
+            future = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            # Um processo morreu (ex: falta de memória): o pool antigo é fechado sem
+            # esperar, as suas tarefas deixam de contar como em curso (as que ficaram
+            # sem resposta nunca chegariam a liberar o lugar) e é criado um pool novo
+            self._discard(executor)
+            executor = self._get_executor()
+            future = executor.submit(fn, *args)
+        self._futures[future] = executor
+        return future
+
+    def _discard(self, broken: ProcessPoolExecutor):
+        broken.shutdown(wait=False, cancel_futures=True)
+        if self._executor is broken:
+            self._executor = None
+        self._futures = {future: executor for future, executor in self._futures.items() if executor is not broken}
+
+    async def run(self, fn, *args, timeout: float | None = None, on_abandoned=None):
+        """
+        Executa fn(*args) em um processo do pool e retorna o resultado.
+        Lança CpuPoolBusyError se o pool estiver cheio e TimeoutError se
+        o resultado não chegar dentro do tempo limite.
+        Se o pedido desistir da tarefa (tempo limite ou cancelamento), on_abandoned()
+        é chamada quando o processo terminar a tarefa (ex: para apagar o arquivo que
+        a tarefa estava escrevendo).
+        """
+        if self._draining:
+            raise CpuPoolBusyError("O servidor está sendo encerrado, tente novamente mais tarde")
+        if self.in_flight >= self.capacity:
+            raise CpuPoolBusyError("O servidor está ocupado, tente novamente mais tarde")
+
+        loop = asyncio.get_running_loop()
+        future = self._submit(fn, *args)
+        # O lugar no pool só é liberado quando o processo termina a tarefa, mesmo que
+        # o pedido já tenha desistido por tempo limite.
+        future.add_done_callback(
+            lambda f: loop.is_closed() or loop.call_soon_threadsafe(self._release, f)
+        )
+        try:
+            return await asyncio.wait_for(
+                asyncio.wrap_future(future), timeout or self.timeout
+            )
+        except (TimeoutError, asyncio.CancelledError):
+            if on_abandoned is not None:
+                future.add_done_callback(lambda f: on_abandoned())
+            raise
+
+    def stats(self) -> dict:
+        return {
+            "max_workers": self.max_workers,
+            "queue_depth": self.queue_depth,
+            "in_flight": self.in_flight,
+            "timeout": self.timeout,
+            "warm_up_ms": self.warm_up_ms,
+        }
+
+
+cpu_executor = CpuExecutor()
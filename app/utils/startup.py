@@ -0,0 +1,59 @@
+import time
+
+
+class StartupMetrics:
+    """
+    Tempos da inicialização de cada processo do servidor, em milissegundos, contados a partir
+    do momento em que este módulo é importado (o início da importação de main): a
+    duração de cada fase do lifespan, o instante em que a aplicação ficou pronta e a
+    primeira assinatura (duração e instante em que terminou), isto é, a latência desde
+    a inicialização a frio até a primeira assinatura.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: dict[str, float] = {}
+        self.ready_ms: float | None = None
+        self.first_sign: dict | None = None
+
+    def _since_start(self) -> float:
+        return round((time.perf_counter() - self.started) * 1000, 1)
+
+    def imported(self):
+        """
+        Registra o fim da importação da aplicação (chamado no início do lifespan).
+        """
+        self.phases["imports"] = self._since_start()
+
+    async def measure(self, name: str, awaitable):
+        """
+        Aguarda uma fase da inicialização e registra a sua duração.
+        """
+        started = time.perf_counter()
+        result = await awaitable
+        self.phases[name] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
+    def ready(self):
+        self.ready_ms = self._since_start()
+
+    def signed(self, started: float):
+        """
+        Registra a primeira assinatura do processo, iniciada em started (perf_counter).
+        As seguintes são ignoradas.
+        """
+        if self.first_sign is None:
+            self.first_sign = {
+                "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+                "since_start_ms": self._since_start(),
+            }
+
+    def stats(self) -> dict:
+        return {
+            "phases_ms": self.phases,
+            "ready_ms": self.ready_ms,
+            "first_sign": self.first_sign,
+        }
+
+
+startup_metrics = StartupMetrics()
@@ -0,0 +1,339 @@
+import io
+import mmap
+import os
+import re
+import tempfile
+import unicodedata
+from contextlib import aclosing, contextmanager
+from urllib.parse import quote
+
+from fastapi import HTTPException, Request, UploadFile
+from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool
+from starlette.formparsers import MultiPartException, MultiPartParser
+
+from config import MAX_UPLOAD_SIZE, UPLOAD_CHUNK_SIZE, UPLOAD_TMP_DIR
+from utils.crypto_utils import HASH_ALGORITHMS, StreamingHasher
+
+
+class SpooledDocument:
+    """
+    Documento guardado em um arquivo temporário em disco. Os processos de assinatura e
+    validação recebem apenas o caminho e acessam o conteúdo através de um mmap,
+    em vez de receberem cópias do documento em memória.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        filename: str | None,
+        size: int,
+        hash: str | None = None,
+        hash_algorithm: str | None = None,
+        sha256: str | None = None,
+    ):
+        self.path = path
+        self.filename = filename
+        self.size = size
+        # Hash calculado durante o upload, se tiver sido pedido
+        self.hash = hash
+        self.hash_algorithm = hash_algorithm
+        # SHA-256 do conteúdo, que identifica o documento (ex: no cache de validação)
+        self.sha256 = sha256 if sha256 is not None else (hash if hash_algorithm == "sha256" else None)
+
+    @contextmanager
+    def view(self):
+        """
+        Abre o documento como um mmap só de leitura.
+        """
+        with open_view(self.path) as view:
+            yield view
+
+    def read(self) -> bytes:
+        with open(self.path, "rb") as f:
+            return f.read()
+
+    def cleanup(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+@contextmanager
+def open_view(path: str):
+    """
+    Abre um arquivo como um mmap só de leitura. Arquivos vazios não podem ser
+    mapeados, por isso é retornado um objeto bytes vazio nesse caso.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""
+            return
+        view = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield view
+        finally:
+            view.close()
+
+
+def new_temp_path(suffix: str = ".pdf") -> str:
+    """
+    Cria um arquivo temporário vazio e retorna o seu caminho.
+    """
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=UPLOAD_TMP_DIR)
+    os.close(fd)
+    return path
+
+
+class UploadSpool(tempfile.SpooledTemporaryFile):
+    """
+    SpooledTemporaryFile de um upload que, quando passa para disco, usa um arquivo
+    com nome em UPLOAD_TMP_DIR em vez de um arquivo sem nome. spool_upload adota esse
+    arquivo (adopt) em vez de o copiar; se não for adotado, é apagado ao fechar.
+    """
+
+    def __init__(self, max_size: int):
+        super().__init__(max_size=max_size)
+        self.path: str | None = None
+        self._adopted = False
+
+    def rollover(self):
+        if self._rolled:
+            return
+        fd, self.path = tempfile.mkstemp(suffix=".pdf", dir=UPLOAD_TMP_DIR)
+        memory, self._file = self._file, open(fd, "w+b")
+        position = memory.tell()
+        self._file.write(memory.getbuffer())
+        self._file.seek(position)
+        self._rolled = True
+
+    def adopt(self) -> str | None:
+        """
+        Caminho do arquivo em disco, que passa a ser de quem o adota (não é apagado ao
+        fechar), ou None se o conteúdo ainda está em memória.
+        """
+        if not self._rolled:
+            return None
+        self._file.flush()
+        self._adopted = True
+        return self.path
+
+    def close(self):
+        super().close()
+        if self.path is not None and not self._adopted:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+
+class HashingUploadFile(UploadFile):
+    """
+    UploadFile que calcula os hashes do conteúdo (ver StreamingHasher) à medida que o
+    Starlette escreve os blocos recebidos, para que estejam prontos quando o corpo do
+    pedido termina. Um upload maior do que max_size é recusado com 413 logo que o
+    ultrapassa, sem esperar pelo resto do corpo.
+    """
+
+    def __init__(self, *args, algorithms=("sha256",), max_size: int = MAX_UPLOAD_SIZE, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.hashers = {algorithm: StreamingHasher(algorithm) for algorithm in algorithms}
+        self.max_size = max_size
+
+    async def write(self, data: bytes) -> None:
+        if (self.size or 0) + len(data) > self.max_size:
+            raise HTTPException(status_code=413, detail="O documento excede o tamanho máximo permitido")
+        for hasher in self.hashers.values():
+            hasher.update(data)
+        await super().write(data)
+
+
+class UploadParser(MultiPartParser):
+    """
+    MultiPartParser que guarda os arquivos em HashingUploadFile sobre UploadSpool.
+    Além do SHA-256, é calculado o hash de hash_algorithm se esse campo do
+    formulário vier antes do arquivo. Cada arquivo está limitado a max_size bytes.
+    """
+
+    max_size = MAX_UPLOAD_SIZE
+
+    def on_headers_finished(self) -> None:
+        super().on_headers_finished()
+        part = self._current_part
+        if part.file is None:
+            return
+        self._files_to_close_on_error.pop().close()
+        spool = UploadSpool(max_size=self.spool_max_size)
+        self._files_to_close_on_error.append(spool)
+        algorithms = {"sha256"}
+        algorithms.update(
+            value for name, value in self.items if name == "hash_algorithm" and value in HASH_ALGORITHMS
+        )
+        part.file = HashingUploadFile(
+            file=spool,
+            size=0,
+            filename=part.file.filename,
+            headers=part.file.headers,
+            algorithms=sorted(algorithms),
+            max_size=self.max_size,
+        )
+
+
+class UploadRequest(Request):
+    """
+    Request cujos formulários multipart são interpretados por UploadParser.
+    """
+
+    async def _get_form(self, *, max_files=1000, max_fields=1000, max_part_size=1024 * 1024):
+        if self._form is None and self.headers.get("Content-Type", "").lower().startswith("multipart/form-data"):
+            try:
+                async with aclosing(self.stream()) as stream:
+                    parser = UploadParser(
+                        self.headers,
+                        stream,
+                        max_files=max_files,
+                        max_fields=max_fields,
+                        max_part_size=max_part_size,
+                    )
+                    self._form = await parser.parse()
+            except MultiPartException as exc:
+                raise HTTPException(status_code=400, detail=exc.message)
+        return await super()._get_form(
+            max_files=max_files, max_fields=max_fields, max_part_size=max_part_size
+        )
+
+
+class UploadRoute(APIRoute):
+    """
+    Rota da aplicação (FastAPI.router.route_class) que recebe os uploads com
+    UploadRequest: os arquivos são guardados e os seus hashes calculados enquanto o
+    corpo é recebido.
+    """
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def upload_route_handler(request: Request):
+            return await handler(UploadRequest(request.scope, request.receive))
+
+        return upload_route_handler
+
+
+def _upload_buffer(source):
+    """
+    Buffer só de leitura com o conteúdo do arquivo de um UploadFile (um
+    SpooledTemporaryFile), sem o copiar: o buffer do BytesIO, enquanto o upload está
+    em memória, ou um mmap do arquivo temporário do Starlette, quando já passou para
+    disco.
+    """
+    file = getattr(source, "_file", source)
+    if isinstance(file, io.BytesIO):
+        return file.getbuffer()
+    file.flush()
+    if os.fstat(file.fileno()).st_size == 0:
+        return memoryview(b"")
+    return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _spool_file(source, max_size: int, hashers: list[StreamingHasher]) -> tuple[str, int]:
+    """
+    Guarda em um arquivo com nome o arquivo já recebido de um upload (executado em
+    uma thread) e calcula os hashes em hashers, os que não foram calculados durante a
+    recepção. O arquivo de um UploadSpool em disco é adotado sem ser copiado; os
+    demais são copiados em uma só passagem. Retorna o caminho e o tamanho.
+    """
+    path = source.adopt() if isinstance(source, UploadSpool) else None
+    if path is None:
+        path = new_temp_path()
+        try:
+            with _upload_buffer(source) as content:
+                if len(content) > max_size:
+                    raise HTTPException(status_code=413, detail="O documento excede o tamanho máximo permitido")
+                for hasher in hashers:
+                    hasher.update(content)
+                with open(path, "wb") as f:
+                    f.write(content)
+                return path, len(content)
+        except BaseException:
+            os.unlink(path)
+            raise
+    try:
+        size = os.path.getsize(path)
+        if size > max_size:
+            raise HTTPException(status_code=413, detail="O documento excede o tamanho máximo permitido")
+        if hashers:
+            with open_view(path) as content:
+                for hasher in hashers:
+                    hasher.update(content)
+    except BaseException:
+        os.unlink(path)
+        raise
+    return path, size
+
+
+async def spool_upload(
+    upload: UploadFile,
+    max_size: int = MAX_UPLOAD_SIZE,
+    hash_algorithm: str | None = "sha256",
+) -> SpooledDocument:
+    """
+    Guarda um upload em um arquivo temporário com nome, que os processos de assinatura e
+    validação podem abrir. Com UploadRoute, o upload já está em um UploadSpool, que é
+    adotado sem cópia quando passou para disco, e os hashes já foram calculados
+    durante a recepção (HashingUploadFile). Os demais uploads (em memória ou em um
+    arquivo temporário sem nome, que não pode ser aberto em outro processo) são
+    lidos diretamente, sem passar pelo event loop bloco a bloco, e escritos uma única
+    vez. Se o upload ultrapassar max_size é lançado um erro 413 e nada é guardado.
+    O hash do documento (hash_algorithm) fica disponível em SpooledDocument.hash e o
+    SHA-256 do documento é sempre calculado (SpooledDocument.sha256). Os hashes que
+    não foram calculados na recepção são calculados na mesma passagem da cópia.
+    """
+    if upload.size is not None and upload.size > max_size:
+        raise HTTPException(status_code=413, detail="O documento excede o tamanho máximo permitido")
+
+    received = getattr(upload, "hashers", {})
+    hashers = {
+        algorithm: received.get(algorithm) or StreamingHasher(algorithm)
+        for algorithm in {"sha256", hash_algorithm}
+        if algorithm
+    }
+    pending = [hasher for algorithm, hasher in hashers.items() if algorithm not in received]
+    path, size = await run_in_threadpool(_spool_file, upload.file, max_size, pending)
+    return SpooledDocument(
+        path,
+        upload.filename,
+        size,
+        hashers[hash_algorithm].hexdigest() if hash_algorithm else None,
+        hash_algorithm,
+        hashers["sha256"].hexdigest(),
+    )
+
+
+def iter_file(path: str, chunk_size: int = UPLOAD_CHUNK_SIZE):
+    """
+    Lê um arquivo em blocos, para ser enviado em uma StreamingResponse.
+    """
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+def attachment_headers(filename: str | None, default: str = "documento.pdf") -> dict:
+    """
+    Cabeçalhos Content-Disposition e X-Document-Filename de um arquivo enviado para
+    download. Os valores dos cabeçalhos HTTP são latin-1, por isso o nome vai em
+    filename* codificado em UTF-8 com percent-encoding (RFC 5987/6266) e em filename
+    uma versão só com ASCII, para clientes que não suportam filename*.
+    X-Document-Filename também segue com percent-encoding (decodeURIComponent).
+    """
+    name = filename or default
+    # Sem acentos; os demais caracteres fora do ASCII imprimível, aspas e barras
+    # invertidas são substituídos por "_"
+    fallback = "".join(c for c in unicodedata.normalize("NFKD", name) if not unicodedata.combining(c))
+    fallback = re.sub(r'[^\x20-\x7e]|["\\]', "_", fallback)
+    quoted = quote(name, safe="")
+    return {
+        "Content-Disposition": f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quoted}",
+        "X-Document-Filename": quoted,
+    }
@@ -0,0 +1,59 @@
+import zipfile
+from datetime import datetime
+
+
+class _Sink:
+    """
+    Destino não posicionável (sem seek) do ZipFile: acumula os bytes escritos até
+    serem recolhidos por ZipStream.
+    """
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data, self._chunks = b"".join(self._chunks), []
+        return data
+
+
+class ZipStream:
+    """
+    Arquivo ZIP gerado em blocos, para ser enviado em uma StreamingResponse à medida que
+    as entradas são acrescentadas, sem que o arquivo inteiro esteja em memória.
+    Como o destino não permite seek, o zipfile escreve o tamanho e o CRC de cada
+    entrada em um descritor depois dos dados.
+    """
+
+    def __init__(self, compression: int = zipfile.ZIP_DEFLATED):
+        self._sink = _Sink()
+        self._zip = zipfile.ZipFile(self._sink, "w", compression=compression)
+
+    def add(self, name: str, data: bytes) -> bytes:
+        """
+        Acrescenta uma entrada e retorna os bytes do arquivo produzidos desde a última chamada.
+        """
+        info = zipfile.ZipInfo(name, datetime.now().timetuple()[:6])
+        info.compress_type = self._zip.compression
+        # Só o dono pode ler as chaves privadas depois de extraídas
+        info.external_attr = 0o600 << 16
+        self._zip.writestr(info, data)
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        """
+        Escreve o diretório central e retorna os últimos bytes do arquivo.
+        """
+        self._zip.close()
+        return self._sink.drain()